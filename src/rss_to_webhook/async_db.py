@@ -0,0 +1,122 @@
+"""Lets coroutines use a synchronous storage backend without blocking.
+
+The regular checks spend most of their time waiting on RSS feeds in an event
+loop. Calling a database from a coroutine blocks that loop for a whole round
+trip, stopping every other feed from being read in the meantime.
+`ThreadPoolStorage` runs each call in a thread pool instead, so coroutines can
+await them and other feeds carry on.
+
+This is used rather than an async database client so that everything,
+including the tests, can keep sharing one synchronous `Storage` (mongomock
+has no async client, and neither does `sqlite3`).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import functools
+import threading
+from typing import TYPE_CHECKING, Any, ParamSpec, TypeVar
+
+import bson
+
+from rss_to_webhook.constants import READ_BATCH_SIZE
+
+if TYPE_CHECKING:  # pragma: no cover
+    from collections.abc import AsyncIterator, Callable, Iterator, Sequence
+    from concurrent.futures import Executor
+
+    from bson import ObjectId
+
+    from rss_to_webhook.db_types import Comic, FeedSummary
+    from rss_to_webhook.storage import Storage
+
+_P = ParamSpec("_P")
+_R = TypeVar("_R")
+
+
+class ThreadPoolStorage:
+    """A storage whose calls can be awaited, by running them in a thread pool.
+
+    Storages are thread-safe, so several calls can run at once, up to the
+    number of threads in the pool.
+
+    The size of every comic read is counted in the pool as well, so measuring
+    how much was loaded never holds up the event loop.
+
+    Attributes:
+        storage: The synchronous storage to run calls on.
+        executor: The thread pool to run them in.
+        summary_bytes: How many bytes of `FeedSummary`s have been read, as BSON.
+        detail_bytes: How many bytes of comics' details have been read, as BSON.
+    """
+
+    storage: Storage
+    executor: Executor
+    summary_bytes: int
+    detail_bytes: int
+
+    def __init__(self, storage: Storage, executor: Executor) -> None:
+        """Wraps `storage`, running its calls in `executor`."""
+        self.storage = storage
+        self.executor = executor
+        self.summary_bytes = 0
+        self.detail_bytes = 0
+        self._lock = threading.Lock()
+
+    async def run(
+        self, func: Callable[_P, _R], *args: _P.args, **kwargs: _P.kwargs
+    ) -> _R:
+        """Calls `func` in the thread pool, and waits for the result."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, functools.partial(func, *args, **kwargs)
+        )
+
+    async def load_summaries(
+        self, batch_size: int = READ_BATCH_SIZE
+    ) -> AsyncIterator[list[FeedSummary]]:
+        """See `Storage.load_summaries`.
+
+        Each batch is read while the one before it is being used.
+        """
+        batches = self.storage.load_summaries(batch_size)
+        following = asyncio.ensure_future(self.run(self._next_batch, batches))
+        try:
+            while batch := await following:
+                following = asyncio.ensure_future(self.run(self._next_batch, batches))
+                yield batch
+        finally:
+            # Let the batch being read finish, so the cursor isn't closed under it
+            await asyncio.wait([following])
+            await self.run(batches.close)
+
+    async def load_details(self, ids: Sequence[ObjectId]) -> list[Comic]:
+        """See `Storage.load_details`."""
+        return await self.run(self._load_details, ids)
+
+    async def record_error(self, comic: FeedSummary, error: str) -> None:
+        """See `Storage.record_error`."""
+        await self.run(self.storage.record_error, comic, error)
+
+    def _next_batch(
+        self, batches: Iterator[list[FeedSummary]]
+    ) -> list[FeedSummary] | None:
+        batch = next(batches, None)
+        if batch:
+            size = _size(batch)
+            with self._lock:
+                self.summary_bytes += size
+        return batch
+
+    def _load_details(self, ids: Sequence[ObjectId]) -> list[Comic]:
+        details = self.storage.load_details(ids)
+        size = _size(details)
+        with self._lock:
+            self.detail_bytes += size
+        return details
+
+
+def _size(documents: Sequence[Any]) -> int:
+    """Counts how many bytes `documents` take up as BSON."""
+    return sum(len(bson.encode(document)) for document in documents)
@@ -9,238 +9,669 @@ regular checks, posting new updates to the server and also to any relevant
 threads in the Sleepless Domain server, as well as storing every page it posts
 so the `daily` check can post it later. The other runs though `daily` and just
 posts every update that has been marked for it to post, then clears that list.
+
+The regular checks don't post anything directly. Each comic's new messages are
+written to the outbox alongside its new state, and the outbox is then drained
+by `drain_outbox`.
+This means a Discord error or a crash halfway through posting never causes feed
+work to be redone, and anything left unposted is picked up by the next drain.
+
+Everything is read and written through a `storage.Storage`, so the checks can
+run on MongoDB or on a local SQLite database.
+
+aiohttp, feedparser and mmh3 are only imported once the regular checks start,
+so the daily check and draining the outbox don't spend time importing them.
+
+Every check can be timed by passing it a `timing.Timings`, which each phase of
+the work for each comic is recorded in. Fetches, diffs and posts are also
+counted in the Prometheus metrics in `metrics`, and what each comic cost to
+check is added to its totals in the database (see `costs`).
+
+Everything is logged through `logs.logger`, with the comic being worked on in
+`logs.COMIC`. Each step of checking a feed is logged at `DEBUG`, so only what
+happened to each comic is logged by default.
 """
 
 from __future__ import annotations
 
 import asyncio
-import enum
+import itertools
 import json
+import operator
 import os
+import sys
 import time
-from dataclasses import astuple, dataclass
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext, suppress
+from dataclasses import astuple, dataclass, field
+from datetime import UTC, datetime
 from http import HTTPStatus
-from typing import TYPE_CHECKING, Any
+from typing import TYPE_CHECKING, Any, Self, TypeVar
 from urllib.parse import urlsplit, urlunsplit
 
-import aiohttp
-import feedparser
-import mmh3
 import requests
-import typer
 from dotenv import load_dotenv
-from pymongo import MongoClient
 from requests import Response
+from requests.adapters import HTTPAdapter
 
+from rss_to_webhook import constants, metrics, payloads, profiling
+from rss_to_webhook.async_db import ThreadPoolStorage
 from rss_to_webhook.constants import (
-    DEFAULT_AIOHTTP_TIMEOUT,
+    DB_THREADS,
     DEFAULT_COLOR,
     DEFAULT_GET_HEADERS,
     HASH_SEED,
+    LOAD_BATCH_SIZE,
     LOOKBACK_LIMIT,
-    MAX_CACHED_ENTRIES,
+    MAX_CHECKS,
+    MAX_CONTENT_LENGTH,
+    MAX_EMBED_CHARACTERS,
+    MAX_EMBEDS_PER_MESSAGE,
+    MAX_POST_ATTEMPTS,
+    READ_BATCH_SIZE,
+    WRITE_BATCH_SIZE,
+    CheckType,
 )
+from rss_to_webhook.costs import Ledger
+from rss_to_webhook.logs import COMIC, comic_context, logger, logging_to
+from rss_to_webhook.payloads import JSON_HEADERS, EncodedMessage
+from rss_to_webhook.storage import Storage, as_storage, from_environment
+from rss_to_webhook.timing import NO_TIMINGS, Timings
 from rss_to_webhook.utils import batched
 
 if TYPE_CHECKING:  # pragma no cover
-    from collections.abc import Sequence
+    from collections.abc import (
+        Callable,
+        Generator,
+        Hashable,
+        Iterable,
+        Iterator,
+        Sequence,
+    )
+    from concurrent.futures import Executor
+    from contextlib import AbstractContextManager
+    from pathlib import Path
 
+    import aiohttp
+    from bson import ObjectId
     from feedparser.util import Entry
     from pymongo.collection import Collection
 
-    from rss_to_webhook.db_types import CachingInfo, Comic, EntrySubset
+    from rss_to_webhook.db_types import (
+        CachingInfo,
+        Comic,
+        EntrySubset,
+        FeedSummary,
+        OutboxMessage,
+        PendingDaily,
+    )
     from rss_to_webhook.discord_types import Embed, Extras, Message
+    from rss_to_webhook.storage import StateWriter
 
 
-class CheckType(enum.StrEnum):
-    """Types for `check_feeds_and_update`."""
+_T = TypeVar("_T")
 
-    regular = "regular"
-    daily = "daily"
-    test = "test"
 
-
-# We can't use the `Annotate[CheckType, typer.Argument()]` form here because we
-# use `from future import __annotations__`, which delays annotation evaluation
-# and so breaks meaningful `Annotate` types.
-def main(
-    check_type: CheckType = typer.Argument(
-        CheckType.regular,
-        help=(
-            "Use `regular` for normal checks, `daily` for daily, and `test` to run"
-            " in testing mode."
-        ),
-    ),
+def main(  # noqa: PLR0913
+    check_type: CheckType = CheckType.regular,
+    *,
+    pack: bool = False,
+    timings_path: Path | None = None,
+    profile_path: Path | None = None,
+    loop_lag: float | None = None,
+    metrics_path: Path | None = None,
+    log_level: str = "INFO",
+    json_logs: bool = False,
 ) -> None:
-    """Checks feeds for updates and posts them to Discord."""
-    print("Running checks")
+    """Checks feeds for updates and posts them to Discord.
+
+    This is run by `rss-to-webhook post-updates` (see `main.post_updates`).
+    Every run is timed, so its record has how long each phase took. Given a
+    `timings_path`, a summary of how long each phase and comic took is also
+    written there as JSON (see `timing.RunTimings`). Given a `profile_path`,
+    the run is profiled and the stats are written there (see
+    `profiling.profile`). Given a `loop_lag`, the regular checks report every
+    time the event loop is held up for longer than that many seconds while
+    feeds are checked. Given a `metrics_path`, the run's metrics are written
+    there for Prometheus (see `metrics.write_textfile`).
+
+    Logs at `log_level` and above are written to stdout as text, or as JSON if
+    `json_logs` is set (see `logs`).
+    """
+    if profile_path:
+        with profiling.profile(profile_path):
+            main(
+                check_type,
+                pack=pack,
+                timings_path=timings_path,
+                loop_lag=loop_lag,
+                metrics_path=metrics_path,
+                log_level=log_level,
+                json_logs=json_logs,
+            )
+        return
+    timings = Timings(lag_threshold=loop_lag)
+    with logging_to(sys.stdout, log_level, json_format=json_logs) as output:
+        logger.info("Running checks")
+        _run(check_type, timings, pack=pack)
+        if timings_path:
+            timings_path.write_text(
+                json.dumps(timings.summary(), indent=2), encoding="utf-8"
+            )
+            logger.info("Wrote timings to %s", timings_path)
+        output.flush()
+        logger.info("Wrote %d bytes of logs", output.bytes)
+        if metrics_path:
+            metrics.write_textfile(metrics_path)
+            logger.info("Wrote metrics to %s", metrics_path)
+
+
+def _run(check_type: CheckType, timings: Timings, *, pack: bool) -> None:
+    """Runs the checks for `main`, with the database from the environment."""
     load_dotenv()
-    mongodb_uri = os.environ["MONGODB_URI"]
-    db_name = os.environ["DB_NAME"]
-    client: MongoClient[Comic] = MongoClient(mongodb_uri)
-    if check_type == CheckType.daily:
-        print("Running daily checks")
-        webhook_url = os.environ["DAILY_WEBHOOK_URL"]
-        comics = client[db_name]["comics"]
-        daily_checks(comics, webhook_url)
-    else:
-        if check_type == CheckType.test:
-            print("testing testing")
-            webhook_url = os.environ["TEST_WEBHOOK_URL"]
-            thread_webhook_url = os.environ["TEST_WEBHOOK_URL"]
-            comics = client[db_name]["test-comics"]
-        else:
-            print("Running regular checks")
+    name = "test-comics" if check_type == CheckType.test else "comics"
+    with from_environment(name) as comics:
+        if check_type == CheckType.daily:
+            logger.info("Running daily checks")
+            webhook_url = os.environ["DAILY_WEBHOOK_URL"]
+            daily_checks(comics, webhook_url, timings=timings)
+        elif check_type == CheckType.drain:
+            logger.info("Draining the outbox")
             webhook_url = os.environ["WEBHOOK_URL"]
             thread_webhook_url = os.environ["SD_WEBHOOK_URL"]
-            comics = client[db_name]["comics"]
-        regular_checks(comics, HASH_SEED, webhook_url, thread_webhook_url)
-    client.close()
+            drain_outbox(
+                comics, webhook_url, thread_webhook_url, pack=pack, timings=timings
+            )
+        else:
+            if check_type == CheckType.test:
+                logger.info("testing testing")
+                webhook_url = os.environ["TEST_WEBHOOK_URL"]
+                thread_webhook_url = os.environ["TEST_WEBHOOK_URL"]
+            else:
+                logger.info("Running regular checks")
+                webhook_url = os.environ["WEBHOOK_URL"]
+                thread_webhook_url = os.environ["SD_WEBHOOK_URL"]
+            regular_checks(
+                comics,
+                HASH_SEED,
+                webhook_url,
+                thread_webhook_url,
+                pack=pack,
+                timings=timings,
+            )
 
 
-def regular_checks(
-    comics: Collection[Comic],
+def regular_checks(  # noqa: PLR0913
+    comics: Collection[Comic] | Storage,
     hash_seed: int,
     webhook_url: str,
     thread_webhook_url: str,
-    timeout: aiohttp.ClientTimeout = DEFAULT_AIOHTTP_TIMEOUT,
+    timeout: aiohttp.ClientTimeout | None = None,
+    *,
+    pack: bool = False,
+    read_batch_size: int = READ_BATCH_SIZE,
+    write_batch_size: int = WRITE_BATCH_SIZE,
+    max_checks: int = MAX_CHECKS,
+    timings: Timings = NO_TIMINGS,
+    rate_limiter: RateLimiter | None = None,
 ) -> None:
-    """Checks for updates, posts them to Discord, then persists the new state.
+    """Checks for updates, persists the new state, then posts them to Discord.
 
     Collects comics from `comics`, posts the updates to `webhook_url` and, when
     the comic has a `thread_id`, to the relevant thread in the channel pointed
     to by `thread_webhook_url`. Once deployed this will the webcomic channel in
     the Sleepless Domain server, but for now it's a secret channel in the "RSS
-    but it's Discord" server. The new updates and some caching information are
-    then persisted back to the database.
+    but it's Discord" server.
+
+    Only the fields needed to check each feed are loaded at first, a batch at a
+    time, and the rest of a comic (including its cached entries, which are most
+    of its size) is only loaded once its feed is known to have changed (see
+    `_DetailLoader`). Unchanged comics are dropped once their feed is checked.
+    Reads and error logging happen in a thread pool while feeds are being
+    checked, so they don't hold up other feeds.
+
+    Each comic's messages are queued in the outbox, and its new entries are
+    queued for the daily check, no later than its new updates and caching
+    information are persisted, and the outbox is drained once every feed has
+    been handled. The new states are written in batches (see
+    `storage.StateWriter`). The batches, and the outbox's record of what has
+    been posted, are written by a background thread while the next comic is
+    queued or the next post is made.
+
+    Once everything has been posted, a record of how the run went is stored
+    (see `db_types.RunRecord`).
 
     Args:
-        comics: A MongoDB collection containing all of the comics we track.
+        comics: The storage containing all of the comics we track, or a MongoDB
+            collection of them.
         hash_seed: A seed to be used to hash an RSS feed's content with, so we
             can detect unchanged feeds quickly.
         webhook_url: The URL to post normal updates to.
         thread_webhook_url: The URL to post thread updates to.
-        timeout: A timeout to be used for all get requests.
+        timeout: A timeout to be used for all get requests. Defaults to
+            `constants.DEFAULT_AIOHTTP_TIMEOUT`.
+        pack: Whether to merge updates for several comics into each post.
+            See `drain_outbox`.
+        read_batch_size: How many comics to read from the database at once.
+        write_batch_size: How many comics' new states to write at once.
+        max_checks: How many feeds to check at once.
+        timings: Where to record how long each phase takes for each comic.
+        rate_limiter: What to post with, which is left open afterwards. Defaults
+            to a new `RateLimiter`, which is closed once everything is posted.
     """
     start = time.time()
-    comic_list: list[Comic] = list(comics.find().sort("title"))
-    comics_entries_headers = asyncio.get_event_loop().run_until_complete(
-        _get_changed_feeds(comic_list, hash_seed, comics, timeout=timeout)
-    )
-    print(
-        f"{len(comics_entries_headers)} changed comics and"
-        f" {len([1 for _, entries, _ in comics_entries_headers if len(entries) > 0])}"
-        " updated comics"
-    )
+    started_at = datetime.now(tz=UTC)
+    if timeout is None:
+        timeout = constants.DEFAULT_AIOHTTP_TIMEOUT
+    storage = as_storage(comics)
+    fetches = FetchStats()
+    with (
+        ThreadPoolExecutor(DB_THREADS, thread_name_prefix="db") as db_pool,
+        ThreadPoolExecutor(1, thread_name_prefix="db-writes") as db_writes,
+    ):
+        comics_entries_headers = asyncio.run(
+            _get_changed_feeds(
+                ThreadPoolStorage(storage, db_pool),
+                hash_seed,
+                read_batch_size,
+                max_checks=max_checks,
+                timings=timings,
+                fetches=fetches,
+                timeout=timeout,
+            )
+        )
+        updated = len([1 for _, entries, _ in comics_entries_headers if entries])
+        logger.info(
+            "%d changed comics and %d updated comics",
+            len(comics_entries_headers),
+            updated,
+        )
 
-    rate_limiter = RateLimiter()
-
-    for comic, entries, headers in comics_entries_headers:
-        if entries:
-            messages = _make_messages(comic, entries)
-            for message in messages:
-                print(f"{comic['title']}: new update {json.dumps(message)}")
-                response = rate_limiter.post(f"{webhook_url}?wait=true", message)
-                print(
-                    f"{comic['title']} new post:, {message['embeds'][0]['title']},"
-                    f" {message['embeds'][0]['url']}: {response.status_code}:"
-                    f" {response.reason}"
-                )
-                if thread_id := comic.get("thread_id"):
-                    if message.get("content"):
-                        del message["content"]
-                    response = rate_limiter.post(
-                        f"{thread_webhook_url}?wait=true&thread_id={thread_id}", message
-                    )
-        _update(comics, comic, entries, headers)
+        seq = itertools.count()
+        with (
+            timings.span("write"),
+            storage.writer(write_batch_size, db_writes) as writer,
+        ):
+            for comic, entries, headers in comics_entries_headers:
+                with comic_context(comic["title"]):
+                    _update(writer, comic, entries, headers, seq, timings=timings)
+        logger.info("Saved %d comics in %d batches", writer.writes, writer.batches)
+
+        with _limiter(rate_limiter, timings) as limiter:
+            posted = drain_outbox(
+                storage,
+                webhook_url,
+                thread_webhook_url,
+                limiter,
+                pack=pack,
+                executor=db_writes,
+                timings=timings,
+                costs=fetches.costs,
+            )
+            connections = limiter.connection_stats()
 
     time_taken = time.time() - start
-    print(
-        f"Regular checks done in {int(time_taken) // 60} minutes and"
-        f" {time_taken % 60:.2g} seconds"
+    storage.record_run({
+        "check_type": "regular",
+        "started_at": started_at,
+        "duration": time_taken,
+        "comics": fetches.feeds,
+        "changed": len(comics_entries_headers),
+        "updated": updated,
+        "statuses": dict(fetches.statuses),
+        "downloaded_bytes": fetches.downloaded_bytes,
+        "posts": posted,
+        "rate_limit_sleep": limiter.slept,
+        "errors": fetches.errors,
+        "phases": _phase_totals(timings),
+    })
+    storage.record_costs(list(fetches.costs.comics.values()))
+    logger.info(
+        "Regular checks done in %d minutes and %.2g seconds, making %d posts over"
+        " %d connections (%d reused)",
+        int(time_taken) // 60,
+        time_taken % 60,
+        posted,
+        connections.connections,
+        connections.reused,
     )
 
 
-async def _get_changed_feeds(
-    comic_list: list[Comic],
+@dataclass(slots=True)
+class FetchStats:
+    """Counts what happened while feeds were fetched.
+
+    Everything counted here is also counted in the process's `metrics`, and
+    against the comic it was for in `costs`.
+
+    Attributes:
+        feeds: How many feeds were requested.
+        statuses: How many responses had each HTTP status. Requests that got no
+            response are counted under `"error"`.
+        downloaded_bytes: How many bytes of feeds were read.
+        errors: How many feeds couldn't be checked.
+        costs: What each comic cost to check.
+    """
+
+    feeds: int = 0
+    statuses: Counter[str] = field(default_factory=Counter)
+    downloaded_bytes: int = 0
+    errors: int = 0
+    costs: Ledger = field(default_factory=Ledger)
+
+    def response(self, status: int) -> None:
+        """Counts a response to a feed request."""
+        self.statuses[str(status)] += 1
+        metrics.FEED_RESPONSES.inc(status=metrics.status_class(status))
+
+    def fetched(self, comic: FeedSummary, size: int, start: float) -> None:
+        """Counts a feed of `size` bytes, requested at `time.perf_counter` `start`."""
+        self.downloaded_bytes += size
+        self.costs.add(comic, bytes=size)
+        metrics.FEED_BYTES.inc(size)
+        metrics.FEED_FETCH_SECONDS.observe(time.perf_counter() - start)
+
+    def checked(self, comic: FeedSummary, result: str) -> None:
+        """Counts a check of a feed, by one of `metrics.FEED_RESULTS`."""
+        self.costs.add(comic, **{result: 1})
+        metrics.FEED_CHECKS.inc(result=result)
+
+    def failed(self, comic: FeedSummary, *, responded: bool) -> None:
+        """Counts a feed that couldn't be checked, which may have had a response."""
+        if not responded:
+            self.statuses["error"] += 1
+        self.errors += 1
+        self.checked(comic, "error")
+
+    @contextmanager
+    def parsing(self, comic: FeedSummary) -> Generator[None, None, None]:
+        """Counts the CPU time spent parsing a comic's feed in the block.
+
+        The time is counted even if parsing raises, since it was still spent.
+        """
+        start = time.thread_time()
+        try:
+            yield
+        finally:
+            self.costs.add(comic, parse_seconds=time.thread_time() - start)
+
+
+def _phase_totals(timings: Timings) -> dict[str, float]:
+    """Gets how many seconds were spent on each phase, over every comic."""
+    return {phase["phase"]: phase["total"] for phase in timings.summary(0)["phases"]}
+
+
+class _DetailLoader:
+    """Loads the rest of each comic whose feed has changed, while feeds are checked.
+
+    Changed comics are loaded with one query for every `batch_size` of them,
+    which starts as soon as the batch is full, so most of the loading happens
+    while slower feeds are still being read. Each comic's feed is diffed against
+    its cached entries as soon as it's loaded, and the cached entries are then
+    dropped, so only the new entries of each changed comic are kept until the
+    end of the run.
+
+    Attributes:
+        storage: The storage to load from.
+        batch_size: How many comics to load in each query.
+        timings: Where to record how long each query and feed check takes.
+        waiting: Summaries of changed comics that haven't been loaded yet, with
+            the entries in their feeds.
+        loads: The queries that have been started.
+    """
+
+    storage: ThreadPoolStorage
+    batch_size: int
+    timings: Timings
+    waiting: list[tuple[FeedSummary, list[EntrySubset]]]
+    loads: list[asyncio.Future[list[tuple[Comic, list[EntrySubset]]]]]
+
+    def __init__(
+        self,
+        storage: ThreadPoolStorage,
+        batch_size: int = LOAD_BATCH_SIZE,
+        timings: Timings = NO_TIMINGS,
+    ) -> None:
+        """Sets up a loader with nothing to load."""
+        self.storage = storage
+        self.batch_size = batch_size
+        self.timings = timings
+        self.waiting = []
+        self.loads = []
+
+    def add(self, summary: FeedSummary, entries: list[EntrySubset]) -> None:
+        """Adds a changed comic, starting a query if the batch is full."""
+        self.waiting.append((summary, entries))
+        if len(self.waiting) >= self.batch_size:
+            self._start()
+
+    def _start(self) -> None:
+        batch = self.waiting
+        self.waiting = []
+        self.loads.append(asyncio.ensure_future(self._load(batch)))
+
+    async def _load(
+        self, batch: list[tuple[FeedSummary, list[EntrySubset]]]
+    ) -> list[tuple[Comic, list[EntrySubset]]]:
+        with self.timings.span("load_details"):
+            details = await self.storage.load_details(
+                [summary["_id"] for summary, _ in batch]
+            )
+        details_by_id = {detail["_id"]: detail for detail in details}
+        loaded: list[tuple[Comic, list[EntrySubset]]] = []
+        for summary, entries in batch:
+            # Comics deleted while their feed was checked have no details
+            if summary["_id"] in details_by_id:
+                comic: Comic = {**summary, **details_by_id[summary["_id"]]}  # type: ignore [typeddict-item]
+                loaded.append((comic, self._diff(comic, entries)))
+        return loaded
+
+    def _diff(self, comic: Comic, entries: list[EntrySubset]) -> list[EntrySubset]:
+        with (
+            comic_context(comic["title"]),
+            self.timings.blocking("diff", comic["title"]),
+        ):
+            new_entries = _get_new_entries(comic["last_entries"], entries)
+            logger.info("%d new entries", len(new_entries))
+        metrics.DIFFS.inc(result="new_entries" if new_entries else "no_new_entries")
+        metrics.NEW_ENTRIES.inc(len(new_entries))
+        # Nothing after the diff needs them, and they're most of a comic's size
+        comic["last_entries"] = []
+        return new_entries
+
+    async def finish(self) -> dict[ObjectId, tuple[Comic, list[EntrySubset]]]:
+        """Loads any comics left over, and waits for every query to finish.
+
+        Returns:
+            Each comic that still exists and its new entries, indexed by ID.
+        """
+        if self.waiting:
+            self._start()
+        return {
+            comic["_id"]: (comic, new_entries)
+            for batch in await asyncio.gather(*self.loads)
+            for comic, new_entries in batch
+        }
+
+
+async def _get_changed_feeds(  # noqa: PLR0913
+    storage: ThreadPoolStorage,
     hash_seed: int,
-    comics: Collection[Comic],
+    read_batch_size: int = READ_BATCH_SIZE,
+    *,
+    max_checks: int = MAX_CHECKS,
+    timings: Timings = NO_TIMINGS,
+    fetches: FetchStats | None = None,
     **kwargs: Any,  # noqa: ANN401, RUF100
-) -> list[tuple[Comic, list[Entry], CachingInfo]]:
-    async with aiohttp.ClientSession() as session:
-        tasks = [
-            _get_feed_changes(session, comic, hash_seed, comics, **kwargs)
-            for comic in comic_list
-        ]
-        feeds = await asyncio.gather(*tasks)
-        print("All feeds checked")
-        return list(filter(None, feeds))
+) -> list[tuple[Comic, list[EntrySubset], CachingInfo]]:
+    """Checks every comic's feed, returning the changed comics and their new entries.
+
+    Comics are read as `FeedSummary`s in batches of `read_batch_size`, and each
+    batch's feeds start being checked while the next batch is read. At most
+    `max_checks` feeds are checked at once, and the next batch isn't read until
+    there's room for its checks, so how much is in memory at once doesn't grow
+    with the number of comics. Only the comics whose feeds have changed are
+    kept once their feed has been checked, and they're returned in title order,
+    along with the entries in their feeds that are new (see `_DetailLoader`).
+
+    Given `timings`, the session also times each feed's DNS lookup and
+    connection (see `timing.Timings.trace_config`), and if it has a
+    `lag_threshold`, the event loop is watched for stalls while feeds are
+    checked (see `timing.Timings.watch_loop`). What happened to each request
+    is counted in `fetches`.
+    """
+    import aiohttp  # noqa: PLC0415 # Only the regular checks need it
+
+    if fetches is None:
+        fetches = FetchStats()
+    loader = _DetailLoader(storage, timings=timings)
+    changed: list[tuple[int, ObjectId, CachingInfo]] = []
+    checking: set[asyncio.Task[None]] = set()
+    summaries = 0
+
+    async def check(position: int, summary: FeedSummary) -> None:
+        # Each check is its own task, with its own copy of the context
+        COMIC.set(summary["title"])
+        start = time.perf_counter()
+        caching_info = await _get_feed_changes(
+            session, summary, hash_seed, loader, fetches, **kwargs
+        )
+        fetches.costs.add(summary, seconds=time.perf_counter() - start)
+        if caching_info:
+            changed.append((position, summary["_id"], caching_info))
+
+    trace_configs = [timings.trace_config()] if timings.enabled else None
+    watchdog = asyncio.create_task(timings.watch_loop(), name="watch_loop")
+    async with aiohttp.ClientSession(trace_configs=trace_configs) as session:
+        batches = storage.load_summaries(read_batch_size)
+        while True:
+            with timings.span("load_summaries"):
+                batch = await anext(batches, None)
+            if batch is None:
+                break
+            for summary in batch:
+                while len(checking) >= max_checks:
+                    # Forget finished checks, so unchanged comics aren't kept
+                    done, checking = await asyncio.wait(
+                        checking, return_when=asyncio.FIRST_COMPLETED
+                    )
+                    for task in done:
+                        task.result()
+                checking.add(
+                    asyncio.create_task(
+                        check(summaries, summary), name=summary["title"]
+                    )
+                )
+                summaries += 1
+        await asyncio.gather(*checking)
+        logger.info("All feeds checked")
+    watchdog.cancel()
+    if timings.stalls:
+        logger.warning(
+            "The event loop stalled %d times, for up to %.3f seconds",
+            len(timings.stalls),
+            max(stall["seconds"] for stall in timings.stalls),
+        )
+    details = await loader.finish()
+    logger.info(
+        "Loaded %d bytes of comics: %d for %d summaries and %d for %d changed comics",
+        storage.summary_bytes + storage.detail_bytes,
+        storage.summary_bytes,
+        summaries,
+        storage.detail_bytes,
+        len(details),
+    )
+    changed.sort(key=operator.itemgetter(0))
+    return [
+        (*details[comic_id], caching_info)
+        for _, comic_id, caching_info in changed
+        if comic_id in details
+    ]
 
 
 async def _get_feed_changes(
     session: aiohttp.ClientSession,
-    comic: Comic,
+    comic: FeedSummary,
     hash_seed: int,
-    comics: Collection[Comic],
+    loader: _DetailLoader,
+    fetches: FetchStats,
     **kwargs: Any,  # noqa: ANN401, RUF100
-) -> tuple[Comic, list[Entry], CachingInfo] | None:
+) -> CachingInfo | None:
+    """Gets a comic's feed, returning its new caching information if it has changed.
+
+    Changed comics are added to `loader` with the entries in their feeds, and
+    errors are recorded in the database without blocking the event loop. Each
+    step is timed in `loader.timings`, and the response is counted in `fetches`.
+    """
+    import aiohttp  # noqa: PLC0415 # Only the regular checks need it
+    import feedparser  # noqa: PLC0415 # Only the regular checks need it
+    import mmh3  # noqa: PLC0415 # Only the regular checks need it
+
     url = comic["feed_url"]
+    title = comic["title"]
+    timings = loader.timings
     caching_headers = _get_headers(comic)
-    print(
-        f"{comic['title']}: Requesting"
-        f" {url}{f' with {json.dumps(caching_headers)}.' if caching_headers else ''}"
-    )
+    fetches.feeds += 1
+    logger.debug("Requesting %s with %s", url, caching_headers)
+    fetch_start = time.perf_counter()
     try:
-        r = await session.request(
-            "GET",
-            url=url,
-            ssl=False,
-            headers=DEFAULT_GET_HEADERS | caching_headers,
-            **kwargs,
-        )
-        print(f"{comic['title']}: Got response {r.status}: {r.reason}")
+        with timings.span("ttfb", title):
+            r = await session.request(
+                "GET",
+                url=url,
+                ssl=False,
+                headers=DEFAULT_GET_HEADERS | caching_headers,
+                trace_request_ctx={"title": title},
+                **kwargs,
+            )
+        logger.debug("Got response %d: %s", r.status, r.reason)
+        fetches.response(r.status)
 
         if r.status == HTTPStatus.NOT_MODIFIED:
-            print(f"{comic['title']}: Cached response. No changes")
+            fetches.fetched(comic, 0, fetch_start)
+            fetches.checked(comic, "not_modified")
+            logger.debug("Cached response. No changes")
             return None
 
         if r.status != HTTPStatus.OK:
-            print(f"{comic['title']}: HTTP {r.status}: {r.reason}")
             r.raise_for_status()
 
-        data = await r.text()
-        print(f"{comic['title']}: Received data")
-        feed_hash = mmh3.hash_bytes(data, hash_seed)
+        with timings.span("download", title):
+            data = await r.text()
+        # The body has already been read, so this just gets its raw bytes
+        fetches.fetched(comic, len(await r.read()), fetch_start)
+        logger.debug("Received data")
+        with timings.blocking("hash", title):
+            feed_hash = mmh3.hash_bytes(data, hash_seed)
         if feed_hash == comic["feed_hash"]:
-            print(f"{comic['title']}: Hash match. No changes")
+            fetches.checked(comic, "hash_match")
+            logger.debug("Hash match. No changes")
             return None
 
         caching_info: CachingInfo = {"feed_hash": feed_hash}
         if "ETag" in r.headers:
             caching_info["etag"] = r.headers["ETag"]
-            print(f"{comic['title']}: Got new etag")
+            logger.debug("Got new etag")
         if "Last-Modified" in r.headers:
             caching_info["last_modified"] = r.headers["Last-Modified"]
-            print(f"{comic['title']}: Got new last-modified")
-
-        feed = feedparser.parse(data)
-        print(f"{comic['title']}: Parsed feed")
-        new_entries = _get_new_entries(comic["last_entries"], feed["entries"])
-        print(f"{comic['title']}: {len(new_entries)} new entries")
-        return (comic, new_entries, caching_info)
+            logger.debug("Got new last-modified")
+
+        with timings.blocking("parse", title), fetches.parsing(comic):
+            feed = feedparser.parse(data)
+        logger.debug("Parsed feed")
+        # Only what's diffed and stored is kept, rather than every parsed field
+        loader.add(comic, strip_extra_data(feed["entries"][:LOOKBACK_LIMIT]))
+        fetches.checked(comic, "changed")
+        return caching_info
     except Exception as e:  # noqa: BLE001
-        print(f"{comic['title']}: Problem connecting. {type(e).__name__}: {e} ")
-        comics.update_one(
-            {"_id": comic["_id"]},
-            {
-                "$inc": {"error_count": 1},
-                "$push": {"errors": f"{type(e).__name__}: {e}"},
-            },
-        )
+        logger.warning("Problem connecting. %s: %s", type(e).__name__, e)
+        fetches.failed(comic, responded=isinstance(e, aiohttp.ClientResponseError))
+        await loader.storage.record_error(comic, f"{type(e).__name__}: {e}")
         return None
 
 
-def _get_headers(comic: Comic) -> dict[str, str]:
+def _get_headers(comic: FeedSummary) -> dict[str, str]:
     caching_headers: dict[str, str] = {}
     if "etag" in comic:
         caching_headers["If-None-Match"] = comic["etag"]
@@ -250,8 +681,8 @@ def _get_headers(comic: Comic) -> dict[str, str]:
 
 
 def _get_new_entries(
-    last_entries: Sequence[EntrySubset], current_entries: Sequence[Entry]
-) -> list[Entry]:
+    last_entries: Sequence[EntrySubset], current_entries: Sequence[EntrySubset]
+) -> list[EntrySubset]:
     """Gets new entries from an RSS feed.
 
     RSS provides several means of distinguishing between two feed entries.
@@ -280,7 +711,7 @@ def _get_new_entries(
     normalising the <link> is quite slow. It feels weird though, and if this ever
     becomes an issue I'll rework this for a faster approach.
     """
-    new_entries: list[Entry] = []
+    new_entries: list[EntrySubset] = []
     capped_entries = list(reversed(current_entries[:LOOKBACK_LIMIT]))
     max_entries = len(capped_entries)
     last_paths = {_normalise(entry.get("link", "")) for entry in last_entries}
@@ -304,14 +735,16 @@ def _get_new_entries(
             # This can't be reached in normal execution, but real-world RSS feeds
             # are malformed sometimes, so this is a sanity check. In the future,
             # this should probably be logged with log level warning.
-            print(f"entry missing link: {entry}")  # type: ignore [unreachable]
+            logger.warning("Entry missing link: %s", entry)  # type: ignore [unreachable]
             break
         else:
             new_entries.append(entry)
     if len(new_entries) == max_entries:
-        print(f"No last entry. Returning up to {LOOKBACK_LIMIT} most recent entries")
+        logger.info(
+            "No last entry. Returning up to %d most recent entries", LOOKBACK_LIMIT
+        )
     else:
-        print("Found last entry")
+        logger.debug("Found last entry")
     return new_entries
 
 
@@ -327,10 +760,10 @@ def _make_messages(comic: Comic, entries: Sequence[EntrySubset]) -> list[Message
     embeds: list[Embed] = []
     for entry in entries:
         if not (link := entry.get("link")):
-            print(f"{comic['title']}: missing link {link}")
+            logger.warning("Missing link %s", link)
             continue
         if urlsplit(link).scheme not in {"http", "https"}:
-            print(f"{comic['title']}: bad url {link}")
+            logger.warning("Bad url %s", link)
             parts = urlsplit(link)
             link = urlunsplit(parts._replace(scheme="https"))
         embeds.append({
@@ -341,7 +774,8 @@ def _make_messages(comic: Comic, entries: Sequence[EntrySubset]) -> list[Message
         })
     # No typechecker can understand this assignment, but it is valid
     messages: list[Message] = [
-        {"embeds": list(embed_chunk)} | extras for embed_chunk in batched(embeds, 10)  # type: ignore[misc]
+        {"embeds": list(embed_chunk)} | extras  # type: ignore[misc]
+        for embed_chunk in batched(embeds, MAX_EMBEDS_PER_MESSAGE)
     ]
     if "role_id" in comic:
         messages[0]["content"] = f"<@&{comic['role_id']}>"
@@ -353,6 +787,24 @@ def _process_title(title: str) -> str:
     return f"**{cropped_title}**"
 
 
+@dataclass(slots=True)
+class ConnectionStats:
+    """Counts how well a `RateLimiter`'s connection pool is being used.
+
+    Attributes:
+        requests: How many requests have been made.
+        connections: How many new connections were opened to make them.
+    """
+
+    requests: int = 0
+    connections: int = 0
+
+    @property
+    def reused(self) -> int:
+        """How many requests reused an existing connection."""
+        return self.requests - self.connections
+
+
 @dataclass(slots=True)
 class RateLimitState:
     """Stores state for rate limiting.
@@ -384,24 +836,68 @@ class RateLimiter:
         max_in_window: Maximum number of posts that can be made in each window.
             Sourced from the tweet again.
         buckets: State for each rate-limiting bucket, indexed by webhook URL.
+        session: The session posts are made with. It keeps connections to
+            Discord alive between posts, so each post after the first can skip
+            the TCP and TLS handshakes. Close it with `close`, or by using the
+            rate limiter as a context manager.
+        timings: Where to record how long is spent sleeping for rate limits.
+        slept: How many seconds have been spent sleeping for rate limits.
     """
 
     window_length: int = 60
     fuzz_factor: int = 1
-    fuzzed_window: int = window_length + fuzz_factor
+    fuzzed_window: float = window_length + fuzz_factor
     max_in_window: int = 30
     buckets: dict[str, RateLimitState]
-
-    def __init__(self) -> None:
-        """Sets up rate-limiting buckets by url."""
+    session: requests.Session
+    timings: Timings
+    slept: float
+
+    def __init__(
+        self, session: requests.Session | None = None, timings: Timings = NO_TIMINGS
+    ) -> None:
+        """Sets up rate-limiting buckets by url, and a pooled session."""
         self.buckets = {}
-
-    def post(self, url: str, body: Message) -> Response:
+        self.session = session if session is not None else requests.Session()
+        self.timings = timings
+        self.slept = 0
+
+    def __enter__(self) -> Self:
+        """Returns the rate limiter, which is closed when the block exits."""
+        return self
+
+    def __exit__(self, *_exc_info: object) -> None:
+        """Closes the session."""
+        self.close()
+
+    def close(self) -> None:
+        """Closes every connection in the session's pool."""
+        self.session.close()
+
+    def connection_stats(self) -> ConnectionStats:
+        """Counts the requests made and connections opened by the session."""
+        stats = ConnectionStats()
+        for adapter in self.session.adapters.values():
+            if not isinstance(adapter, HTTPAdapter):  # pragma: no cover
+                continue
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():  # noqa: SIM118 # Not a real dictionary
+                pool = pools[key]
+                stats.requests += pool.num_requests
+                stats.connections += pool.num_connections
+        return stats
+
+    def post(self, url: str, body: Message | EncodedMessage) -> Response:
         """Posts to a webhook while respecting rate limits.
 
         This method will both respect explicit "X-RateLimit" headers in the
-        response, and Discord's hidden rate limits.
+        response, and Discord's hidden rate limits. `body` is sent as-is if it
+        has already been encoded, and is encoded once here otherwise. A 429 Too
+        Many Requests still raises, but the next post to `url` first waits as
+        long as Discord asked (see `_retry_after`).
         """
+        if not isinstance(body, EncodedMessage):
+            body = EncodedMessage.encode(body)
         if url not in self.buckets:
             self.buckets[url] = RateLimitState(
                 delay=0, counter=1, window_start=time.time()
@@ -409,70 +905,426 @@ class RateLimiter:
         rate_limit_state = self.buckets[url]
         delay, counter, window_start = astuple(rate_limit_state)
         if delay != 0:
-            print(f"Sleeping {round(delay, 2)} seconds")
-            time.sleep(delay)
+            logger.info("Sleeping %.2f seconds", delay)
+            with self.timings.span("rate_limit"):
+                time.sleep(delay)
+            self.slept += delay
+            metrics.RATE_LIMIT_SLEEPS.inc()
+            metrics.RATE_LIMIT_SLEEP_SECONDS.inc(delay)
             rate_limit_state.delay = 0
-            if window_start is None:
-                rate_limit_state.window_start = time.time()
+        # A window that ran long needs no sleep, but still has to start again
+        if window_start is None:
+            window_start = rate_limit_state.window_start = time.time()
 
         # Setting `stream=True` fixed a heisenbug that would sometimes cause
         # "connection closed" errors in tests. It might be unnecessary, but on
         # the other hand removing it might look fine for months until the error
         # pops up again, so I'm leaving it for now.
-        response = requests.post(url, json=body, timeout=20, stream=True)
+        post_start = time.perf_counter()
+        response = self.session.post(
+            url, data=body.data, headers=JSON_HEADERS, timeout=20, stream=True
+        )
+        # Reading the whole body releases the connection back to the pool
+        _ = response.content
+        metrics.POST_SECONDS.observe(time.perf_counter() - post_start)
+        metrics.POSTS.inc(status=metrics.status_class(response.status_code))
         headers = response.headers
         remaining = headers.get("x-ratelimit-remaining")
         reset_after = headers.get("x-ratelimit-reset-after")
-        print(
-            f"{remaining} of"
-            f" {headers.get('x-ratelimit-limit')} requests left in the next"
-            f" {reset_after} seconds"
+        logger.debug(
+            "%s of %s requests left in the next %s seconds",
+            remaining,
+            headers.get("x-ratelimit-limit"),
+            reset_after,
         )
+        if response.status_code == HTTPStatus.TOO_MANY_REQUESTS:
+            metrics.RATE_LIMITED.inc()
+            # Set before raising, so the next post waits rather than being
+            # rate limited too
+            rate_limit_state.delay = _retry_after(response)
+            logger.info("Rate limited. Retrying in %.2f", rate_limit_state.delay)
         if response.status_code >= 400:  # noqa: PLR2004 # In the HTTP error range
-            print(
-                f"Error posting: {response.status_code} {response.reason}:"
-                f" {response.json()}"
+            logger.error(
+                "Error posting: %d %s: %s",
+                response.status_code,
+                response.reason,
+                response.text,
             )
             response.raise_for_status()
         if remaining == "0" and reset_after is not None:
-            print(f"Exhausted rate limit bucket. Retrying in {reset_after}")
+            logger.info("Exhausted rate limit bucket. Retrying in %s", reset_after)
             rate_limit_state.delay = float(reset_after)
         rate_limit_state.counter = (counter + 1) % self.max_in_window
-        print(counter)
+        logger.debug("Post %d in the window", counter)
         if counter == 0:
             window_time = time.time() - window_start
-            print(f"Made {self.max_in_window} posts in {round(window_time, 2)}")
-            rate_limit_state.delay = self.fuzzed_window - window_time
+            logger.info("Made %d posts in %.2f", self.max_in_window, window_time)
+            # Posting can take longer than the window, which has then passed
+            rate_limit_state.delay = max(self.fuzzed_window - window_time, 0)
             rate_limit_state.window_start = None
 
         return response
 
 
-def _update(
-    comics: Collection[Comic],
+def _retry_after(response: Response) -> float:
+    """Gets how many seconds Discord wants us to wait after a 429.
+
+    That's the `retry_after` in the body, which is more precise than the
+    headers, or else the `Retry-After` or `X-RateLimit-Reset-After` header.
+    Anything unreadable counts as no wait.
+    """
+    with suppress(ValueError, KeyError, TypeError):
+        return float(response.json()["retry_after"])
+    for header in ("retry-after", "x-ratelimit-reset-after"):
+        with suppress(ValueError, KeyError):
+            return float(response.headers[header])
+    return 0
+
+
+def _limiter(
+    rate_limiter: RateLimiter | None, timings: Timings
+) -> AbstractContextManager[RateLimiter]:
+    """Uses `rate_limiter` without closing it, or a new one that's closed."""
+    if rate_limiter is None:
+        return RateLimiter(timings=timings)
+    return nullcontext(rate_limiter)
+
+
+def _make_posts(
+    comic: Comic,
+    entries: Sequence[EntrySubset],
+    caching_info: CachingInfo,
+    seq: Iterator[int],
+) -> list[OutboxMessage]:
+    """Makes the outbox posts for a comic's new entries.
+
+    Each message gets one post to the main webhook and, if the comic has a
+    thread, one post to its thread, queued in the order they should be made.
+    Each message is only serialised once, and is stored ready to post.
+    `seq` is shared by every comic in a run, so posts are drained in the order
+    they were queued. Posts are keyed by the new feed hash, and posts that are
+    already queued are left alone, so if we die after queueing but before the
+    comic's state is saved, the next run's identical diff leaves the outbox
+    alone rather than queueing everything again.
+    """
+    thread_id = comic.get("thread_id")
+    queued_at = datetime.now(tz=UTC)
+    key = f"{comic['_id']}-{caching_info['feed_hash'].hex()}"
+    queued: list[OutboxMessage] = []
+    for index, message in enumerate(_make_messages(comic, entries)):
+        encoded = EncodedMessage.encode(message)
+        logger.debug("Queueing update %s", encoded)
+        posts: list[tuple[str, int | None, EncodedMessage]] = [("main", None, encoded)]
+        if thread_id:
+            posts.append(("thread", thread_id, encoded.without_content()))
+        for destination, post_thread_id, payload in posts:
+            post: OutboxMessage = {
+                "_id": f"{key}-{index}-{destination}",
+                "comic_id": comic["_id"],
+                "title": comic["title"],
+                "thread_id": post_thread_id,
+                "payload": payload.data,
+                "queued_at": queued_at,
+                "seq": next(seq),
+                "status": "pending",
+                "attempts": 0,
+            }
+            queued.append(post)
+    return queued
+
+
+def drain_outbox(  # noqa: PLR0913
+    comics: Collection[Comic] | Storage,
+    webhook_url: str,
+    thread_webhook_url: str,
+    rate_limiter: RateLimiter | None = None,
+    *,
+    pack: bool = False,
+    executor: Executor | None = None,
+    timings: Timings = NO_TIMINGS,
+    costs: Ledger | None = None,
+) -> int:
+    """Posts every pending message in the outbox, oldest first.
+
+    Each post is marked as posted as soon as Discord accepts it, and the marker
+    is only set on messages that are still pending, so a message can never be
+    posted twice by two drains. When a post fails, the error is recorded against
+    it and it's left pending for the next drain, along with every later post for
+    the same comics, so each comic's posts still go out in order. Posts for
+    other comics carry on. Discord rejecting a message itself, with a 4xx other
+    than 429 Too Many Requests, counts as an attempt, and after
+    `constants.MAX_POST_ATTEMPTS` of them a message is marked as failed and
+    skipped from then on. Rate limits, server errors and connection errors
+    aren't the message's fault, so they don't count.
+
+    When `pack` is set, consecutive posts to the same channel or thread are
+    merged into as few posts as Discord's size limits allow (see `_pack`).
+    Every comic in a merged post has its role mentioned, but the post can only
+    have one username and avatar, so they are dropped unless every comic in it
+    shares them. Packing happens here rather than when posts are queued so that
+    each queued post still belongs to exactly one comic.
+
+    Given an `executor`, each post is marked in the background while the next
+    one is made. Every mark is written before this returns or raises.
+
+    Args:
+        comics: The storage whose outbox to drain, or a MongoDB collection of
+            comics.
+        webhook_url: The URL to post normal updates to.
+        thread_webhook_url: The URL to post thread updates to.
+        rate_limiter: The rate limiter to post with. A new one is used if not given.
+        pack: Whether to merge posts together.
+        executor: Where to mark posts in the background. It should only have
+            one thread, so that marks are written in order.
+        timings: Where to record how long each post takes, under the titles of
+            the comics in it.
+        costs: Where to count each message that's posted against its comic.
+
+    Returns:
+        The number of posts made.
+    """
+    if rate_limiter is None:
+        with RateLimiter(timings=timings) as new_rate_limiter:
+            return drain_outbox(
+                comics,
+                webhook_url,
+                thread_webhook_url,
+                new_rate_limiter,
+                pack=pack,
+                executor=executor,
+                timings=timings,
+                costs=costs,
+            )
+    storage = as_storage(comics)
+    posted = 0
+    pending = storage.pending_posts()
+    if pack:
+        decoded = ((post, payloads.loads(post["payload"])) for post in pending)
+        groups = (
+            [post for post, _ in group]
+            for group in _pack(
+                decoded, operator.itemgetter(1), lambda item: item[0]["thread_id"]
+            )
+        )
+    else:
+        groups = ([post] for post in pending)
+    marks: list[Future[None]] = []
+    held_back: set[ObjectId] = set()
+    try:
+        for group in groups:
+            comic_ids = {post["comic_id"] for post in group}
+            if not held_back.isdisjoint(comic_ids):
+                held_back.update(comic_ids)
+                continue
+            first = group[0]
+            message: Message | EncodedMessage
+            if len(group) == 1:
+                message = EncodedMessage(first["payload"])
+            else:
+                message = _merge_messages(
+                    [payloads.loads(post["payload"]) for post in group]
+                )
+            if first["thread_id"]:
+                url = f"{thread_webhook_url}?wait=true&thread_id={first['thread_id']}"
+            else:
+                url = f"{webhook_url}?wait=true"
+            titles = ", ".join(dict.fromkeys(post["title"] for post in group))
+            try:
+                with comic_context(titles), timings.span("post", titles):
+                    response = rate_limiter.post(url, message)
+            except requests.RequestException as e:
+                logger.error("%s: Failed to post. %s", titles, e)
+                held_back.update(comic_ids)
+                marks.extend(_mark_failed(storage, group, e, executor))
+                continue
+            marks.append(_mark_posted(storage, group, executor, costs))
+            posted += 1
+            logger.info(
+                "%s: New post: %d: %s", titles, response.status_code, response.reason
+            )
+    finally:
+        for future in marks:
+            future.result()
+    return posted
+
+
+def _mark_posted(
+    storage: Storage,
+    group: list[OutboxMessage],
+    executor: Executor | None,
+    costs: Ledger | None,
+) -> Future[None]:
+    """Records that `group` was posted, counting each message against its comic."""
+    if costs is not None:
+        for post in group:
+            costs.posted(post)
+    return _submit(executor, storage.mark_posted, [post["_id"] for post in group])
+
+
+def _mark_failed(
+    storage: Storage,
+    group: list[OutboxMessage],
+    error: requests.RequestException,
+    executor: Executor | None,
+) -> list[Future[None]]:
+    """Records that posting `group` failed, counting an attempt if it was rejected."""
+    attempt = 1 if _is_rejection(error) else 0
+    marks: list[Future[None]] = []
+    for post in group:
+        attempts = post["attempts"] + attempt
+        status = "failed" if attempts >= MAX_POST_ATTEMPTS else "pending"
+        marks.append(
+            _submit(
+                executor,
+                storage.mark_failed,
+                post["_id"],
+                attempts,
+                status,
+                f"{type(error).__name__}: {error}",
+            )
+        )
+    return marks
+
+
+def _is_rejection(error: requests.RequestException) -> bool:
+    """Whether Discord rejected the message itself, so retrying it won't help."""
+    response = error.response
+    return (
+        response is not None
+        and HTTPStatus.BAD_REQUEST
+        <= response.status_code
+        < 500  # noqa: PLR2004 # The end of the client error range
+        and response.status_code != HTTPStatus.TOO_MANY_REQUESTS
+    )
+
+
+def _submit(
+    executor: Executor | None, func: Callable[..., None], *args: Any  # noqa: ANN401
+) -> Future[None]:
+    """Runs `func` in `executor`, or straight away if there isn't one."""
+    if executor is not None:
+        return executor.submit(func, *args)
+    func(*args)
+    future: Future[None] = Future()
+    future.set_result(None)
+    return future
+
+
+def _pack(
+    items: Iterable[_T],
+    message: Callable[[_T], Message],
+    key: Callable[[_T], Hashable] = lambda _: None,
+) -> Iterator[list[_T]]:
+    """Groups items so that each group's messages can be merged into one post.
+
+    Items are packed greedily in order, and only with other items that have
+    the same `key`. A group is closed as soon as the next item's message would
+    push the merged message over one of Discord's limits, so every group is
+    as full as it can be without reordering anything.
+
+    Groups with different keys can be yielded in a different order than their
+    items came in, except that the open group keyed `None` is always yielded
+    before any other group. Posts to the main channel are keyed `None`, so a
+    comic's main post always goes out before its thread post, even though the
+    thread's group may fill up first.
+
+    Args:
+        items: The things to group, such as queued posts.
+        message: Gets the message for an item.
+        key: Gets which post an item can go in, such as the thread it's for.
+
+    Yields:
+        Lists of items whose messages fit into one post together.
+    """
+    packs: dict[Hashable, list[_T]] = {}
+    for item in items:
+        pack_key = key(item)
+        pack = packs.get(pack_key)
+        if pack is not None and not _within_limits(
+            _merge_messages([*map(message, pack), message(item)])
+        ):
+            if pack_key is not None and None in packs:
+                yield packs.pop(None)
+            yield packs.pop(pack_key)
+            pack = None
+        if pack is None:
+            packs[pack_key] = [item]
+        else:
+            pack.append(item)
+    if None in packs:
+        yield packs.pop(None)
+    yield from packs.values()
+
+
+def _merge_messages(messages: Sequence[Message]) -> Message:
+    """Merges several messages into one, keeping their embeds in order.
+
+    The `content`s are joined with spaces, and the `username` and `avatar_url`
+    are only kept if every message agrees on them. A single message is returned
+    unchanged.
+    """
+    if len(messages) == 1:
+        return messages[0]
+    merged: Message = {
+        "embeds": [embed for message in messages for embed in message["embeds"]]
+    }
+    if content := " ".join(
+        dict.fromkeys(
+            message["content"] for message in messages if "content" in message
+        )
+    ):
+        merged["content"] = content
+    usernames = {message.get("username") for message in messages}
+    if len(usernames) == 1 and (username := usernames.pop()) is not None:
+        merged["username"] = username
+    avatar_urls = {message.get("avatar_url") for message in messages}
+    if len(avatar_urls) == 1 and (avatar_url := avatar_urls.pop()) is not None:
+        merged["avatar_url"] = avatar_url
+    return merged
+
+
+def _within_limits(message: Message) -> bool:
+    """Checks that a message is small enough for Discord to accept."""
+    embed_characters = sum(
+        len(embed["title"]) + len(embed["description"]) for embed in message["embeds"]
+    )
+    return (
+        len(message["embeds"]) <= MAX_EMBEDS_PER_MESSAGE
+        and embed_characters <= MAX_EMBED_CHARACTERS
+        and len(message.get("content", "")) <= MAX_CONTENT_LENGTH
+    )
+
+
+def _update(  # noqa: PLR0913
+    writer: StateWriter,
     comic: Comic,
-    entries: list[Entry],
+    entries: list[EntrySubset],
     caching_info: CachingInfo,
+    seq: Iterator[int],
+    *,
+    timings: Timings = NO_TIMINGS,
 ) -> None:
-    entry_subsets = strip_extra_data(entries)
-    comics.update_one(
-        {"_id": comic["_id"]},
+    """Saves a comic's new state, queueing its posts and daily entries with it."""
+    with timings.span("messages", comic["title"]):
+        posts = _make_posts(comic, entries, caching_info, seq) if entries else []
+    queued_at = datetime.now(tz=UTC)
+    key = f"{comic['_id']}-{caching_info['feed_hash'].hex()}"
+    dailies: list[PendingDaily] = [
         {
-            "$set": caching_info,
-            "$push": {
-                "last_entries": {
-                    "$each": entry_subsets,
-                    "$slice": -MAX_CACHED_ENTRIES,
-                },
-                "dailies": {"$each": entry_subsets},
-            },
-        },
-    )
+            "_id": f"{key}-{daily_seq}",
+            "comic_id": comic["_id"],
+            "entry": entry,
+            "queued_at": queued_at,
+            "seq": daily_seq,
+        }
+        for daily_seq, entry in enumerate(entries)
+    ]
+    with timings.span("save", comic["title"]):
+        writer.save(comic["_id"], caching_info, entries, posts, dailies)
     updates = len(entries)
     word = "entry" if updates == 1 else "entries"
-    print(
-        f"{comic['title']}: Set {', '.join(caching_info.keys())} and posted"
-        f" {updates} new {word}"
+    logger.info(
+        "Set %s and queued %d new %s", ", ".join(caching_info.keys()), updates, word
     )
 
 
@@ -496,39 +1348,141 @@ def strip_extra_data(entries: list[Entry]) -> list[EntrySubset]:
     ]
 
 
-def daily_checks(comics: Collection[Comic], webhook_url: str) -> None:
+def daily_checks(  # noqa: PLR0913
+    comics: Collection[Comic] | Storage,
+    webhook_url: str,
+    *,
+    read_batch_size: int = READ_BATCH_SIZE,
+    write_batch_size: int = WRITE_BATCH_SIZE,
+    timings: Timings = NO_TIMINGS,
+    rate_limiter: RateLimiter | None = None,
+) -> None:
     """Posts new comics to the daily webhook, once a day.
 
     This does the daily checks, which don't actually have to check any RSS feeds
     because that work has already been done by `main`. `daily` can just post the
-    new entries that have been pushed to `comic["dailies"]` for each comic, and
-    then reset each comic's `dailies` value back to an empty array.
+    new entries that have been queued for it, and then delete them.
+
+    The pending entries are read in one pass, in the order of their index and
+    `read_batch_size` at a time, and the comics they belong to are loaded
+    `constants.LOAD_BATCH_SIZE` at a time as they're needed. Each comic's
+    entries are dropped once they've been posted, so how much is in memory at
+    once doesn't grow with the number of comics. The messages for every comic
+    are packed together, in title order within each batch of comics, so a busy
+    day takes a few full posts rather than one or more per comic (see `_pack`).
+    A comic's entries are only deleted once every message with them in has been
+    posted, so if posting fails partway through, only the comics that weren't
+    fully posted are left for the next run. The deletions are written in
+    batches, and any that are waiting are still written if posting fails.
+
+    Comics in MongoDB that still have a legacy `dailies` array need it moved
+    into `pending_dailies` once with `rss-to-webhook migrate-dailies` (see
+    `storage.migrate_dailies`). Once everything has been posted, a record of
+    how the run went is stored (see `db_types.RunRecord`).
 
     Args:
-        comics: A MongoDB collection containing all of the comics we track.
+        comics: The storage containing all of the comics we track, or a MongoDB
+            collection of them.
         webhook_url: The URL to post daily updates to.
+        read_batch_size: How many pending entries to read from the database at
+            once.
+        write_batch_size: How many comics' entries to delete at once.
+        timings: Where to record how long each phase takes for each comic.
+        rate_limiter: What to post with, which is left open afterwards. Defaults
+            to a new `RateLimiter`, which is closed once everything is posted.
     """
     start = time.time()
-    comic_list: list[Comic] = list(comics.find({"dailies": {"$ne": []}}).sort("title"))
-    print(f"Daily: {len(comic_list)} updated comics")
-
-    rate_limiter = RateLimiter()
-    for comic in comic_list:
-        print(f"Daily {comic['title']}: Posting")
-        messages = _make_messages(comic, comic["dailies"])
-        for message in messages:
-            rate_limiter.post(f"{webhook_url}?wait=true", message)
-        updates = len(comic["dailies"])
-        word = "entry" if updates == 1 else "entries"
-        print(f"Daily {comic['title']}: Posted {len(comic['dailies'])} new {word}")
-        comics.update_one({"_id": comic["_id"]}, {"$set": {"dailies": []}})
+    started_at = datetime.now(tz=UTC)
+    storage = as_storage(comics)
+    # The dailies of each comic with messages left to post, and how many
+    dailies_by_comic: dict[ObjectId, list[PendingDaily]] = {}
+    unposted: dict[ObjectId, int] = {}
+    loaded = updated = posts = 0
+
+    def comic_messages() -> Iterator[tuple[Comic, Message]]:
+        nonlocal loaded, updated
+        pending = (
+            (comic_id, list(dailies))
+            for comic_id, dailies in itertools.groupby(
+                storage.pending_dailies(read_batch_size),
+                operator.itemgetter("comic_id"),
+            )
+        )
+        batches = batched(pending, LOAD_BATCH_SIZE)
+        while True:
+            with timings.span("load_dailies"):
+                batch = dict(next(batches, ()))
+                if not batch:
+                    return
+                comic_list = storage.load_daily_comics(list(batch))
+            loaded += len(comic_list)
+            for comic in comic_list:
+                dailies = batch[comic["_id"]]
+                with timings.span("messages", comic["title"]):
+                    messages = _make_messages(
+                        comic, [daily["entry"] for daily in dailies]
+                    )
+                if not messages:
+                    _clear_dailies(writer, comic, dailies)
+                    updated += 1
+                    continue
+                dailies_by_comic[comic["_id"]] = dailies
+                unposted[comic["_id"]] = len(messages)
+                yield from ((comic, message) for message in messages)
+
+    with (
+        storage.writer(write_batch_size) as writer,
+        _limiter(rate_limiter, timings) as limiter,
+    ):
+        for group in _pack(comic_messages(), operator.itemgetter(1)):
+            titles = ", ".join(dict.fromkeys(comic["title"] for comic, _ in group))
+            message = _merge_messages([message for _, message in group])
+            with comic_context(titles), timings.span("post", titles):
+                logger.info("Posting daily update")
+                limiter.post(f"{webhook_url}?wait=true", message)
+            posts += 1
+            for comic, _ in group:
+                unposted[comic["_id"]] -= 1
+                if unposted[comic["_id"]] == 0:
+                    del unposted[comic["_id"]]
+                    _clear_dailies(writer, comic, dailies_by_comic.pop(comic["_id"]))
+                    updated += 1
+        connections = limiter.connection_stats()
+    logger.info("Daily: %d updated comics", loaded)
 
     time_taken = time.time() - start
-    print(
-        f"Daily checks done in {int(time_taken) // 60} minutes and"
-        f" {time_taken % 60:.2g} seconds"
+    storage.record_run({
+        "check_type": "daily",
+        "started_at": started_at,
+        "duration": time_taken,
+        "comics": loaded,
+        "updated": updated,
+        "posts": posts,
+        "rate_limit_sleep": limiter.slept,
+        "errors": 0,
+        "phases": _phase_totals(timings),
+    })
+    logger.info(
+        "Daily checks done in %d minutes and %.2g seconds, making %d posts over"
+        " %d connections (%d reused)",
+        int(time_taken) // 60,
+        time_taken % 60,
+        posts,
+        connections.connections,
+        connections.reused,
     )
 
 
+def _clear_dailies(
+    writer: StateWriter, comic: Comic, dailies: list[PendingDaily]
+) -> None:
+    updates = len(dailies)
+    word = "entry" if updates == 1 else "entries"
+    logger.info("Daily %s: Posted %d new %s", comic["title"], updates, word)
+    writer.clear_dailies([daily["_id"] for daily in dailies])
+
+
 if __name__ == "__main__":  # pragma no cover
+    import typer
+
     typer.run(main)
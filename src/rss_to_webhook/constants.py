@@ -1,6 +1,10 @@
 """Constants used by modules in this package."""
 
-import aiohttp
+import enum
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:  # pragma: no cover
+    import aiohttp
 
 #: Default FireFox user agent, to pretend to be human and pass bot checks.
 NORMAL_HUMAN_USER_AGENT = (
@@ -34,7 +38,45 @@ DEFAULT_GET_HEADERS = {
 }
 
 
-DEFAULT_AIOHTTP_TIMEOUT = aiohttp.ClientTimeout(sock_connect=15, sock_read=10)
+#: The timeout used for reading RSS feeds. This is made when it's first used
+#: (see `__getattr__`), so that only the regular checks have to import aiohttp
+DEFAULT_AIOHTTP_TIMEOUT: "aiohttp.ClientTimeout"
+
+
+def __getattr__(name: str) -> object:
+    """Makes `DEFAULT_AIOHTTP_TIMEOUT` the first time it's used."""
+    if name == "DEFAULT_AIOHTTP_TIMEOUT":
+        import aiohttp  # noqa: PLC0415 # Slow to import
+
+        timeout = aiohttp.ClientTimeout(sock_connect=15, sock_read=10)
+        globals()[name] = timeout
+        return timeout
+    msg = f"module {__name__!r} has no attribute {name!r}"
+    raise AttributeError(msg)
+
+
+class CheckType(enum.StrEnum):
+    """Types for `check_feeds_and_update`."""
+
+    regular = "regular"
+    daily = "daily"
+    test = "test"
+    drain = "drain"
+
+
+class Cost(enum.StrEnum):
+    """What comics can be ranked by in `rss-to-webhook top`.
+
+    Each is a field of `db_types.ComicCosts`.
+    """
+
+    bytes = "bytes"
+    seconds = "seconds"
+    parse_seconds = "parse_seconds"
+    changed = "changed"
+    error = "error"
+    posts = "posts"
+
 
 #: How far to look back in the RSS feed
 LOOKBACK_LIMIT = 100
@@ -42,6 +84,59 @@ LOOKBACK_LIMIT = 100
 #: Entries older than this will be removed from the database
 MAX_CACHED_ENTRIES = 400
 
+#: Outbox posts that fail this many times are given up on and marked as failed
+MAX_POST_ATTEMPTS = 5
+
+#: Seconds to keep posted outbox messages for before they expire (one week)
+OUTBOX_RETENTION = 7 * 24 * 60 * 60
+
+#: Seconds to keep errors from checking feeds for before they expire (30 days)
+ERROR_RETENTION = 30 * 24 * 60 * 60
+
+#: Seconds to keep the record of each run for before it expires (90 days)
+RUN_RETENTION = 90 * 24 * 60 * 60
+
+#: Seconds it takes for a comic's costs to decay to half (two weeks)
+COST_HALF_LIFE = 14 * 24 * 60 * 60
+
+#: Seconds after a comic was last checked that its costs are dropped, by when
+#: they've decayed to less than a thousandth
+COST_RETENTION = 10 * COST_HALF_LIFE
+
+#: How much worse the recent runs have to be than earlier runs to count as a
+#: regression in `rss-to-webhook run-trends`
+REGRESSION_THRESHOLD = 0.25
+
+#: How many comics `rss-to-webhook replay` runs the checks on by default
+REPLAY_SIZES = (100, 1_000, 10_000)
+
+#: The fraction of comics with a new entry in each replayed run
+REPLAY_NEW_FRACTION = 0.05
+
+#: How much shorter Discord's rate-limiting windows are in replayed runs
+REPLAY_TIME_SCALE = 0.01
+
+#: How many updates to comics are sent to the database in each bulk write
+WRITE_BATCH_SIZE = 50
+
+#: How many comics are read from the database at a time while feeds are checked
+READ_BATCH_SIZE = 500
+
+#: How many changed comics have the rest of their fields loaded in each query
+LOAD_BATCH_SIZE = 100
+
+#: How many feeds are checked at once during the regular checks
+MAX_CHECKS = 200
+
+#: How many threads can make database calls at once during the regular checks
+DB_THREADS = 4
+
+
+#: Discord's limits on the size of a message's content and embeds.
+#: The embed character limit counts every embed in the message together.
+MAX_CONTENT_LENGTH = 2000
+MAX_EMBEDS_PER_MESSAGE = 10
+MAX_EMBED_CHARACTERS = 6000
 
 #: Discord Blurple™, used as a fallback embed colour
 DEFAULT_COLOR = 0x5C64F4
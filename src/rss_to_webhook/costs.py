@@ -0,0 +1,83 @@
+"""Keeps track of how much each comic costs to check.
+
+A few comics can cost far more than the rest, with huge feeds, slow hosts, or
+feeds that change on every request. The regular checks add up what each comic
+cost in a `Ledger`, counting its posts as the outbox makes them, which is added
+to every comic's running totals at the end of the run (see
+`db_types.ComicCosts`), and `rss-to-webhook top` ranks comics by them.
+
+The totals decay by half every `constants.COST_HALF_LIFE` seconds, so comics
+that got cheaper drop out of the ranking. Rather than decaying every total on
+every run, which would mean reading them all first, each run's costs are
+multiplied by `weight` at the time they're added, which doubles every half-life
+after `COST_EPOCH`. Dividing a total by the current `weight` then gives every
+run's costs decayed by however long ago they were added. Every total is scaled
+by the same amount, so totals can be ranked without dividing them.
+
+Weights overflow a float about 39 years after `COST_EPOCH`.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from datetime import UTC, datetime
+from typing import TYPE_CHECKING
+
+from rss_to_webhook.constants import COST_HALF_LIFE
+
+if TYPE_CHECKING:  # pragma: no cover
+    from bson import ObjectId
+
+    from rss_to_webhook.db_types import ComicCosts, FeedSummary, OutboxMessage
+
+#: When costs started decaying
+COST_EPOCH = datetime(2024, 1, 1, tzinfo=UTC)
+
+#: The costs in `db_types.ComicCosts`
+COST_FIELDS = (
+    "bytes",
+    "seconds",
+    "parse_seconds",
+    "not_modified",
+    "hash_match",
+    "changed",
+    "error",
+    "posts",
+)
+
+
+def weight(at: datetime) -> float:
+    """Gets how much costs added at `at` are multiplied by."""
+    return 2 ** ((at - COST_EPOCH).total_seconds() / COST_HALF_LIFE)
+
+
+@dataclass(slots=True)
+class Ledger:
+    """The costs of each comic checked in one run.
+
+    Attributes:
+        comics: Each comic's costs, by its ID.
+    """
+
+    comics: dict[ObjectId, ComicCosts] = field(default_factory=dict)
+
+    def add(self, comic: FeedSummary, **costs: float) -> None:
+        """Adds to a comic's costs, which are named like in `COST_FIELDS`."""
+        totals = self._totals(comic["_id"], comic["title"])
+        for cost, amount in costs.items():
+            totals[cost] += amount  # type: ignore [literal-required]
+
+    def posted(self, post: OutboxMessage) -> None:
+        """Counts a message from the outbox that was posted against its comic."""
+        self._totals(post["comic_id"], post["title"])["posts"] += 1
+
+    def _totals(self, comic_id: ObjectId, title: str) -> ComicCosts:
+        """Gets a comic's costs, starting them at 0 if it has none yet."""
+        totals = self.comics.get(comic_id)
+        if totals is None:
+            totals = self.comics[comic_id] = {
+                "_id": comic_id,
+                "title": title,
+                **dict.fromkeys(COST_FIELDS, 0.0),  # type: ignore [typeddict-item]
+            }
+        return totals
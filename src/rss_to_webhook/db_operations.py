@@ -10,27 +10,38 @@ import requests
 from dotenv import load_dotenv
 from pymongo import MongoClient
 from pymongo.collection import Collection
-from pymongo.results import InsertOneResult, UpdateResult
 
 from rss_to_webhook.check_feeds_and_update import strip_extra_data
 from rss_to_webhook.constants import DEFAULT_GET_HEADERS, HASH_SEED
 from rss_to_webhook.db_types import CachingInfo, Comic, DiscordComic
+from rss_to_webhook.storage import (
+    MongoStorage,
+    Storage,
+    as_storage,
+    from_environment,
+    migrate_dailies,
+)
 
 
 def add_to_collection(
-    comic_data: DiscordComic, collection: Collection[Comic], hash_seed: int
-) -> UpdateResult | InsertOneResult:
-    """Adds a comic to the given collection, setting RSS info as well."""
-    result = collection.update_one({"title": comic_data["title"]}, {"$set": comic_data})
-    if result.matched_count == 1:
+    comic_data: DiscordComic, collection: Collection[Comic] | Storage, hash_seed: int
+) -> bool:
+    """Adds a comic to the given storage or collection, setting RSS info as well.
+
+    Returns:
+        Whether the comic was added or changed.
+    """
+    storage = as_storage(collection)
+    changed = storage.update_comic(comic_data)
+    if changed is not None:
         # The comic is already in the database...
-        if result.modified_count == 0:
+        if not changed:
             # ...and nothing has changed.
             print(f"Left {comic_data['title']} as-is")
-            return result
+            return False
         # ...and we've just updated something about it.
         print(f"Updated {comic_data['title']}")
-        return result
+        return True
     # The comic is not in the database
     print(f"Adding {comic_data['title']}")
 
@@ -49,7 +60,7 @@ def add_to_collection(
     if not feed["entries"] or not feed["version"]:
         print(f"The rss feed for {comic_data['title']} is broken.")
         print(comic_data["feed_url"])
-        return result
+        return False
 
     # Definitely a valid RSS feed now, so we can update the db
 
@@ -63,11 +74,27 @@ def add_to_collection(
 
     last_entries = strip_extra_data(list(reversed(feed["entries"])))
     new_comic = Comic(
-        **comic_data, **caching_info, last_entries=last_entries, dailies=[]
+        **comic_data, **caching_info, last_entries=last_entries
     )  # type: ignore [reportGeneralTypeIssues, typeddict-item]
-    insert_result = collection.insert_one(new_comic)
+    storage.insert_comic(new_comic)
     print(f"Added {comic_data['title']}")
-    return insert_result
+    return True
+
+
+def migrate_legacy_dailies(collection: str = "comics") -> None:
+    """Moves the legacy `dailies` arrays in the database from the environment.
+
+    This is run once by `rss-to-webhook migrate-dailies` (see
+    `main.migrate_dailies`). Comics stored in SQLite never had the arrays, so
+    there's nothing to do for them.
+    """
+    load_dotenv()
+    with from_environment(collection) as storage:
+        if not isinstance(storage, MongoStorage):
+            print("Comics in SQLite never had dailies arrays, so there's nothing to do")
+            return
+        migrated = migrate_dailies(storage.comics)
+    print(f"Moved the dailies of {migrated} comics in {collection}")
 
 
 if __name__ == "__main__":  # pragma: no cover
@@ -1,6 +1,7 @@
 """TypedDicts representing types of values stored in the database."""
 
-from typing import NotRequired, TypedDict
+from datetime import datetime
+from typing import Literal, NotRequired, TypedDict
 
 from bson import ObjectId
 
@@ -67,13 +68,17 @@ class Comic(TypedDict):
     - `title` and `url` are information about the webcomic itself
     - `role_id`, `thread_id`, `color`, `username`, and `avatar_url` are about
         how new entries of the comic are posted to Discord
-    - `dailies` is the list of new entries that haven't yet been posted by the
-        daily webhook
+    - `dailies` is a legacy list of new entries that haven't yet been posted by
+        the daily webhook, which is now only found on comics that haven't been
+        migrated to the `pending_dailies` collection (see `PendingDaily`) by
+        `rss-to-webhook migrate-dailies`
     - `last_entries`, `feed_hash`, `etag`, and `last_modified` are caching
         information, used to quickly find new updates when checking the comic's
         RSS feed
-    - `error_count` and `errors` track the number and type of errors that have
-        happened when connecting to the comic's RSS feed
+    - `error_count`, `last_error`, and `last_error_at` track the number and
+        latest type of errors that have happened when connecting to the comic's
+        RSS feed. The errors themselves are in the `errors` collection (see
+        `FeedError`), and `errors` is a legacy list of them
 
     Attributes:
         _id: The id of the record in the database.
@@ -94,7 +99,9 @@ class Comic(TypedDict):
             May be missing or `None`
 
         dailies: A list of entries that haven't yet been posted to the daily webhook.
-            Each entry's `link` must be a valid URL.
+            Each entry's `link` must be a valid URL. Only present on comics
+            stored before `PendingDaily` existed, and removed by the next daily
+            check.
 
         feed_hash: An mmh3-generated hash of the content of the feed.
             Used to early-exit when the feed is unchanged.
@@ -108,8 +115,12 @@ class Comic(TypedDict):
 
         error_count: Number of errors that have occurred connecting to this RSS feed.
             Missing if there have never been any.
-        errors: A list of the errors that have occurred, from oldest to newest.
+        last_error: The most recent error. Missing if there have never been any.
+        last_error_at: When the most recent error happened.
             Missing if there have never been any.
+        errors: A list of the errors that occurred, from oldest to newest.
+            Only present on comics with errors from before `FeedError` existed,
+            and no longer added to.
     """
 
     _id: ObjectId
@@ -123,7 +134,7 @@ class Comic(TypedDict):
     role_id: NotRequired[int]
     thread_id: NotRequired[int]
 
-    dailies: list[EntrySubset]  # Must have valid URLs
+    dailies: NotRequired[list[EntrySubset]]  # Must have valid URLs
 
     last_entries: list[EntrySubset]
     feed_hash: bytes
@@ -131,4 +142,205 @@ class Comic(TypedDict):
     last_modified: NotRequired[str]
 
     error_count: NotRequired[int]
+    last_error: NotRequired[str]
+    last_error_at: NotRequired[datetime]
     errors: NotRequired[list[str]]
+
+
+class FeedSummary(TypedDict):
+    """The fields of a `Comic` needed to check whether its feed has changed.
+
+    Every comic is loaded like this first, and the rest of a comic is only
+    loaded if its feed has changed. See `Comic` for what each field means.
+    """
+
+    _id: ObjectId
+    title: str
+    feed_url: str
+    feed_hash: bytes
+    etag: NotRequired[str]
+    last_modified: NotRequired[str]
+
+
+class FeedError(TypedDict):
+    """An error that happened while checking a comic's RSS feed.
+
+    These are stored in the `errors` subcollection of the comics collection,
+    and expire after `constants.ERROR_RETENTION` seconds.
+
+    Attributes:
+        comic_id: The `_id` of the comic whose feed failed.
+        error: The type and message of the error.
+        occurred_at: When it happened.
+    """
+
+    _id: NotRequired[ObjectId]
+    comic_id: ObjectId
+    error: str
+    occurred_at: datetime
+
+
+class ErrorCount(TypedDict):
+    """How many errors a comic's feed has had since some time.
+
+    These aren't stored, but are counted from the `FeedError`s for
+    `rss-to-webhook error-rates`.
+
+    Attributes:
+        _id: The comic's ID.
+        title: The comic's title, unless it has been deleted since.
+        errors: How many errors there were.
+        last_error: The most recent error.
+        last_error_at: When it happened.
+    """
+
+    _id: ObjectId
+    title: NotRequired[str]
+    errors: int
+    last_error: str
+    last_error_at: datetime
+
+
+class PendingDaily(TypedDict):
+    """A single new entry waiting to be posted by the daily webhook.
+
+    These are stored in the `pending_dailies` subcollection of the comics
+    collection, and are deleted once they have been posted.
+
+    Attributes:
+        _id: A key derived from the comic, its new feed hash, and the entry's
+            position, so queueing the same new entries twice is harmless.
+        comic_id: The `_id` of the comic the entry is from.
+        entry: The entry itself.
+        queued_at: When the entry was found.
+        seq: The entry's position among the entries found at the same time.
+    """
+
+    _id: str
+    comic_id: ObjectId
+    entry: EntrySubset
+    queued_at: datetime
+    seq: int
+
+
+class OutboxMessage(TypedDict):
+    """A single webhook post waiting in a comic collection's outbox.
+
+    The regular checks write these in the same pass that persists a comic's new
+    state, and they are then posted separately by `drain_outbox`. Because the
+    `_id` is derived from the comic, the new feed hash, and the message's position,
+    writing the same update twice can never queue it twice.
+
+    Attributes:
+        _id: A deterministic key for the post.
+            `{comic _id}-{feed hash}-{message index}-{"main" or "thread"}`.
+        comic_id: The `_id` of the comic the post is for.
+        title: The title of that comic, for logging.
+        thread_id: The thread to post in, or `None` to post to the main channel.
+        payload: The JSON body to send to the webhook, already encoded.
+        queued_at: When the post was queued. Every post queued by one run has
+            the same value, so that together with `seq` it orders posts across runs.
+        seq: The position of the post within the run that queued it.
+        status: `"pending"` until the post is made, then `"posted"`. Posts
+            that fail `constants.MAX_POST_ATTEMPTS` times are marked `"failed"`
+            and skipped, so that one bad message can't hold up the rest forever.
+        attempts: How many times posting has failed.
+        last_error: The most recent error, if posting has ever failed.
+        posted_at: When the post was made. Posted messages are kept for
+            `constants.OUTBOX_RETENTION` seconds so their completion markers
+            stay visible, then expire.
+    """
+
+    _id: str
+    comic_id: ObjectId
+    title: str
+    thread_id: int | None
+    payload: bytes
+    queued_at: datetime
+    seq: int
+    status: Literal["pending", "posted", "failed"]
+    attempts: int
+    last_error: NotRequired[str]
+    posted_at: NotRequired[datetime]
+
+
+class RunRecord(TypedDict):
+    """How one run of the regular or daily checks went.
+
+    These are stored in the `runs` subcollection of the comics collection, and
+    expire after `constants.RUN_RETENTION` seconds. `rss-to-webhook run-trends`
+    compares recent runs with earlier ones to find regressions.
+
+    Attributes:
+        _id: The run's ID.
+        check_type: `"regular"` or `"daily"`.
+        started_at: When the run started.
+        duration: How many seconds the run took.
+        comics: How many comics were checked, or for the daily check, how many
+            had entries to post.
+        changed: How many comics' feeds had changed. Regular checks only.
+        updated: How many comics had new entries.
+        statuses: How many feed requests got each HTTP status, with requests
+            that got no response counted under `"error"`. Regular checks only.
+        downloaded_bytes: How many bytes of feeds were downloaded. Regular
+            checks only.
+        posts: How many posts were made.
+        rate_limit_sleep: How many seconds were spent waiting for rate limits.
+        errors: How many feeds couldn't be checked.
+        phases: How many seconds were spent on each phase of the run, over
+            every comic (see `timing`). Empty if the run wasn't timed.
+    """
+
+    _id: NotRequired[ObjectId]
+    check_type: Literal["regular", "daily"]
+    started_at: datetime
+    duration: float
+    comics: int
+    changed: NotRequired[int]
+    updated: int
+    statuses: NotRequired[dict[str, int]]
+    downloaded_bytes: NotRequired[int]
+    posts: int
+    rate_limit_sleep: float
+    errors: int
+    phases: dict[str, float]
+
+
+class ComicCosts(TypedDict):
+    """How much checking one comic has cost, with older runs counting for less.
+
+    These are stored in the `costs` subcollection of the comics collection,
+    with one document per comic. Every amount decays by half every
+    `constants.COST_HALF_LIFE` seconds, but what's stored is scaled up by how
+    far into the future it was added, so adding to them never needs them to be
+    read (see `costs`). Comics that haven't been checked for 10 half-lives are
+    dropped. `rss-to-webhook top` ranks comics by them.
+
+    Attributes:
+        _id: The comic's ID.
+        title: The comic's title when it was last checked.
+        updated_at: When the comic was last checked.
+        bytes: Bytes of feed downloaded.
+        seconds: Seconds from requesting the feed until it was checked,
+            including failed requests and timeouts.
+        parse_seconds: CPU seconds spent parsing the feed.
+        not_modified: Checks where the feed responded 304 Not Modified.
+        hash_match: Checks where the feed was downloaded but hadn't changed.
+        changed: Checks where the feed had changed, whether or not it had new
+            entries.
+        error: Checks that failed.
+        posts: Messages for new entries that were posted. A packed post counts
+            once for each comic's message in it.
+    """
+
+    _id: ObjectId
+    title: str
+    updated_at: NotRequired[datetime]
+    bytes: float
+    seconds: float
+    parse_seconds: float
+    not_modified: float
+    hash_match: float
+    changed: float
+    error: float
+    posts: float
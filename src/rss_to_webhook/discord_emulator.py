@@ -0,0 +1,464 @@
+"""A local emulator of Discord's Execute Webhook endpoint.
+
+The tests mock Discord with `responses`, which can only replay canned
+responses. This is a real HTTP server that behaves like Discord does, as
+described in [design/discord-api.md](/design/discord-api.md), so the whole
+posting path can be tested, benchmarked, and soak-tested offline:
+
+- Requests are validated, and give the same errors Discord gives, for bad
+  webhook IDs and tokens, unknown threads, bad query parameters, empty messages,
+  and the size, colour, and URL limits on messages and embeds.
+- Each webhook has a `X-RateLimit-*` bucket, which is reported in the headers
+  of every response and gives a 429 when exceeded.
+- Each channel has the hidden 30 messages/minute rate limit, which also gives a
+  429, with a `retry_after` that is as useless as the real one.
+- Responses can be slowed down by a fixed latency.
+
+Both rate limits' windows can be shortened to keep tests quick.
+
+Run it with `py -m rss_to_webhook.discord_emulator`, or from Python with
+`DiscordEmulator.serve_in_thread`.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import itertools
+import json
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from http import HTTPStatus
+from typing import TYPE_CHECKING, Any
+from urllib.parse import urlsplit
+
+import typer
+from aiohttp import web
+
+from rss_to_webhook.constants import (
+    MAX_CONTENT_LENGTH,
+    MAX_EMBED_CHARACTERS,
+    MAX_EMBEDS_PER_MESSAGE,
+)
+
+if TYPE_CHECKING:  # pragma: no cover
+    from collections.abc import Iterator
+
+#: Discord's limits on individual embed fields and URLs
+MAX_TITLE_LENGTH = 256
+MAX_DESCRIPTION_LENGTH = 4096
+MAX_URL_LENGTH = 2048
+MAX_NETLOC_LABEL_LENGTH = 63
+MAX_COLOR = 0xFFFFFF
+MAX_SNOWFLAKE = 2**64 - 1
+
+
+@dataclass(slots=True)
+class EmulatedWebhook:
+    """A webhook the emulator knows about.
+
+    Attributes:
+        id: The webhook's ID, a snowflake.
+        token: The webhook's token.
+        channel_id: The channel the webhook posts in. Webhooks in the same
+            channel share the hidden rate limit.
+    """
+
+    id: int
+    token: str
+    channel_id: int
+
+
+@dataclass(slots=True)
+class PostedMessage:
+    """A message that was successfully posted to the emulator.
+
+    Attributes:
+        id: The new message's ID.
+        webhook_id: The webhook it was posted by.
+        channel_id: The channel it was posted in.
+        thread_id: The thread it was posted in, if any.
+        body: The JSON body of the request.
+        posted_at: When it was posted, from `time.monotonic`.
+    """
+
+    id: int
+    webhook_id: int
+    channel_id: int
+    thread_id: int | None
+    body: dict[str, Any]
+    posted_at: float
+
+
+@dataclass(slots=True)
+class _Window:
+    """A fixed rate-limiting window, started by the first request in it."""
+
+    limit: int
+    length: float
+    start: float = 0
+    count: int = 0
+
+    def reset_after(self, now: float) -> float:
+        return max(self.start + self.length - now, 0)
+
+    def hit(self, now: float) -> bool:
+        """Counts a request, returning whether it's within the limit."""
+        if now >= self.start + self.length:
+            self.start = now
+            self.count = 0
+        if self.count >= self.limit:
+            return False
+        self.count += 1
+        return True
+
+
+@dataclass
+class DiscordEmulator:
+    """An emulated Discord API that serves the Execute Webhook endpoint.
+
+    Attributes:
+        webhooks: The webhooks that exist.
+        threads: The IDs of the threads in each channel, indexed by channel ID.
+        latency: Seconds to wait before responding to each request.
+        bucket_limit: How many posts each webhook can make per `bucket_window`.
+        bucket_window: The length of each webhook's rate-limiting window.
+        hidden_limit: How many posts each channel can receive per `hidden_window`.
+        hidden_window: The length of each channel's hidden rate-limiting window.
+        messages: Every message that has been posted, in order.
+        rate_limited: How many requests have been rejected with a 429.
+    """
+
+    webhooks: list[EmulatedWebhook]
+    threads: dict[int, set[int]] = field(default_factory=dict)
+    latency: float = 0
+    bucket_limit: int = 5
+    bucket_window: float = 2
+    hidden_limit: int = 30
+    hidden_window: float = 60
+    messages: list[PostedMessage] = field(default_factory=list)
+    rate_limited: int = 0
+    _buckets: dict[int, _Window] = field(default_factory=dict)
+    _channels: dict[int, _Window] = field(default_factory=dict)
+    _ids: Iterator[int] = field(
+        default_factory=lambda: itertools.count(1162562151068745799)
+    )
+
+    def app(self) -> web.Application:
+        """Makes an aiohttp application serving the emulated endpoints."""
+        app = web.Application()
+        for prefix in ("/api", "/api/v10"):
+            app.router.add_post(f"{prefix}/webhooks/{{webhook_id}}/", self._no_token)
+            app.router.add_post(f"{prefix}/webhooks/{{webhook_id}}", self._no_token)
+            app.router.add_post(
+                f"{prefix}/webhooks/{{webhook_id}}/{{token}}", self._execute
+            )
+        return app
+
+    @contextmanager
+    def serve_in_thread(self, host: str = "127.0.0.1", port: int = 0) -> Iterator[str]:
+        """Serves the emulator from a background thread.
+
+        This lets synchronous code, like `RateLimiter`, post to it.
+
+        Yields:
+            The base URL of the server, like `http://127.0.0.1:8080`.
+        """
+        with serve_app_in_thread(self.app(), host, port) as base_url:
+            yield base_url
+
+    @staticmethod
+    def webhook_url(base_url: str, webhook: EmulatedWebhook) -> str:
+        """Gets the URL of a webhook on an emulator served at `base_url`."""
+        return f"{base_url}/api/v10/webhooks/{webhook.id}/{webhook.token}"
+
+    async def _no_token(self, request: web.Request) -> web.Response:
+        await asyncio.sleep(self.latency)
+        if request.path.endswith("/"):
+            return _error(HTTPStatus.NOT_FOUND, "404: Not Found", 0)
+        return _error(HTTPStatus.METHOD_NOT_ALLOWED, "405: Method Not Allowed", 0)
+
+    async def _execute(  # noqa: C901, PLR0911
+        self, request: web.Request
+    ) -> web.Response:
+        await asyncio.sleep(self.latency)
+        raw_id = request.match_info["webhook_id"]
+        if not _is_snowflake(raw_id):
+            return web.json_response(
+                {"webhook_id": [f'Value "{raw_id}" is not snowflake.']},
+                status=HTTPStatus.BAD_REQUEST,
+            )
+        webhook = next((w for w in self.webhooks if w.id == int(raw_id)), None)
+        if webhook is None:
+            return _error(HTTPStatus.NOT_FOUND, "Unknown Webhook", 10015)
+        if request.match_info["token"] != webhook.token:
+            return _error(HTTPStatus.UNAUTHORIZED, "Invalid Webhook Token", 50027)
+
+        now = time.monotonic()
+        bucket = self._buckets.setdefault(
+            webhook.id, _Window(self.bucket_limit, self.bucket_window)
+        )
+        within_bucket = bucket.hit(now)
+        headers = {
+            "X-RateLimit-Bucket": f"webhook-{webhook.id}",
+            "X-RateLimit-Limit": str(bucket.limit),
+            "X-RateLimit-Remaining": str(bucket.limit - bucket.count),
+            "X-RateLimit-Reset-After": f"{bucket.reset_after(now):.3f}",
+        }
+        if not within_bucket:
+            return self._rate_limited(bucket.reset_after(now), "user", headers)
+
+        query_errors = _query_errors(request.query)
+        if query_errors:
+            return _form_error(query_errors, headers)
+        thread_id = None
+        if "thread_id" in request.query:
+            thread_id = int(request.query["thread_id"])
+            if thread_id not in self.threads.get(webhook.channel_id, set()):
+                return _error(HTTPStatus.BAD_REQUEST, "Unknown Channel", 10003, headers)
+
+        try:
+            body = json.loads(await request.read())
+        except ValueError:
+            return _error(
+                HTTPStatus.BAD_REQUEST,
+                "The request body contains invalid JSON.",
+                50109,
+                headers,
+            )
+        if not body.get("content") and not body.get("embeds"):
+            return _error(
+                HTTPStatus.BAD_REQUEST, "Cannot send an empty message", 50006, headers
+            )
+        body_errors = _body_errors(body)
+        if body_errors:
+            return _form_error(body_errors, headers)
+
+        channel = self._channels.setdefault(
+            webhook.channel_id, _Window(self.hidden_limit, self.hidden_window)
+        )
+        if not channel.hit(now):
+            # The real `retry_after` here is meaningless, so ours is too
+            return self._rate_limited(0.529, "shared", headers)
+
+        message = PostedMessage(
+            id=next(self._ids),
+            webhook_id=webhook.id,
+            channel_id=thread_id or webhook.channel_id,
+            thread_id=thread_id,
+            body=body,
+            posted_at=now,
+        )
+        self.messages.append(message)
+        if request.query.get("wait", "false").lower() != "true":
+            return web.Response(status=HTTPStatus.NO_CONTENT, headers=headers)
+        return web.json_response(
+            {
+                "id": str(message.id),
+                "type": 0,
+                "channel_id": str(message.channel_id),
+                "webhook_id": str(webhook.id),
+                "content": body.get("content") or "",
+                "embeds": body.get("embeds") or [],
+            },
+            headers=headers,
+        )
+
+    def _rate_limited(
+        self, retry_after: float, scope: str, headers: dict[str, str]
+    ) -> web.Response:
+        self.rate_limited += 1
+        headers["Retry-After"] = str(int(retry_after) + 1)
+        headers["X-RateLimit-Scope"] = scope
+        return web.json_response(
+            {
+                "message": "You are being rate limited.",
+                "retry_after": retry_after,
+                "global": False,
+            },
+            status=HTTPStatus.TOO_MANY_REQUESTS,
+            headers=headers,
+        )
+
+
+@contextmanager
+def serve_app_in_thread(
+    app: web.Application, host: str = "127.0.0.1", port: int = 0
+) -> Iterator[str]:
+    """Serves an aiohttp application from a background thread, with its own loop.
+
+    Yields:
+        The base URL of the server, like `http://127.0.0.1:8080`.
+    """
+    loop = asyncio.new_event_loop()
+    runner = web.AppRunner(app, access_log=None)
+    loop.run_until_complete(runner.setup())
+    site = web.TCPSite(runner, host, port)
+    loop.run_until_complete(site.start())
+    bound_host, bound_port = runner.addresses[0][:2]
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://{bound_host}:{bound_port}"
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.run_until_complete(runner.cleanup())
+        loop.close()
+
+
+def _error(
+    status: HTTPStatus, message: str, code: int, headers: dict[str, str] | None = None
+) -> web.Response:
+    return web.json_response(
+        {"message": message, "code": code}, status=status, headers=headers
+    )
+
+
+def _form_error(errors: dict[str, Any], headers: dict[str, str]) -> web.Response:
+    return web.json_response(
+        {"message": "Invalid Form Body", "code": 50035, "errors": errors},
+        status=HTTPStatus.BAD_REQUEST,
+        headers=headers,
+    )
+
+
+def _field_error(code: str, message: str) -> dict[str, Any]:
+    return {"_errors": [{"code": code, "message": message}]}
+
+
+def _max_length_error(limit: int) -> dict[str, Any]:
+    return _field_error("BASE_TYPE_MAX_LENGTH", f"Must be {limit} or fewer in length.")
+
+
+def _is_snowflake(value: str) -> bool:
+    return value.isdigit() and int(value) <= MAX_SNOWFLAKE
+
+
+def _query_errors(query: Any) -> dict[str, Any]:  # noqa: ANN401
+    errors: dict[str, Any] = {}
+    if query.get("wait", "true").lower() not in {"true", "false"}:
+        errors["wait"] = _field_error(
+            "BOOLEAN_TYPE_CONVERT", "Must be either true or false."
+        )
+    if "thread_id" in query and not _is_snowflake(query["thread_id"]):
+        errors["thread_id"] = _field_error(
+            "NUMBER_TYPE_COERCE", f'Value "{query["thread_id"]}" is not snowflake.'
+        )
+    return errors
+
+
+def _url_errors(url: object) -> dict[str, Any] | None:
+    if not isinstance(url, str):
+        return _field_error("URL_TYPE_INVALID_URL", "Not a well formed URL.")
+    if len(url) > MAX_URL_LENGTH:
+        return _max_length_error(MAX_URL_LENGTH)
+    parts = urlsplit(url)
+    if parts.scheme not in {"http", "https"}:
+        return _field_error(
+            "URL_TYPE_INVALID_SCHEME",
+            f'Scheme "{parts.scheme}" is not supported. Scheme must be one of'
+            " ('http', 'https').",
+        )
+    labels = parts.netloc.split(".")
+    if (
+        " " in url
+        or len(labels) < 2  # noqa: PLR2004 # There must be a dot
+        or any(not label for label in labels)
+        or any(len(label) > MAX_NETLOC_LABEL_LENGTH for label in labels)
+    ):
+        return _field_error("URL_TYPE_INVALID_URL", "Not a well formed URL.")
+    return None
+
+
+def _embed_errors(embed: object) -> dict[str, Any]:
+    if not isinstance(embed, dict):
+        return _field_error("MODEL_TYPE_CONVERT", "Expected an object/dictionary.")
+    if not embed:
+        return _field_error(
+            "LIST_ITEM_VALUE_REQUIRED", "List item values of ModelType are required"
+        )
+    errors: dict[str, Any] = {}
+    if len(embed.get("title") or "") > MAX_TITLE_LENGTH:
+        errors["title"] = _max_length_error(MAX_TITLE_LENGTH)
+    if len(embed.get("description") or "") > MAX_DESCRIPTION_LENGTH:
+        errors["description"] = _max_length_error(MAX_DESCRIPTION_LENGTH)
+    if "url" in embed and (url_errors := _url_errors(embed["url"])):
+        errors["url"] = url_errors
+    if "color" in embed:
+        color = embed["color"]
+        if not isinstance(color, int | float) or isinstance(color, bool):
+            errors["color"] = _field_error(
+                "NUMBER_TYPE_COERCE", f'Value "{color}" is not int.'
+            )
+        elif color < 0:
+            errors["color"] = _field_error(
+                "NUMBER_TYPE_MIN", "int value should be greater than or equal to 0."
+            )
+        elif color > MAX_COLOR:
+            errors["color"] = _field_error(
+                "NUMBER_TYPE_MAX",
+                f"int value should be less than or equal to {MAX_COLOR}.",
+            )
+    return errors
+
+
+def _body_errors(body: dict[str, Any]) -> dict[str, Any]:
+    errors: dict[str, Any] = {}
+    if len(body.get("content") or "") > MAX_CONTENT_LENGTH:
+        errors["content"] = _max_length_error(MAX_CONTENT_LENGTH)
+    if body.get("avatar_url") is not None and (
+        avatar_errors := _url_errors(body["avatar_url"])
+    ):
+        errors["avatar_url"] = avatar_errors
+    embeds = body.get("embeds") or []
+    if len(embeds) > MAX_EMBEDS_PER_MESSAGE:
+        errors["embeds"] = _max_length_error(MAX_EMBEDS_PER_MESSAGE)
+        return errors
+    embed_errors = {
+        str(i): embed_error
+        for i, embed in enumerate(embeds)
+        if (embed_error := _embed_errors(embed))
+    }
+    if embed_errors:
+        errors["embeds"] = embed_errors
+    elif (
+        sum(
+            len(embed.get("title") or "") + len(embed.get("description") or "")
+            for embed in embeds
+        )
+        > MAX_EMBED_CHARACTERS
+    ):
+        errors["embeds"] = _field_error(
+            "MAX_EMBED_SIZE_EXCEEDED",
+            f"Embed size exceeds maximum size of {MAX_EMBED_CHARACTERS}",
+        )
+    return errors
+
+
+def serve(
+    port: int = typer.Option(8080, help="The port to listen on."),
+    latency: float = typer.Option(0, help="Seconds to wait before each response."),
+    webhooks: int = typer.Option(
+        3, help="How many webhooks to create, each in its own channel."
+    ),
+) -> None:
+    """Serves an emulated Discord API until interrupted."""
+    emulated = [
+        EmulatedWebhook(id=1000 + i, token=f"token-{i}", channel_id=2000 + i)
+        for i in range(webhooks)
+    ]
+    emulator = DiscordEmulator(
+        emulated,
+        threads={webhook.channel_id: {3000} for webhook in emulated},
+        latency=latency,
+    )
+    for webhook in emulated:
+        print(DiscordEmulator.webhook_url(f"http://127.0.0.1:{port}", webhook))
+    print("Every channel has a thread with ID 3000")
+    web.run_app(emulator.app(), host="127.0.0.1", port=port)
+
+
+if __name__ == "__main__":  # pragma: no cover
+    typer.run(serve)
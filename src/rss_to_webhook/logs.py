@@ -0,0 +1,188 @@
+"""Logs what the checks are doing, without holding up the event loop.
+
+Everything the checks log goes through the `rss_to_webhook` logger. Inside
+`logging_to`, records are put on a queue and a background thread formats them
+and writes them out, so logging a line from the event loop never waits for
+stdout. Steps that happen for every comic, like requesting its feed or reading
+its headers, are logged at `DEBUG`, so they cost one level check unless they're
+asked for.
+
+Lines about one comic are logged with the comic's title, which is kept in the
+`COMIC` context variable rather than being put in every message. Each feed is
+checked in its own task, which has its own copy of the context, so the title
+set by one check never leaks into another.
+
+Logs can be written as text, like `Comic: 2 new entries`, or as one JSON object
+per line, with the time, level, comic, message and any `extra` fields given
+when logging. The bytes written are counted, and in `metrics.LOG_BYTES`.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import queue
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import UTC, datetime
+from logging.handlers import QueueHandler, QueueListener
+from typing import TYPE_CHECKING, Any, TextIO
+
+from rss_to_webhook import metrics
+
+if TYPE_CHECKING:  # pragma: no cover
+    from collections.abc import Generator
+
+#: The logger for everything in the package
+logger = logging.getLogger("rss_to_webhook")
+
+#: The title of the comic being worked on, if there is one
+COMIC: ContextVar[str | None] = ContextVar("comic", default=None)
+
+# Attributes every record has, so anything else was passed as an `extra` field
+_RECORD_FIELDS = frozenset(vars(logging.makeLogRecord({}))) | {
+    "message",
+    "asctime",
+    "comic",
+}
+
+
+@contextmanager
+def comic_context(title: str) -> Generator[None, None, None]:
+    """Logs everything in the block as being about the comic called `title`."""
+    token = COMIC.set(title)
+    try:
+        yield
+    finally:
+        COMIC.reset(token)
+
+
+class _ComicFilter(logging.Filter):
+    """Adds the comic being worked on to each record, as `comic`.
+
+    This runs where the record was logged, before it's queued, since the
+    context isn't available from the thread that writes it.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:  # noqa: PLR6301
+        if not hasattr(record, "comic"):
+            record.comic = COMIC.get()
+        return True
+
+
+class TextFormatter(logging.Formatter):
+    """Formats records as their message, after the comic's title if there is one."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        """Puts the comic's title, if there is one, before the message."""
+        message = super().format(record)
+        comic = getattr(record, "comic", None)
+        return f"{comic}: {message}" if comic else message
+
+
+class JSONFormatter(logging.Formatter):
+    """Formats records as JSON objects, with any `extra` fields as keys."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        """Encodes the record and its `extra` fields as one JSON object."""
+        entry: dict[str, Any] = {
+            "time": datetime.fromtimestamp(record.created, tz=UTC).isoformat(),
+            "level": record.levelname,
+        }
+        comic = getattr(record, "comic", None)
+        if comic:
+            entry["comic"] = comic
+        entry["message"] = record.getMessage()
+        entry.update(
+            (key, value)
+            for key, value in vars(record).items()
+            if key not in _RECORD_FIELDS
+        )
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class CountingHandler(logging.StreamHandler[TextIO]):
+    """Writes records to a stream, counting how many bytes it's written.
+
+    Attributes:
+        bytes: How many bytes have been written, as UTF-8.
+    """
+
+    bytes: int
+
+    def __init__(self, stream: TextIO) -> None:
+        """Writes to `stream`."""
+        super().__init__(stream)
+        self.bytes = 0
+
+    def emit(self, record: logging.LogRecord) -> None:
+        """Writes the record, counting its bytes."""
+        try:
+            line = self.format(record) + self.terminator
+            self.stream.write(line)
+            self.flush()
+        except Exception:  # noqa: BLE001 # Logging shouldn't crash the run
+            self.handleError(record)
+            return
+        size = len(line.encode())
+        self.bytes += size
+        metrics.LOG_BYTES.inc(size)
+
+
+class LogOutput:
+    """Where `logging_to` is writing logs.
+
+    Attributes:
+        handler: The handler that writes them.
+    """
+
+    handler: CountingHandler
+
+    def __init__(self, handler: CountingHandler, records: queue.Queue[Any]) -> None:
+        """Wraps the handler writing the records from `records`."""
+        self.handler = handler
+        self._records = records
+
+    @property
+    def bytes(self) -> int:
+        """How many bytes of logs have been written so far."""
+        return self.handler.bytes
+
+    def flush(self) -> None:
+        """Waits until everything logged so far has been written."""
+        self._records.join()
+
+
+@contextmanager
+def logging_to(
+    stream: TextIO, level: int | str = logging.INFO, *, json_format: bool = False
+) -> Generator[LogOutput, None, None]:
+    """Writes logs at `level` and above to `stream` from a background thread.
+
+    Everything logged in the block is written before it exits.
+
+    Args:
+        stream: Where to write logs.
+        level: The lowest level to write, like `"DEBUG"`.
+        json_format: Whether to write JSON objects rather than text.
+    """
+    handler = CountingHandler(stream)
+    handler.setFormatter(JSONFormatter() if json_format else TextFormatter())
+    records: queue.Queue[Any] = queue.Queue()
+    queue_handler = QueueHandler(records)
+    queue_handler.addFilter(_ComicFilter())
+    listener = QueueListener(records, handler)
+    previous_level = logger.level
+    logger.setLevel(level)
+    logger.addHandler(queue_handler)
+    logger.propagate = False
+    listener.start()
+    try:
+        yield LogOutput(handler, records)
+    finally:
+        listener.stop()
+        logger.removeHandler(queue_handler)
+        logger.setLevel(previous_level)
+        logger.propagate = True
@@ -1,14 +1,263 @@
-"""Calls other modules from the command line."""
+"""Calls other modules from the command line.
+
+Each command only imports the module that does its work when it's run, so
+`--help` and the commands that don't check feeds don't wait for aiohttp,
+feedparser, requests or pymongo to be imported unless they use them. This
+matters because every scheduled run starts a new process.
+"""
+
+from pathlib import Path
 
 import typer
 from dotenv import load_dotenv
 
-from rss_to_webhook import check_feeds_and_update
+from rss_to_webhook.constants import (
+    REGRESSION_THRESHOLD,
+    REPLAY_NEW_FRACTION,
+    REPLAY_SIZES,
+    REPLAY_TIME_SCALE,
+    CheckType,
+    Cost,
+)
 
 load_dotenv()
 
 app = typer.Typer()
-app.command("post-updates")(check_feeds_and_update.main)
+
+
+@app.command("post-updates")
+def post_updates(  # noqa: PLR0913
+    check_type: CheckType = typer.Argument(
+        CheckType.regular,
+        help=(
+            "Use `regular` for normal checks, `daily` for daily, `test` to run"
+            " in testing mode, and `drain` to only post messages left in the outbox."
+        ),
+    ),
+    *,
+    pack: bool = typer.Option(
+        default=False,
+        help=(
+            "Merge updates for several comics into each post to the main webhook,"
+            " making fewer posts on busy runs."
+        ),
+    ),
+    timings: Path | None = typer.Option(  # noqa: B008 # Typer needs it here
+        None,
+        help=(
+            "Time each phase of the run for each comic, and write a JSON summary"
+            " of the slowest phases and comics to this file."
+        ),
+    ),
+    profile: Path | None = typer.Option(  # noqa: B008 # Typer needs it here
+        None,
+        help=(
+            "Profile the run, writing the stats to this file and showing the"
+            " slowest functions and asyncio tasks."
+        ),
+    ),
+    loop_lag: float | None = typer.Option(
+        None,
+        help=(
+            "Report every time the event loop is held up for longer than this many"
+            " seconds while feeds are checked, and what was running at the time."
+        ),
+    ),
+    metrics: Path | None = typer.Option(  # noqa: B008 # Typer needs it here
+        None,
+        help=(
+            "Write counts of fetches, diffs, posts and rate limits to this file at"
+            " the end of the run, in Prometheus's text format."
+        ),
+    ),
+    log_level: str = typer.Option(
+        "INFO",
+        envvar="LOG_LEVEL",
+        help="The lowest level to log. `DEBUG` logs every step of every check.",
+    ),
+    json_logs: bool = typer.Option(
+        default=False,
+        envvar="JSON_LOGS",
+        help="Log one JSON object per line rather than text.",
+    ),
+) -> None:
+    """Checks feeds for updates and posts them to Discord."""
+    from rss_to_webhook import check_feeds_and_update  # noqa: PLC0415 # Slow
+
+    check_feeds_and_update.main(
+        check_type,
+        pack=pack,
+        timings_path=timings,
+        profile_path=profile,
+        loop_lag=loop_lag,
+        metrics_path=metrics,
+        log_level=log_level.upper(),
+        json_logs=json_logs,
+    )
+
+
+@app.command("error-rates")
+def error_rates(
+    days: float = typer.Option(7, help="How many days to look back."),
+    limit: int = typer.Option(20, help="How many comics to show."),
+) -> None:
+    """Shows the comics whose feeds have failed most often recently."""
+    from rss_to_webhook import stats  # noqa: PLC0415 # Slow
+
+    stats.show_error_rates(days, limit)
+
+
+@app.command("run-trends")
+def run_trends(
+    runs: int = typer.Option(20, help="How many of the latest runs to look at."),
+    check_type: CheckType = typer.Option(  # noqa: B008 # Typer needs it here
+        CheckType.regular, help="Which checks to look at, `regular` or `daily`."
+    ),
+    threshold: float = typer.Option(
+        REGRESSION_THRESHOLD,
+        help="How much worse, as a fraction, counts as a regression.",
+    ),
+) -> None:
+    """Compares the latest runs with the runs before them, to find regressions."""
+    from rss_to_webhook import stats  # noqa: PLC0415 # Slow
+
+    stats.show_run_trends(runs, check_type, threshold)
+
+
+@app.command("top")
+def top(
+    by: Cost = typer.Option(  # noqa: B008 # Typer needs it here
+        Cost.seconds,
+        help=(
+            "What to rank comics by: time checking their feed, CPU time parsing"
+            " it, bytes downloaded, times it changed, errors, or posts."
+        ),
+    ),
+    limit: int = typer.Option(20, help="How many comics to show."),
+) -> None:
+    """Shows the comics that have cost the most to check recently."""
+    from rss_to_webhook import stats  # noqa: PLC0415 # Slow
+
+    stats.show_top_costs(by, limit)
+
+
+@app.command("migrate-dailies")
+def migrate_dailies(
+    collection: str = typer.Option("comics", help="The collection to migrate."),
+) -> None:
+    """Moves comics' old `dailies` arrays into `pending_dailies`. Only needed once."""
+    from rss_to_webhook import db_operations  # noqa: PLC0415 # Slow
+
+    db_operations.migrate_legacy_dailies(collection)
+
+
+@app.command("record-feeds")
+def record_feeds(
+    directory: Path = typer.Argument(..., help="Where to save the feeds."),
+) -> None:
+    """Records every comic's feed, for `replay` to serve."""
+    from rss_to_webhook import replay  # noqa: PLC0415 # Slow
+
+    replay.record_from_database(directory)
+
+
+@app.command("replay")
+def replay_feeds(  # noqa: PLR0913
+    corpus: Path | None = typer.Option(  # noqa: B008 # Typer needs it here
+        None,
+        help=(
+            "A directory of feeds saved by `record-feeds`. Defaults to a few"
+            " generated feeds, including large, malformed, slow and failing ones."
+        ),
+    ),
+    comics: list[int] = typer.Option(  # noqa: B008 # Typer needs it here
+        list(REPLAY_SIZES), help="How many comics to run the checks on."
+    ),
+    latency: float | None = typer.Option(
+        None,
+        help=(
+            "Seconds to wait before serving each feed. Defaults to how long each"
+            " feed took when it was recorded."
+        ),
+    ),
+    new_fraction: float = typer.Option(
+        REPLAY_NEW_FRACTION, help="The fraction of comics with a new entry."
+    ),
+    time_scale: float = typer.Option(
+        REPLAY_TIME_SCALE,
+        help="How much shorter to make Discord's rate-limiting windows.",
+    ),
+    *,
+    pack: bool = typer.Option(
+        default=False, help="Merge updates for several comics into each post."
+    ),
+    synthetic: bool = typer.Option(
+        default=False,
+        help=(
+            "Make up comics and feeds like the real ones instead, as"
+            " `generate-comics` does."
+        ),
+    ),
+    seed: int = typer.Option(0, help="What `--synthetic` makes comics up from."),
+) -> None:
+    """Benchmarks the regular and daily checks offline, on recorded feeds."""
+    from rss_to_webhook import replay  # noqa: PLC0415 # Slow
+
+    replay.show_replay(
+        corpus,
+        comics,
+        synthetic=synthetic,
+        seed=seed,
+        latency=latency,
+        new_fraction=new_fraction,
+        time_scale=time_scale,
+        pack=pack,
+    )
+
+
+@app.command("generate-comics")
+def generate_comics(
+    comics: int = typer.Argument(..., help="How many comics to add."),
+    collection: str = typer.Option(
+        "test-comics",
+        help="The collection to add them to, which `post-updates test` checks.",
+    ),
+    feeds_url: str = typer.Option(
+        "http://127.0.0.1:8081",
+        help="Where `serve-feeds` will serve their feeds.",
+    ),
+    seed: int = typer.Option(
+        0, help="What to make comics up from. `serve-feeds` needs the same one."
+    ),
+    new_fraction: float = typer.Option(
+        REPLAY_NEW_FRACTION, help="The fraction of comics with new entries."
+    ),
+) -> None:
+    """Adds made-up comics like the real ones to the database, for scale tests."""
+    from rss_to_webhook import synthetic  # noqa: PLC0415 # Slow
+
+    synthetic.generate(
+        comics,
+        collection=collection,
+        feeds_url=feeds_url,
+        seed=seed,
+        new_fraction=new_fraction,
+    )
+
+
+@app.command("serve-feeds")
+def serve_feeds(
+    port: int = typer.Option(8081, help="The port to listen on."),
+    seed: int = typer.Option(0, help="The seed the comics were made up from."),
+    latency: float | None = typer.Option(
+        None,
+        help="Seconds to wait before each response. Defaults to each feed's own.",
+    ),
+) -> None:
+    """Serves the feeds of the comics made up by `generate-comics`."""
+    from rss_to_webhook import synthetic  # noqa: PLC0415 # Slow
+
+    synthetic.serve(port, seed, latency)
 
 
 @app.callback()
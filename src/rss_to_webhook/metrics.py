@@ -0,0 +1,265 @@
+"""Counts what the bot does, in a form Prometheus can read.
+
+The checks count feed fetches, diffs, posts, and rate limits in the metrics
+below as they go, and `write_textfile` writes them out at the end of a run in
+Prometheus's text format, for node_exporter's textfile collector to pick up.
+
+Every label has a fixed set of values, given when the metric is made, so the
+number of time series can't grow with the number of comics or with whatever
+status codes feeds come up with. Nothing is labelled with a comic's title.
+
+The metrics are kept for the whole process, like with the official Prometheus
+client, so that anything can count things without needing to be passed
+somewhere to count them in.
+"""
+
+from __future__ import annotations
+
+import abc
+import bisect
+import math
+import os
+import threading
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:  # pragma: no cover
+    from collections.abc import Iterator, Sequence
+    from pathlib import Path
+
+#: Every metric made so far, by name
+REGISTRY: dict[str, Metric] = {}
+
+
+class Metric(abc.ABC):
+    """A metric, whose value for each combination of labels is kept separately.
+
+    Attributes:
+        name: The metric's name, which is prefixed with `rss_to_webhook_`.
+        help: What the metric counts.
+        labels: Each label's name and the values it can have.
+    """
+
+    kind: str
+    name: str
+    help: str
+    labels: dict[str, frozenset[str]]
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labels: dict[str, Sequence[str]] | None = None,
+        registry: dict[str, Metric] | None = None,
+    ) -> None:
+        """Makes a metric and adds it to `registry`, or else the `REGISTRY`."""
+        self.name = f"rss_to_webhook_{name}"
+        self.help = help_text
+        self.labels = {
+            label: frozenset(values) for label, values in (labels or {}).items()
+        }
+        self._lock = threading.Lock()
+        (REGISTRY if registry is None else registry)[self.name] = self
+
+    def _key(self, label_values: dict[str, str]) -> tuple[str, ...]:
+        if label_values.keys() != self.labels.keys():
+            msg = f"{self.name} needs the labels {sorted(self.labels)}"
+            raise ValueError(msg)
+        for label, value in label_values.items():
+            if value not in self.labels[label]:
+                msg = f"{value!r} isn't one of the values of {self.name}'s {label}"
+                raise ValueError(msg)
+        return tuple(label_values[label] for label in self.labels)
+
+    def _format_labels(self, key: tuple[str, ...], **extra: str) -> str:
+        pairs = [*zip(self.labels, key, strict=True), *extra.items()]
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{label}="{value}"' for label, value in pairs) + "}"
+
+    @abc.abstractmethod
+    def reset(self) -> None:
+        """Forgets everything counted so far."""
+
+    @abc.abstractmethod
+    def samples(self) -> Iterator[str]:
+        """Gets a line of Prometheus's text format for each of the metric's values."""
+
+
+class Counter(Metric):
+    """A total that only goes up, like the number of posts made."""
+
+    kind = "counter"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labels: dict[str, Sequence[str]] | None = None,
+        registry: dict[str, Metric] | None = None,
+    ) -> None:
+        """Makes a counter that starts at zero."""
+        super().__init__(name, help_text, labels, registry)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **label_values: str) -> None:
+        """Adds `amount` to the total for the given labels."""
+        key = self._key(label_values)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **label_values: str) -> float:
+        """Gets the total for the given labels."""
+        return self._values.get(self._key(label_values), 0)
+
+    def reset(self) -> None:
+        """Forgets every total."""
+        with self._lock:
+            self._values.clear()
+
+    def samples(self) -> Iterator[str]:
+        """Gets a `_total` sample for each set of labels."""
+        for key, value in sorted(self._values.items()):
+            yield f"{self.name}_total{self._format_labels(key)} {value:g}"
+
+
+class Histogram(Metric):
+    """Counts how many observations, like response times, fall into each bucket.
+
+    Attributes:
+        buckets: The upper bound of each bucket, in increasing order.
+    """
+
+    kind = "histogram"
+    buckets: tuple[float, ...]
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        buckets: Sequence[float],
+        labels: dict[str, Sequence[str]] | None = None,
+        registry: dict[str, Metric] | None = None,
+    ) -> None:
+        """Makes a histogram with no observations."""
+        super().__init__(name, help_text, labels, registry)
+        self.buckets = (*sorted(buckets), math.inf)
+        self._counts: dict[tuple[str, ...], list[int]] = {}
+        self._sums: dict[tuple[str, ...], float] = {}
+
+    def observe(self, value: float, **label_values: str) -> None:
+        """Counts `value` in the bucket it falls into."""
+        key = self._key(label_values)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._counts.setdefault(key, [0] * len(self.buckets))
+            counts[index] += 1
+            self._sums[key] = self._sums.get(key, 0) + value
+
+    def count(self, **label_values: str) -> int:
+        """Gets how many values have been observed for the given labels."""
+        return sum(self._counts.get(self._key(label_values), []))
+
+    def reset(self) -> None:
+        """Forgets every observation."""
+        with self._lock:
+            self._counts.clear()
+            self._sums.clear()
+
+    def samples(self) -> Iterator[str]:
+        """Gets the cumulative buckets, sum and count for each set of labels."""
+        for key, counts in sorted(self._counts.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts, strict=True):
+                cumulative += count
+                labels = self._format_labels(
+                    key, le="+Inf" if bound == math.inf else f"{bound:g}"
+                )
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            yield f"{self.name}_sum{self._format_labels(key)} {self._sums[key]:g}"
+            yield f"{self.name}_count{self._format_labels(key)} {cumulative}"
+
+
+#: The classes HTTP statuses are counted in
+STATUS_CLASSES = ("1xx", "2xx", "3xx", "4xx", "5xx", "other")
+
+#: What can happen when a feed is checked
+FEED_RESULTS = ("not_modified", "hash_match", "changed", "error")
+
+FEED_CHECKS = Counter(
+    "feed_checks",
+    "Feeds checked, by what happened. The hash hit rate is hash_match over the"
+    " responses that weren't not_modified.",
+    {"result": FEED_RESULTS},
+)
+FEED_RESPONSES = Counter(
+    "feed_responses",
+    "Responses to feed requests, by HTTP status class.",
+    {"status": STATUS_CLASSES},
+)
+FEED_FETCH_SECONDS = Histogram(
+    "feed_fetch_seconds",
+    "Seconds from requesting a feed until its body was read.",
+    (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+FEED_BYTES = Counter("feed_bytes", "Bytes of feeds downloaded.")
+DIFFS = Counter(
+    "diffs",
+    "Changed feeds, by whether they had new entries.",
+    {"result": ("new_entries", "no_new_entries")},
+)
+NEW_ENTRIES = Counter("new_entries", "New entries found in feeds.")
+POSTS = Counter(
+    "posts",
+    "Posts to Discord, by HTTP status class.",
+    {"status": STATUS_CLASSES},
+)
+POST_SECONDS = Histogram(
+    "post_seconds",
+    "Seconds each post to Discord took, not counting rate-limit sleeps.",
+    (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+RATE_LIMITED = Counter(
+    "rate_limited", "Posts Discord rejected with 429 Too Many Requests."
+)
+RATE_LIMIT_SLEEPS = Counter("rate_limit_sleeps", "Times posting slept for rate limits.")
+RATE_LIMIT_SLEEP_SECONDS = Counter(
+    "rate_limit_sleep_seconds", "Seconds spent sleeping for rate limits."
+)
+LOG_BYTES = Counter("log_bytes", "Bytes of logs written.")
+
+
+def status_class(status: int) -> str:
+    """Gets the class of an HTTP status, like `"4xx"`, to use as a label."""
+    if 100 <= status < 600:  # noqa: PLR2004 # The range of HTTP statuses
+        return f"{status // 100}xx"
+    return "other"
+
+
+def render() -> str:
+    """Gets every metric in Prometheus's text format."""
+    lines: list[str] = []
+    for metric in REGISTRY.values():
+        name = f"{metric.name}_total" if metric.kind == "counter" else metric.name
+        lines.extend((
+            f"# HELP {name} {metric.help}",
+            f"# TYPE {name} {metric.kind}",
+        ))
+        lines.extend(metric.samples())
+    return "\n".join(lines) + "\n"
+
+
+def write_textfile(path: Path) -> None:
+    """Writes every metric to `path`, for node_exporter's textfile collector.
+
+    The metrics are written to a temporary file which then replaces `path`, so
+    the collector never reads a half-written file.
+    """
+    temporary = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    temporary.write_text(render(), encoding="utf-8")
+    temporary.replace(path)
+
+
+def reset() -> None:
+    """Forgets everything counted so far."""
+    for metric in REGISTRY.values():
+        metric.reset()
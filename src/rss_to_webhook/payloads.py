@@ -0,0 +1,91 @@
+"""Webhook payloads that are serialised to JSON once and then reused.
+
+Every message we post is logged, posted to the main channel, and often posted
+to a thread without its `content` as well. Rather than letting each of those
+serialise the message again, an `EncodedMessage` holds the JSON bytes, and
+the thread variant is sliced out of them rather than encoded separately.
+
+[orjson](https://github.com/ijl/orjson) is used when it's installed (it's in
+the `fast` extra), and the standard library's `json` module otherwise.
+"""
+
+from __future__ import annotations
+
+import json
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any
+
+try:
+    import orjson
+
+    HAS_ORJSON = True
+except ImportError:  # pragma: no cover
+    HAS_ORJSON = False
+
+if TYPE_CHECKING:  # pragma: no cover
+    from rss_to_webhook.discord_types import Message
+
+#: Headers for posting an already-encoded JSON body.
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+
+def dumps(obj: Any) -> bytes:  # noqa: ANN401
+    """Serialises `obj` to compact UTF-8 JSON, using orjson if it's available."""
+    if HAS_ORJSON:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+def loads(data: bytes) -> Any:  # noqa: ANN401
+    """Parses JSON, using orjson if it's available."""
+    if HAS_ORJSON:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+@dataclass(frozen=True, slots=True)
+class EncodedMessage:
+    """A `Message` that has already been serialised to JSON.
+
+    The message is encoded without its `content`, and the `content` is
+    encoded separately and spliced onto the front when the full message is
+    needed. This makes `without_content`, which is what gets posted to threads,
+    free.
+
+    Attributes:
+        body: The message without its `content`, as JSON.
+        content: The message's `content` as a JSON string, or `None` if it had none.
+    """
+
+    body: bytes
+    content: bytes | None = None
+
+    @classmethod
+    def encode(cls, message: Message) -> EncodedMessage:
+        """Serialises a message."""
+        if "content" not in message:
+            return cls(dumps(message))
+        rest = {key: value for key, value in message.items() if key != "content"}
+        return cls(dumps(rest), dumps(message["content"]))
+
+    @property
+    def data(self) -> bytes:
+        """The full message as JSON, ready to post."""
+        if self.content is None:
+            return self.body
+        if self.body == b"{}":
+            return b'{"content":' + self.content + b"}"
+        return b'{"content":' + self.content + b"," + self.body[1:]
+
+    def without_content(self) -> EncodedMessage:
+        """The message without its `content`, for posting to threads."""
+        return EncodedMessage(self.body)
+
+    def decode(self) -> Message:
+        """Parses the message back into a dictionary."""
+        message: Message = loads(self.data)
+        return message
+
+    def __str__(self) -> str:
+        """The full message as a JSON string, for logging."""
+        return self.data.decode()
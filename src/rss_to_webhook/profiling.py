@@ -0,0 +1,150 @@
+"""Profiles a run, to find out where the time goes when it's slow.
+
+`profile` runs a block under cProfile and writes the stats to a file, which can
+be explored with `python -m pstats` or a viewer like snakeviz. It also prints
+the functions that took longest, and how long the asyncio tasks that checked
+feeds took, since cProfile counts a coroutine's time in pieces every time it's
+resumed rather than for the task as a whole.
+
+cProfile only sees the thread it was started in, so database calls made by the
+thread pools show up as time spent waiting for them.
+
+Runs can be profiled offline by pointing them at local stand-ins for
+everything they talk to: `SQLITE_PATH` for the database, the webhook URLs at
+`discord_emulator`, and comics' feed URLs at a local server such as
+`python -m http.server`.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import cProfile
+import pstats
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:  # pragma: no cover
+    from collections.abc import Coroutine, Generator, Iterator
+    from pathlib import Path
+
+#: How many functions and tasks are shown in a profile's summary
+PROFILE_TOP = 25
+
+
+@dataclass(slots=True)
+class TaskStats:
+    """How long every asyncio task running one coroutine function took.
+
+    Attributes:
+        coroutine: The coroutine function's qualified name.
+        count: How many tasks ran it.
+        total: The seconds from each task being created until it finished,
+            added up.
+        slowest: The seconds the slowest task took.
+        slowest_name: The name of the slowest task, which is the comic's title
+            for tasks that check a feed.
+    """
+
+    coroutine: str
+    count: int = 0
+    total: float = 0
+    slowest: float = 0
+    slowest_name: str = ""
+
+
+@dataclass(slots=True)
+class TaskTimings:
+    """Times every task created by event loops while profiling.
+
+    Attributes:
+        tasks: How long the tasks running each coroutine function took, by its
+            qualified name.
+    """
+
+    tasks: dict[str, TaskStats] = field(default_factory=dict)
+
+    def task_factory(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        coro: Coroutine[Any, Any, Any],
+        **kwargs: Any,  # noqa: ANN401
+    ) -> asyncio.Task[Any]:
+        """Creates a task like normal, recording how long it took when it's done."""
+        task = asyncio.Task(coro, loop=loop, **kwargs)
+        coroutine = getattr(coro, "__qualname__", type(coro).__name__)
+        start = time.perf_counter()
+
+        def finished(task: asyncio.Task[Any]) -> None:
+            seconds = time.perf_counter() - start
+            stats = self.tasks.setdefault(coroutine, TaskStats(coroutine))
+            stats.count += 1
+            stats.total += seconds
+            if seconds >= stats.slowest:
+                stats.slowest = seconds
+                stats.slowest_name = task.get_name()
+
+        task.add_done_callback(finished)
+        return task
+
+    def slowest(self, top: int = PROFILE_TOP) -> list[TaskStats]:
+        """Gets the coroutine functions whose tasks took longest in total."""
+        return sorted(self.tasks.values(), key=lambda stats: stats.total, reverse=True)[
+            :top
+        ]
+
+
+class _TimedTaskPolicy(asyncio.DefaultEventLoopPolicy):
+    """Makes event loops whose tasks are timed by `timings`."""
+
+    def __init__(self, timings: TaskTimings) -> None:
+        super().__init__()
+        self.timings = timings
+
+    def new_event_loop(self) -> asyncio.AbstractEventLoop:
+        loop = super().new_event_loop()
+        loop.set_task_factory(self.timings.task_factory)  # type: ignore [arg-type]
+        return loop
+
+
+@contextmanager
+def _timed_tasks() -> Iterator[TaskTimings]:
+    """Times every task in event loops created inside the block."""
+    timings = TaskTimings()
+    policy = asyncio.get_event_loop_policy()
+    asyncio.set_event_loop_policy(_TimedTaskPolicy(timings))
+    try:
+        yield timings
+    finally:
+        asyncio.set_event_loop_policy(policy)
+
+
+@contextmanager
+def profile(path: Path, top: int = PROFILE_TOP) -> Generator[None, None, None]:
+    """Profiles the block, writing the stats to `path` and printing a summary.
+
+    The summary is written even if the block raises, so failed runs can be
+    profiled too.
+
+    Args:
+        path: Where to write the stats, in the format read by `pstats`.
+        top: How many functions and kinds of task to show.
+    """
+    profiler = cProfile.Profile()
+    with _timed_tasks() as tasks:
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(path)
+            print(f"Wrote profile to {path}")
+            stats = pstats.Stats(profiler)
+            stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(top)
+            print("Asyncio tasks by total time:")
+            for task in tasks.slowest(top):
+                print(
+                    f"{task.coroutine}: {task.count} tasks, {task.total:.3f}s in total."
+                    f" Slowest {task.slowest:.3f}s ({task.slowest_name})"
+                )
@@ -0,0 +1,654 @@
+"""Replays recorded feeds through the checks offline, to benchmark whole runs.
+
+The benchmarks in the tests time one comic at a time against mocked responses.
+This runs the real regular and daily checks over thousands of comics, with
+their feeds served by a local HTTP server and their posts made to a
+`discord_emulator.DiscordEmulator`, and reports how long each run took, how
+many comics it got through per second, and its peak memory.
+
+The feeds come from a `FeedSource`, which also stores the comics that use
+them. A `synthetic.SyntheticCollection` makes up as many comics as it's asked
+for, and a `Corpus` is a directory of feeds recorded by `record`, with a
+`corpus.json` manifest of each feed's URL, status, headers, and how long it
+took to arrive. Feeds can be recorded from every comic in the database with
+`rss-to-webhook record-feeds`, but they belong to their authors, so none are
+kept in the repo. `sample_corpus` makes a corpus of generated feeds in the
+shapes that cost the most in real ones instead: large full-text feeds,
+malformed feeds, slow feeds, feeds with caching headers, and feeds that fail.
+
+Each size gets a fresh SQLite database of comics, each with its own feed at its
+own URL. Most comics are already up to date, with their feed's entries, hash
+and caching headers stored, and the rest are missing their newest entries, so
+they post them and queue them for the daily checks. The regular checks and
+then the daily checks are each run in a new process, so each one's peak memory
+is its own.
+
+Discord's rate limits are emulated with their windows shortened, and each run's
+`RateLimiter` is shortened to match, so rate-limit sleeps are part of the
+results without taking minutes.
+"""
+
+from __future__ import annotations
+
+import abc
+import asyncio
+import json
+import multiprocessing
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from datetime import UTC, datetime, timedelta
+from email.utils import format_datetime
+from http import HTTPStatus
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+import requests
+from aiohttp import web
+from bson import ObjectId
+from dotenv import load_dotenv
+
+from rss_to_webhook import metrics
+from rss_to_webhook.check_feeds_and_update import (
+    RateLimiter,
+    daily_checks,
+    regular_checks,
+    strip_extra_data,
+)
+from rss_to_webhook.constants import (
+    DEFAULT_GET_HEADERS,
+    HASH_SEED,
+    LOOKBACK_LIMIT,
+    MAX_CACHED_ENTRIES,
+    REPLAY_NEW_FRACTION,
+    REPLAY_SIZES,
+    REPLAY_TIME_SCALE,
+    CheckType,
+)
+from rss_to_webhook.discord_emulator import (
+    DiscordEmulator,
+    EmulatedWebhook,
+    serve_app_in_thread,
+)
+from rss_to_webhook.logs import logger, logging_to
+from rss_to_webhook.storage import SQLiteStorage, Storage, from_environment
+from rss_to_webhook.timing import Timings
+
+if TYPE_CHECKING:  # pragma: no cover
+    from collections.abc import Iterable, Iterator, Sequence
+
+    from rss_to_webhook.db_types import Comic
+
+#: The name of a corpus's manifest
+MANIFEST = "corpus.json"
+
+#: The response headers kept when a feed is recorded
+RECORDED_HEADERS = ("Content-Type", "ETag", "Last-Modified")
+
+#: The thread posted to by comics that have one
+THREAD_ID = 3000
+
+#: One comic in this many has a thread
+THREAD_EVERY = 10
+
+
+@dataclass(frozen=True, slots=True)
+class RecordedFeed:
+    """A feed as it was served when it was recorded.
+
+    Attributes:
+        file: The name of the file the body is kept in.
+        url: Where the feed was recorded from.
+        status: The HTTP status it was served with.
+        headers: The headers in `RECORDED_HEADERS` it was served with.
+        latency: How many seconds it took to arrive.
+        body: The feed itself, decompressed.
+    """
+
+    file: str
+    url: str
+    status: int
+    headers: dict[str, str]
+    latency: float
+    body: bytes = field(repr=False)
+
+    def text(self) -> str:
+        """Decodes the body with the charset it was served with, like aiohttp."""
+        _, _, charset = self.headers.get("Content-Type", "").partition("charset=")
+        charset = charset.split(";")[0].strip().strip('"') or "utf-8"
+        return self.body.decode(charset, errors="replace")
+
+
+class FeedSource(abc.ABC):
+    """Where the feeds of a collection of comics come from.
+
+    Comics are numbered from 0, and each one's feed is served at its own URL
+    (see `FeedServer.feed_url`).
+    """
+
+    @abc.abstractmethod
+    def feed(self, number: int) -> RecordedFeed:
+        """Gets the feed of comic `number`."""
+
+    @abc.abstractmethod
+    def fill(
+        self,
+        storage: Storage,
+        base_url: str,
+        comics: int,
+        *,
+        new_fraction: float = REPLAY_NEW_FRACTION,
+    ) -> None:
+        """Adds `comics` comics to `storage`, with their feeds served at `base_url`.
+
+        Each comic is stored as the regular checks would have left it after the
+        last time its feed changed, except that `new_fraction` of them are
+        missing their newest entries and have no caching information, so their
+        next check finds new entries.
+        """
+
+
+@dataclass(slots=True)
+class Corpus(FeedSource):
+    """A directory of recorded feeds, which comics use in turn.
+
+    Attributes:
+        directory: Where the feeds and their manifest are kept.
+        feeds: Every feed in the corpus.
+    """
+
+    directory: Path
+    feeds: list[RecordedFeed]
+
+    @classmethod
+    def load(cls, directory: Path) -> Corpus:
+        """Reads the corpus in `directory`."""
+        manifest = json.loads((directory / MANIFEST).read_text(encoding="utf-8"))
+        feeds = [
+            RecordedFeed(**feed, body=(directory / feed["file"]).read_bytes())
+            for feed in manifest["feeds"]
+        ]
+        return cls(directory, feeds)
+
+    def save(self) -> None:
+        """Writes every feed and the manifest to the corpus's directory."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        manifest: list[dict[str, Any]] = []
+        for feed in self.feeds:
+            (self.directory / feed.file).write_bytes(feed.body)
+            entry = asdict(feed)
+            del entry["body"]
+            manifest.append(entry)
+        (self.directory / MANIFEST).write_text(
+            json.dumps({"feeds": manifest}, indent=2), encoding="utf-8"
+        )
+
+    def feed(self, number: int) -> RecordedFeed:
+        """Gets the recorded feeds in turn, starting again once they run out."""
+        return self.feeds[number % len(self.feeds)]
+
+    def fill(
+        self,
+        storage: Storage,
+        base_url: str,
+        comics: int,
+        *,
+        new_fraction: float = REPLAY_NEW_FRACTION,
+    ) -> None:
+        """Stores a comic for each feed in turn, named after the feed's title."""
+        import feedparser  # noqa: PLC0415 # Only needed to fill storage
+        import mmh3  # noqa: PLC0415 # Only needed to fill storage
+
+        feeds: list[tuple[str, list[Any], bytes]] = []
+        for feed in self.feeds:
+            text = feed.text()
+            parsed = feedparser.parse(text)
+            title = parsed["feed"].get("title") or Path(feed.file).stem
+            feeds.append((title, parsed["entries"], mmh3.hash_bytes(text, HASH_SEED)))
+        chooser = random.Random(0)  # noqa: S311 # Not for security
+        for number in range(comics):
+            title, entries, feed_hash = feeds[number % len(feeds)]
+            feed = self.feed(number)
+            comic: Comic = {
+                "_id": ObjectId(),
+                "title": f"{title} {number}",
+                "feed_url": FeedServer.feed_url(base_url, number),
+                "role_id": 1000 + number,
+                "last_entries": [],
+                "feed_hash": feed_hash,
+            }
+            if number % THREAD_EVERY == 0:
+                comic["thread_id"] = THREAD_ID
+            if entries and chooser.random() < new_fraction:
+                entries = entries[1:]
+                comic["feed_hash"] = b""
+            else:
+                comic.update(caching_headers(feed))  # type: ignore [typeddict-item]
+            seen = strip_extra_data(list(reversed(entries[:LOOKBACK_LIMIT])))
+            comic["last_entries"] = seen[-MAX_CACHED_ENTRIES:]
+            storage.insert_comic(comic)
+
+
+def caching_headers(feed: RecordedFeed) -> dict[str, str]:
+    """Gets a feed's caching headers, as the fields a comic stores them in."""
+    fields = {"ETag": "etag", "Last-Modified": "last_modified"}
+    return {
+        field: feed.headers[header]
+        for header, field in fields.items()
+        if header in feed.headers
+    }
+
+
+def record(urls: Iterable[str], directory: Path, timeout: float = 30) -> Corpus:
+    """Fetches each feed in `urls` and saves them as a corpus in `directory`.
+
+    Feeds that can't be fetched at all are left out, but error responses are
+    kept, since real runs get them too.
+    """
+    feeds: list[RecordedFeed] = []
+    with requests.Session() as session:
+        for url in urls:
+            start = time.perf_counter()
+            try:
+                response = session.get(
+                    url, headers=DEFAULT_GET_HEADERS, timeout=timeout
+                )
+            except requests.RequestException as e:
+                logger.warning("Couldn't record %s. %s: %s", url, type(e).__name__, e)
+                continue
+            feeds.append(
+                RecordedFeed(
+                    file=f"{len(feeds):05}.xml",
+                    url=url,
+                    status=response.status_code,
+                    headers={
+                        name: response.headers[name]
+                        for name in RECORDED_HEADERS
+                        if name in response.headers
+                    },
+                    latency=time.perf_counter() - start,
+                    body=response.content,
+                )
+            )
+            logger.info("Recorded %s: %d", url, response.status_code)
+    corpus = Corpus(directory, feeds)
+    corpus.save()
+    return corpus
+
+
+def record_from_database(directory: Path) -> None:
+    """Records every comic's feed to a corpus in `directory`.
+
+    This is run by `rss-to-webhook record-feeds` (see `main.record_feeds`).
+    """
+    load_dotenv()
+    with from_environment() as storage:
+        urls = [
+            comic["feed_url"] for batch in storage.load_summaries() for comic in batch
+        ]
+    with logging_to(sys.stdout):
+        corpus = record(urls, directory)
+    print(f"Recorded {len(corpus.feeds)} of {len(urls)} feeds to {directory}")
+
+
+def sample_corpus(directory: Path) -> Corpus:
+    """Writes a corpus of generated feeds to `directory`.
+
+    There's one feed of each shape that matters to the checks: a typical RSS
+    feed with caching headers, an Atom feed without them, a feed of 1,000
+    full-text entries, a malformed feed, a slow feed, and two that fail.
+    """
+    rss = "application/rss+xml; charset=utf-8"
+    caching = {
+        "ETag": '"5e1-62a0c9e4"',
+        "Last-Modified": "Sat, 05 Oct 2024 12:00:00 GMT",
+    }
+    # Unescaped ampersands, an unclosed tag, and no end
+    malformed = _rss("malformed", 30).replace("Page ", "Page & ")
+    malformed = malformed.replace("</title>", "", 1).removesuffix("</channel></rss>")
+    feeds = [
+        ("typical", 200, {"Content-Type": rss, **caching}, 0.1, _rss("typical", 20)),
+        (
+            "atom",
+            200,
+            {"Content-Type": "application/atom+xml; charset=utf-8"},
+            0.1,
+            _atom("atom", 50),
+        ),
+        ("large", 200, {"Content-Type": rss}, 0.5, _rss("large", 1000, 2000)),
+        ("malformed", 200, {"Content-Type": rss}, 0.1, malformed),
+        ("slow", 200, {"Content-Type": rss}, 2, _rss("slow", 20)),
+        ("error", 500, {"Content-Type": "text/plain"}, 0.1, "Internal Server Error"),
+        ("missing", 404, {"Content-Type": "text/html"}, 0.1, "<h1>Not Found</h1>"),
+    ]
+    corpus = Corpus(
+        directory,
+        [
+            RecordedFeed(
+                file=f"{name}.xml",
+                url=f"https://{name}.example/feed",
+                status=status,
+                headers=headers,
+                latency=latency,
+                body=body.encode(),
+            )
+            for name, status, headers, latency, body in feeds
+        ],
+    )
+    corpus.save()
+    return corpus
+
+
+_PUBLISHED = datetime(2024, 10, 5, 12, tzinfo=UTC)
+
+
+def _rss(name: str, entries: int, description_size: int = 100) -> str:
+    """Makes an RSS feed of `entries` pages, newest first."""
+    items = "".join(
+        f"<item><title>Page {page}</title>"
+        f"<link>https://{name}.example/comic/page-{page}</link>"
+        f"<guid>https://{name}.example/comic/page-{page}</guid>"
+        f"<pubDate>{format_datetime(_PUBLISHED - timedelta(days=page), usegmt=True)}"
+        f"</pubDate><description>{'Words ' * (description_size // 6)}</description>"
+        "</item>"
+        for page in range(entries, 0, -1)
+    )
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?><rss version="2.0"><channel>'
+        f"<title>{name.title()}</title><link>https://{name}.example/</link>"
+        f"<description>A comic</description>{items}</channel></rss>"
+    )
+
+
+def _atom(name: str, entries: int) -> str:
+    """Makes an Atom feed of `entries` pages, newest first."""
+    items = "".join(
+        f"<entry><title>Page {page}</title>"
+        f'<link href="https://{name}.example/comic/page-{page}" rel="alternate"/>'
+        f"<id>https://{name}.example/comic/page-{page}</id>"
+        f"<updated>{(_PUBLISHED - timedelta(days=page)).isoformat()}</updated>"
+        "</entry>"
+        for page in range(entries, 0, -1)
+    )
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<feed xmlns="http://www.w3.org/2005/Atom">'
+        f"<title>{name.title()}</title><id>https://{name}.example/</id>"
+        f"<updated>{_PUBLISHED.isoformat()}</updated>{items}</feed>"
+    )
+
+
+@dataclass(slots=True)
+class FeedServer:
+    """Serves comics' feeds over HTTP, like the sites they came from.
+
+    Every comic gets its own URL (see `feed_url`). Feeds with an ETag or
+    Last-Modified header get a 304 Not Modified when they're sent back.
+
+    Attributes:
+        source: The feeds to serve.
+        latency: Seconds to wait before each response, or `None` to wait as
+            long as each feed took when it was recorded.
+        requests: How many requests have been served.
+    """
+
+    source: FeedSource
+    latency: float | None = None
+    requests: int = 0
+
+    def app(self) -> web.Application:
+        """Makes an aiohttp application serving the feeds."""
+        app = web.Application()
+        app.router.add_get("/feeds/{number}{path:.*}", self._feed)
+        return app
+
+    @contextmanager
+    def serve_in_thread(self, host: str = "127.0.0.1", port: int = 0) -> Iterator[str]:
+        """Serves the feeds from a background thread.
+
+        Yields:
+            The base URL of the server, like `http://127.0.0.1:8080`.
+        """
+        with serve_app_in_thread(self.app(), host, port) as base_url:
+            yield base_url
+
+    @staticmethod
+    def feed_url(base_url: str, number: int, path: str = "") -> str:
+        """Gets the URL of the feed for comic `number`.
+
+        Anything in `path`, which should start with a `/`, is ignored by the
+        server, so URLs can look like the ones they stand in for.
+        """
+        return f"{base_url}/feeds/{number}{path}"
+
+    async def _feed(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        feed = self.source.feed(int(request.match_info["number"]))
+        await asyncio.sleep(feed.latency if self.latency is None else self.latency)
+        etag = feed.headers.get("ETag")
+        last_modified = feed.headers.get("Last-Modified")
+        if feed.status == HTTPStatus.OK and (
+            (etag is not None and request.headers.get("If-None-Match") == etag)
+            or (
+                last_modified is not None
+                and request.headers.get("If-Modified-Since") == last_modified
+            )
+        ):
+            caching = {
+                name: value
+                for name, value in feed.headers.items()
+                if name in {"ETag", "Last-Modified"}
+            }
+            return web.Response(status=HTTPStatus.NOT_MODIFIED, headers=caching)
+        return web.Response(body=feed.body, status=feed.status, headers=feed.headers)
+
+
+@dataclass(frozen=True, slots=True)
+class ReplayResult:
+    """How one replayed run went.
+
+    Attributes:
+        check_type: Which checks were run, `regular` or `daily`.
+        comics: How many comics were in the database.
+        seconds: How long the checks took, from start to finish.
+        peak_memory: The most memory the process ever used, in bytes, or
+            `None` on systems that can't tell.
+        posts: How many posts were made.
+        errors: How many feeds failed.
+        rate_limit_sleep: Seconds spent sleeping for rate limits.
+    """
+
+    check_type: str
+    comics: int
+    seconds: float
+    peak_memory: int | None
+    posts: int
+    errors: int
+    rate_limit_sleep: float
+
+    @property
+    def comics_per_second(self) -> float:
+        """How many comics were got through per second."""
+        return self.comics / self.seconds
+
+
+def replay(  # noqa: PLR0913
+    source: FeedSource,
+    sizes: Sequence[int] = REPLAY_SIZES,
+    *,
+    latency: float | None = None,
+    new_fraction: float = REPLAY_NEW_FRACTION,
+    time_scale: float = REPLAY_TIME_SCALE,
+    pack: bool = False,
+    log_level: str = "ERROR",
+) -> list[ReplayResult]:
+    """Runs the regular and then the daily checks on databases of each size.
+
+    Args:
+        source: The feeds to serve, like a `Corpus`.
+        sizes: How many comics to run the checks on, in turn.
+        latency: Seconds to wait before serving each feed, or `None` to wait as
+            long as each feed took when it was recorded.
+        new_fraction: The fraction of comics with a new entry.
+        time_scale: How much shorter to make Discord's rate-limiting windows.
+        pack: Whether the regular checks pack posts (see `drain_outbox`).
+        log_level: The lowest level the checks log at, to stderr.
+
+    Returns:
+        How each run went, with each size's regular checks before its daily
+        checks.
+    """
+    server = FeedServer(source, latency)
+    webhooks = [
+        EmulatedWebhook(id=1000 + i, token=f"token-{i}", channel_id=2000 + i)
+        for i in range(3)
+    ]
+    emulator = DiscordEmulator(webhooks, threads={webhooks[1].channel_id: {THREAD_ID}})
+    emulator.bucket_window *= time_scale
+    emulator.hidden_window *= time_scale
+    results: list[ReplayResult] = []
+    with (
+        server.serve_in_thread() as feeds_url,
+        emulator.serve_in_thread() as discord_url,
+        tempfile.TemporaryDirectory() as directory,
+    ):
+        webhook_url, thread_webhook_url, daily_webhook_url = (
+            DiscordEmulator.webhook_url(discord_url, webhook) for webhook in webhooks
+        )
+        for size in sizes:
+            path = Path(directory) / f"{size}.db"
+            with SQLiteStorage(path) as storage:
+                source.fill(storage, feeds_url, size, new_fraction=new_fraction)
+            for check_type in (CheckType.regular, CheckType.daily):
+                # A new process for each run, so their peak memory is their own
+                with ProcessPoolExecutor(
+                    1, mp_context=multiprocessing.get_context("spawn")
+                ) as process:
+                    result = process.submit(
+                        _run_checks,
+                        path,
+                        check_type,
+                        size,
+                        (webhook_url, thread_webhook_url, daily_webhook_url),
+                        time_scale,
+                        pack=pack,
+                        log_level=log_level,
+                    ).result()
+                results.append(result)
+    return results
+
+
+def _run_checks(  # noqa: PLR0913
+    path: Path,
+    check_type: CheckType,
+    comics: int,
+    webhook_urls: tuple[str, str, str],
+    time_scale: float,
+    *,
+    pack: bool,
+    log_level: str,
+) -> ReplayResult:
+    """Runs one replayed run, in its own process."""
+    webhook_url, thread_webhook_url, daily_webhook_url = webhook_urls
+    timings = Timings()
+    rate_limiter = RateLimiter(timings=timings)
+    rate_limiter.fuzzed_window = RateLimiter.fuzzed_window * time_scale
+    with (
+        logging_to(sys.stderr, log_level),
+        SQLiteStorage(path) as storage,
+        rate_limiter,
+    ):
+        start = time.perf_counter()
+        if check_type == CheckType.daily:
+            daily_checks(
+                storage, daily_webhook_url, timings=timings, rate_limiter=rate_limiter
+            )
+        else:
+            regular_checks(
+                storage,
+                HASH_SEED,
+                webhook_url,
+                thread_webhook_url,
+                pack=pack,
+                timings=timings,
+                rate_limiter=rate_limiter,
+            )
+        seconds = time.perf_counter() - start
+    return ReplayResult(
+        check_type=check_type.value,
+        comics=comics,
+        seconds=seconds,
+        peak_memory=_peak_memory(),
+        posts=int(
+            sum(metrics.POSTS.value(status=status) for status in metrics.STATUS_CLASSES)
+        ),
+        errors=int(metrics.FEED_CHECKS.value(result="error")),
+        rate_limit_sleep=rate_limiter.slept,
+    )
+
+
+def _peak_memory() -> int | None:
+    """Gets the most memory this process has used, in bytes."""
+    try:
+        import resource  # noqa: PLC0415 # Not on Windows
+    except ImportError:  # pragma: no cover
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS counts in bytes, and everything else in kibibytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def show_replay(  # noqa: PLR0913
+    corpus_path: Path | None = None,
+    sizes: Sequence[int] = REPLAY_SIZES,
+    *,
+    synthetic: bool = False,
+    seed: int = 0,
+    latency: float | None = None,
+    new_fraction: float = REPLAY_NEW_FRACTION,
+    time_scale: float = REPLAY_TIME_SCALE,
+    pack: bool = False,
+) -> None:
+    """Replays feeds at each size and shows how each run went.
+
+    This is run by `rss-to-webhook replay` (see `main.replay_feeds`). If
+    `synthetic` is set, a `synthetic.SyntheticCollection` made from `seed` is
+    used. Otherwise the corpus at `corpus_path` is, or without one, the corpus
+    from `sample_corpus`.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        source: FeedSource
+        if synthetic:
+            from rss_to_webhook.synthetic import (  # noqa: PLC0415 # Imports this
+                SyntheticCollection,
+            )
+
+            source = SyntheticCollection(seed)
+        elif corpus_path is not None:
+            source = Corpus.load(corpus_path)
+        else:
+            source = sample_corpus(Path(directory))
+        results = replay(
+            source,
+            sizes,
+            latency=latency,
+            new_fraction=new_fraction,
+            time_scale=time_scale,
+            pack=pack,
+        )
+    for result in results:
+        memory = (
+            "unknown"
+            if result.peak_memory is None
+            else f"{result.peak_memory / 1_000_000:.0f}MB"
+        )
+        print(
+            f"{result.check_type} checks of {result.comics} comics:"
+            f" {result.seconds:.2f}s ({result.comics_per_second:.0f} comics/s),"
+            f" peak memory {memory}, {result.posts} posts, {result.errors} errors,"
+            f" {result.rate_limit_sleep:.2f}s sleeping for rate limits"
+        )
@@ -0,0 +1,313 @@
+"""Reports on how the bot has been running, from the command line.
+
+Everything here only reads from the database, through `storage.Storage`, so
+it's safe to run at any time, including while checks are running, and works on
+either backend.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import UTC, datetime, timedelta
+from statistics import fmean
+from typing import TYPE_CHECKING
+
+from dotenv import load_dotenv
+
+from rss_to_webhook.constants import COST_HALF_LIFE, REGRESSION_THRESHOLD, Cost
+from rss_to_webhook.costs import COST_FIELDS, weight
+from rss_to_webhook.storage import Storage, as_storage, from_environment
+
+if TYPE_CHECKING:  # pragma: no cover
+    from collections.abc import Sequence
+
+    from pymongo.collection import Collection
+
+    from rss_to_webhook.db_types import Comic, ComicCosts, RunRecord
+
+#: The totals from each run that are compared, in the order they're shown
+RUN_METRICS = (
+    "duration",
+    "comics",
+    "posts",
+    "downloaded_bytes",
+    "rate_limit_sleep",
+    "errors",
+)
+
+#: Metrics that only grow because there was more to do, so aren't regressions
+WORKLOAD_METRICS = frozenset({"comics", "posts", "downloaded_bytes"})
+
+
+@dataclass(slots=True)
+class ErrorRate:
+    """How often a comic's feed has failed over some period.
+
+    Attributes:
+        title: The comic's title.
+        errors: How many errors there were.
+        per_day: The average number of errors each day.
+        last_error: The most recent error.
+        last_error_at: When the most recent error happened.
+    """
+
+    title: str
+    errors: int
+    per_day: float
+    last_error: str
+    last_error_at: datetime
+
+
+def error_rates(
+    comics: Collection[Comic] | Storage, days: float = 7, limit: int = 20
+) -> list[ErrorRate]:
+    """Finds the comics whose feeds have failed most often recently.
+
+    This is counted from the stored errors (see `db_types.FeedError`), so it
+    can only look back as far as `constants.ERROR_RETENTION`.
+
+    Args:
+        comics: The storage containing all of the comics we track, or a MongoDB
+            collection of them.
+        days: How many days to look back.
+        limit: How many comics to report on.
+
+    Returns:
+        The comics with the most errors, most first.
+    """
+    since = datetime.now(tz=UTC) - timedelta(days=days)
+    return [
+        ErrorRate(
+            title=count.get("title", f"Deleted comic {count['_id']}"),
+            errors=count["errors"],
+            per_day=count["errors"] / days,
+            last_error=count["last_error"],
+            last_error_at=count["last_error_at"],
+        )
+        for count in as_storage(comics).error_counts(since, limit)
+    ]
+
+
+def show_error_rates(days: float = 7, limit: int = 20) -> None:
+    """Shows the comics whose feeds have failed most often recently.
+
+    This is run by `rss-to-webhook error-rates` (see `main.error_rates`).
+    """
+    load_dotenv()
+    with from_environment() as storage:
+        rates = error_rates(storage, days, limit)
+    if not rates:
+        print(f"No errors in the last {days:g} days")
+    for rate in rates:
+        print(
+            f"{rate.title}: {rate.errors} errors ({rate.per_day:.2f}/day)."
+            f" Last at {rate.last_error_at:%Y-%m-%d %H:%M}: {rate.last_error}"
+        )
+
+
+@dataclass(slots=True)
+class Trend:
+    """How one measurement of the runs has changed.
+
+    Attributes:
+        metric: What was measured. Phases of the runs are named `phase <name>`.
+        earlier: The average over the earlier runs.
+        recent: The average over the recent runs.
+        regressed: Whether the recent runs are worse by more than the threshold.
+    """
+
+    metric: str
+    earlier: float
+    recent: float
+    regressed: bool
+
+    @property
+    def change(self) -> float:
+        """How much the average has changed, as a fraction of the earlier one."""
+        if self.earlier == 0:
+            return 0 if self.recent == 0 else float("inf")
+        return self.recent / self.earlier - 1
+
+
+@dataclass(slots=True)
+class RunTrends:
+    """How the most recent runs compare to the ones before them.
+
+    Attributes:
+        recent_runs: How many runs count as recent.
+        earlier_runs: How many runs they're compared with.
+        trends: How each measurement has changed.
+    """
+
+    recent_runs: int
+    earlier_runs: int
+    trends: list[Trend]
+
+    @property
+    def regressions(self) -> list[Trend]:
+        """The measurements that have got worse by more than the threshold."""
+        return [trend for trend in self.trends if trend.regressed]
+
+
+def _averages(runs: Sequence[RunRecord]) -> tuple[dict[str, float], dict[str, float]]:
+    """Averages each of the runs' totals, and each of their phases.
+
+    Like MongoDB's `$avg`, runs without a measurement are left out of its
+    average, rather than counted as 0.
+
+    Returns:
+        The averages of the totals, and the averages of the phases.
+    """
+    totals: dict[str, float] = {}
+    for metric in RUN_METRICS:
+        measured = [run[metric] for run in runs if metric in run]  # type: ignore [literal-required]
+        totals[metric] = fmean(measured) if measured else 0
+    phases: dict[str, list[float]] = {}
+    for run in runs:
+        for phase, seconds in run["phases"].items():
+            phases.setdefault(phase, []).append(seconds)
+    return totals, {phase: fmean(seconds) for phase, seconds in phases.items()}
+
+
+def run_trends(
+    comics: Collection[Comic] | Storage,
+    runs: int = 20,
+    check_type: str = "regular",
+    threshold: float = REGRESSION_THRESHOLD,
+) -> RunTrends:
+    """Compares the most recent half of the last `runs` runs with the half before.
+
+    This is worked out from the stored runs (see `db_types.RunRecord`), so it
+    can only look back as far as `constants.RUN_RETENTION`. Averaging each
+    half, rather than comparing the last run with the one before, means one
+    slow run doesn't look like a regression on its own.
+
+    Args:
+        comics: The storage containing all of the comics we track, or a MongoDB
+            collection of them.
+        runs: How many runs to look at.
+        check_type: Which checks to look at, `"regular"` or `"daily"`.
+        threshold: How much worse, as a fraction, the recent runs have to be
+            for a measurement to count as regressed. Only times and errors can
+            regress, since the rest just depend on how much there was to do.
+
+    Returns:
+        How each of the runs' totals and phases has changed, with phases that
+        took the longest recently first.
+    """
+    latest = as_storage(comics).latest_runs(check_type, runs)
+    recent = len(latest) // 2
+    if recent == 0:
+        return RunTrends(0, 0, [])
+    recent_totals, recent_phases = _averages(latest[:recent])
+    earlier_totals, earlier_phases = _averages(latest[recent:])
+    averages = [
+        (metric, earlier_totals[metric], recent_totals[metric])
+        for metric in RUN_METRICS
+    ] + [
+        (f"phase {phase}", earlier_phases.get(phase, 0), recent_phases.get(phase, 0))
+        for phase in sorted(
+            recent_phases.keys() | earlier_phases.keys(),
+            key=lambda phase: recent_phases.get(phase, 0),
+            reverse=True,
+        )
+    ]
+    return RunTrends(
+        recent_runs=recent,
+        earlier_runs=len(latest) - recent,
+        trends=[
+            Trend(
+                metric=metric,
+                earlier=earlier,
+                recent=recent_average,
+                regressed=metric not in WORKLOAD_METRICS
+                and recent_average > earlier * (1 + threshold),
+            )
+            for metric, earlier, recent_average in averages
+        ],
+    )
+
+
+def show_run_trends(
+    runs: int = 20,
+    check_type: str = "regular",
+    threshold: float = REGRESSION_THRESHOLD,
+) -> None:
+    """Shows how the most recent runs compare to the ones before them.
+
+    This is run by `rss-to-webhook run-trends` (see `main.run_trends`).
+    """
+    load_dotenv()
+    with from_environment() as storage:
+        trends = run_trends(storage, runs, check_type, threshold)
+    if not trends.trends:
+        print(f"Not enough {check_type} runs to compare")
+        return
+    print(
+        f"Last {trends.recent_runs} {check_type} runs compared with the"
+        f" {trends.earlier_runs} before them:"
+    )
+    for trend in trends.trends:
+        flag = " REGRESSED" if trend.regressed else ""
+        print(
+            f"{trend.metric}: {trend.earlier:.4g} -> {trend.recent:.4g}"
+            f" ({trend.change:+.0%}){flag}"
+        )
+    if trends.regressions:
+        names = ", ".join(trend.metric for trend in trends.regressions)
+        print(f"{len(trends.regressions)} regressions: {names}")
+    else:
+        print("No regressions")
+
+
+def top_costs(
+    comics: Collection[Comic] | Storage, by: Cost = Cost.seconds, limit: int = 20
+) -> list[ComicCosts]:
+    """Finds the comics that have cost the most to check recently.
+
+    Args:
+        comics: The storage containing all of the comics we track, or a MongoDB
+            collection of them.
+        by: Which cost to rank them by.
+        limit: How many comics to report on.
+
+    Returns:
+        The most expensive comics' costs, decayed to the present (see `costs`),
+        most expensive first.
+    """
+    # Every total is scaled by the same weight, so they can be sorted as stored
+    rows = as_storage(comics).costliest(by.value, limit)
+    scale = weight(datetime.now(tz=UTC))
+    for row in rows:
+        for cost in COST_FIELDS:
+            row[cost] /= scale  # type: ignore [literal-required]
+    return rows
+
+
+def show_top_costs(by: Cost = Cost.seconds, limit: int = 20) -> None:
+    """Shows the comics that have cost the most to check recently.
+
+    This is run by `rss-to-webhook top` (see `main.top`).
+    """
+    load_dotenv()
+    with from_environment() as storage:
+        rows = top_costs(storage, by, limit)
+    if not rows:
+        print("No costs recorded yet")
+        return
+    print(
+        f"Comics by {by.value}, with costs halving every"
+        f" {COST_HALF_LIFE / (24 * 60 * 60):g} days:"
+    )
+    for row in rows:
+        checks = (
+            row["not_modified"] + row["hash_match"] + row["changed"] + row["error"]
+        ) or 1
+        print(
+            f"{row['title']}: {row['seconds']:.1f}s, {row['parse_seconds']:.2f}s"
+            f" parsing, {row['bytes'] / 1_000_000:.1f}MB, {row['posts']:.0f} posts."
+            f" Of {checks:.0f} checks, {row['not_modified'] / checks:.0%} not"
+            f" modified, {row['hash_match'] / checks:.0%} hash matches,"
+            f" {row['changed'] / checks:.0%} changed, {row['error'] / checks:.0%}"
+            " failed"
+        )
@@ -0,0 +1,1390 @@
+"""Where comics, and everything queued for them, are stored.
+
+The checks only need a handful of operations from a database, which are
+described by `Storage`. There are two implementations:
+
+- `MongoStorage`, which stores everything in a MongoDB collection of comics
+    and its subcollections, and is what the bot normally runs on.
+- `SQLiteStorage`, which stores the same things in a local SQLite database in
+    WAL mode. It starts in milliseconds rather than waiting on a remote
+    database, so it suits small deployments and benchmarks.
+
+Everything that takes a storage also accepts a pymongo `Collection` of comics,
+which is wrapped in a `MongoStorage` by `as_storage`. Commands open whichever
+the environment points to with `from_environment`.
+"""
+
+from __future__ import annotations
+
+import abc
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import UTC, datetime, timedelta
+from typing import TYPE_CHECKING, Any, Self
+
+import bson
+from bson import ObjectId
+from pymongo import DeleteMany, MongoClient, UpdateMany, UpdateOne
+
+from rss_to_webhook.constants import (
+    COST_RETENTION,
+    ERROR_RETENTION,
+    MAX_CACHED_ENTRIES,
+    OUTBOX_RETENTION,
+    READ_BATCH_SIZE,
+    RUN_RETENTION,
+    WRITE_BATCH_SIZE,
+)
+from rss_to_webhook.costs import COST_FIELDS, weight
+from rss_to_webhook.logs import logger
+from rss_to_webhook.utils import batched
+
+if TYPE_CHECKING:  # pragma: no cover
+    from collections.abc import Callable, Generator, Iterator, Sequence
+    from concurrent.futures import Executor, Future
+
+    from pymongo.collection import Collection
+    from pymongo.results import BulkWriteResult
+
+    from rss_to_webhook.db_types import (
+        CachingInfo,
+        Comic,
+        ComicCosts,
+        DiscordComic,
+        EntrySubset,
+        ErrorCount,
+        FeedError,
+        FeedSummary,
+        OutboxMessage,
+        PendingDaily,
+        RunRecord,
+    )
+
+#: The fields loaded for every comic, which are all that's needed to check feeds
+SUMMARY_FIELDS = ("_id", "title", "feed_url", "feed_hash", "etag", "last_modified")
+#: The fields only loaded for comics whose feeds have changed
+DETAIL_FIELDS = (
+    "last_entries",
+    "role_id",
+    "thread_id",
+    "color",
+    "username",
+    "avatar_url",
+)
+#: The fields needed to post daily updates
+DAILY_FIELDS = ("title", "role_id", "color", "username", "avatar_url")
+
+#: The fields of cached entries that new entries are compared against
+ENTRY_KEY_FIELDS = ("published", "id", "link")
+
+SUMMARY_PROJECTION = dict.fromkeys(SUMMARY_FIELDS, True)
+# Cached entries are only compared against, so their titles are never loaded
+DETAIL_PROJECTION = {
+    **{field: True for field in DETAIL_FIELDS if field != "last_entries"},
+    **{f"last_entries.{field}": True for field in ENTRY_KEY_FIELDS},
+}
+DAILY_PROJECTION = dict.fromkeys(DAILY_FIELDS, True)
+
+
+class StateWriter(abc.ABC):
+    """Saves what the checks have done, in batches.
+
+    Everything saved through a writer has already happened, so a writer can
+    write its batches whenever it likes, and is always closed, even when the
+    `with` block raises. A comic's posts and daily entries are always written
+    no later than its new state, so a comic is never marked as checked without
+    its updates having been queued.
+
+    Attributes:
+        writes: How many comics' states have been written.
+        batches: How many batches they were written in.
+    """
+
+    writes: int
+    batches: int
+
+    def __enter__(self) -> Self:
+        """Returns the writer, which is closed when the block exits."""
+        return self
+
+    def __exit__(self, *_exc_info: object) -> None:
+        """Writes everything that is still waiting."""
+        self.close()
+
+    @abc.abstractmethod
+    def save(
+        self,
+        comic_id: ObjectId,
+        caching_info: CachingInfo,
+        entries: list[EntrySubset],
+        posts: list[OutboxMessage],
+        dailies: list[PendingDaily],
+    ) -> None:
+        """Saves a checked comic's new state, and queues its updates.
+
+        Args:
+            comic_id: The comic that was checked.
+            caching_info: The comic's new caching information.
+            entries: The comic's new entries, which are added to its
+                `last_entries`.
+            posts: Posts to queue in the outbox. Posts that are already queued
+                are left alone.
+            dailies: Entries to queue for the daily check. Entries that are
+                already queued are left alone.
+        """
+
+    @abc.abstractmethod
+    def clear_dailies(self, ids: list[str]) -> None:
+        """Deletes entries that have been posted by the daily check."""
+
+    @abc.abstractmethod
+    def close(self) -> None:
+        """Writes everything that is still waiting, and waits for it."""
+
+
+class Storage(abc.ABC):
+    """The operations the checks need from a database.
+
+    Implementations must be safe to call from several threads at once, because
+    the regular checks call them from a thread pool.
+    """
+
+    def __enter__(self) -> Self:
+        """Returns the storage, which is closed when the block exits."""
+        return self
+
+    def __exit__(self, *_exc_info: object) -> None:
+        """Closes the storage."""
+        self.close()
+
+    def close(self) -> None:  # noqa: B027 # Most storages have nothing to close
+        """Releases anything the storage holds open."""
+
+    @abc.abstractmethod
+    def load_summaries(
+        self, batch_size: int = READ_BATCH_SIZE
+    ) -> Generator[list[FeedSummary], None, None]:
+        """Loads every comic, with only the fields needed to check its feed.
+
+        The comics are read as they're needed, so only a batch or two of them
+        is held at once however many comics there are.
+
+        Returns:
+            Every comic's `FeedSummary`, in title order, in batches of up to
+            `batch_size`.
+        """
+
+    @abc.abstractmethod
+    def load_details(self, ids: Sequence[ObjectId]) -> list[Comic]:
+        """Loads the rest of some comics, which is needed to post their updates.
+
+        Returns:
+            The `_id` and `DETAIL_FIELDS` of each comic that still exists. Its
+            `last_entries` may only have their `ENTRY_KEY_FIELDS`.
+        """
+
+    @abc.abstractmethod
+    def record_error(self, comic: FeedSummary, error: str) -> None:
+        """Stores an error from checking a comic's feed, and counts it on the comic.
+
+        Errors are kept for `constants.ERROR_RETENTION` seconds.
+        """
+
+    @abc.abstractmethod
+    def record_run(self, run: RunRecord) -> None:
+        """Stores how a run went.
+
+        Runs are kept for `constants.RUN_RETENTION` seconds.
+        """
+
+    @abc.abstractmethod
+    def record_costs(self, costs: Sequence[ComicCosts]) -> None:
+        """Adds what each comic cost in a run to its decaying totals.
+
+        The costs are scaled by `costs.weight` before they're added, and comics
+        that haven't been checked for `constants.COST_RETENTION` seconds are
+        dropped.
+        """
+
+    @abc.abstractmethod
+    def error_counts(self, since: datetime, limit: int) -> list[ErrorCount]:
+        """Counts the errors each comic's feed has had since `since`.
+
+        Returns:
+            The `limit` comics with the most errors, most first.
+        """
+
+    @abc.abstractmethod
+    def latest_runs(self, check_type: str, limit: int) -> list[RunRecord]:
+        """Finds the last `limit` runs of the `check_type` checks, newest first."""
+
+    @abc.abstractmethod
+    def costliest(self, by: str, limit: int) -> list[ComicCosts]:
+        """Finds the `limit` comics with the highest totals of the cost `by`.
+
+        Returns:
+            Their totals as stored, so still scaled up by `costs.weight`,
+            highest first.
+        """
+
+    @abc.abstractmethod
+    def writer(
+        self, batch_size: int = WRITE_BATCH_SIZE, executor: Executor | None = None
+    ) -> StateWriter:
+        """Makes a writer that saves `batch_size` comics at a time.
+
+        Given an `executor`, batches are written in the background, and the
+        writer waits for them when closed. The executor should only have one
+        thread, so that batches are written in order.
+        """
+
+    @abc.abstractmethod
+    def pending_posts(self) -> Iterator[OutboxMessage]:
+        """Finds every post in the outbox that hasn't been made, oldest first.
+
+        Posts that were made more than `constants.OUTBOX_RETENTION` seconds ago
+        are forgotten.
+        """
+
+    @abc.abstractmethod
+    def mark_posted(self, ids: Sequence[str]) -> None:
+        """Marks posts as made, unless they have already been marked."""
+
+    @abc.abstractmethod
+    def mark_failed(self, post_id: str, attempts: int, status: str, error: str) -> None:
+        """Records that a post failed, and whether it will be tried again."""
+
+    @abc.abstractmethod
+    def pending_dailies(
+        self, batch_size: int = READ_BATCH_SIZE
+    ) -> Iterator[PendingDaily]:
+        """Finds every entry waiting for the daily check.
+
+        Returns:
+            The entries, grouped by comic and in the order they were found,
+            read `batch_size` at a time.
+        """
+
+    @abc.abstractmethod
+    def load_daily_comics(self, ids: Sequence[ObjectId]) -> list[Comic]:
+        """Loads the fields needed to post some comics' daily updates.
+
+        Returns:
+            The `_id` and `DAILY_FIELDS` of each comic that still exists, in
+            title order.
+        """
+
+    @abc.abstractmethod
+    def update_comic(self, comic_data: DiscordComic) -> bool | None:
+        """Updates the comic with the same title to match `comic_data`.
+
+        Returns:
+            Whether anything about the comic changed, or `None` if there's no
+            comic with that title.
+        """
+
+    @abc.abstractmethod
+    def insert_comic(self, comic: Comic) -> ObjectId:
+        """Adds a new comic, giving it an `_id` if it doesn't have one.
+
+        Returns:
+            The comic's `_id`.
+        """
+
+
+def as_storage(comics: Collection[Comic] | Storage) -> Storage:
+    """Gets a storage, wrapping a MongoDB collection of comics if given one."""
+    if isinstance(comics, Storage):
+        return comics
+    return MongoStorage(comics)
+
+
+@contextmanager
+def from_environment(name: str = "comics") -> Iterator[Storage]:
+    """Opens the comics called `name` in the database from the environment.
+
+    That's the SQLite database at `SQLITE_PATH` if it's set, and otherwise the
+    `DB_NAME` database at `MONGODB_URI`. Either is closed when the block exits.
+    """
+    if sqlite_path := os.environ.get("SQLITE_PATH"):
+        with SQLiteStorage(sqlite_path, name) as storage:
+            yield storage
+        return
+    client: MongoClient[Comic] = MongoClient(os.environ["MONGODB_URI"])
+    try:
+        yield MongoStorage(client[os.environ["DB_NAME"]][name])
+    finally:
+        client.close()
+
+
+class BulkWriter:
+    """Collects updates to a collection and writes them in batches.
+
+    Each update costs a round trip to the database, which adds up quickly when
+    the database is far away. Instead, updates are collected and sent together
+    as an unordered bulk write once `batch_size` of them are waiting, and when
+    the writer is closed.
+
+    Updates should only be added once whatever they record has happened, so
+    that any batch can safely be written at any time. This means the writer
+    is flushed even when the `with` block raises, because everything waiting
+    has still happened, and keeps the window where something has been done
+    but not recorded to at most one batch.
+
+    Given an `executor`, batches are written in the background, so the caller
+    can carry on while each write makes its round trip. A batch still never
+    starts until the earlier batches of `flush_first`, and of its own
+    `flush_first` and so on, have been written, and is never written if one of
+    them failed. Every background write is waited for
+    when the writer is closed, which raises the first error if any failed.
+
+    Attributes:
+        collection: The collection to write to.
+        batch_size: How many updates to collect before writing them.
+        flush_first: Another writer whose updates have to be written before
+            this one's, because this one's updates record that they happened.
+        executor: Where to write batches in the background. If not given,
+            each batch is written before `flush` returns.
+        operations: The updates waiting to be written.
+        background: The batches being written in the background.
+        writes: How many updates have been written.
+        batches: How many bulk writes have been made.
+    """
+
+    collection: Collection[Any]
+    batch_size: int
+    flush_first: BulkWriter | None
+    executor: Executor | None
+    operations: list[UpdateOne | UpdateMany | DeleteMany]
+    background: list[Future[BulkWriteResult]]
+    writes: int
+    batches: int
+
+    def __init__(
+        self,
+        collection: Collection[Any],
+        batch_size: int = WRITE_BATCH_SIZE,
+        flush_first: BulkWriter | None = None,
+        executor: Executor | None = None,
+    ) -> None:
+        """Sets up an empty batch."""
+        self.collection = collection
+        self.batch_size = batch_size
+        self.flush_first = flush_first
+        self.executor = executor
+        self.operations = []
+        self.background = []
+        self.writes = 0
+        self.batches = 0
+
+    def __enter__(self) -> Self:
+        """Returns the writer, which is flushed when the block exits."""
+        return self
+
+    def __exit__(self, *_exc_info: object) -> None:
+        """Writes any updates that are still waiting, and waits for them."""
+        self.flush()
+        self.wait()
+
+    def add(self, operation: UpdateOne | UpdateMany | DeleteMany) -> None:
+        """Adds an update, writing the batch if it's full."""
+        self.operations.append(operation)
+        if len(self.operations) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """Writes every waiting update."""
+        if self.flush_first is not None:
+            self.flush_first.flush()
+        if not self.operations:
+            return
+        operations, self.operations = self.operations, []
+        self.writes += len(operations)
+        self.batches += 1
+        if self.executor is None:
+            self.collection.bulk_write(operations, ordered=False)
+            return
+        # The writers further back might have written since the one just before
+        before: list[Future[BulkWriteResult]] = []
+        writer = self.flush_first
+        while writer is not None:
+            before.extend(writer.background[-1:])
+            writer = writer.flush_first
+
+        def write() -> BulkWriteResult:
+            for future in before:
+                future.result()
+            return self.collection.bulk_write(operations, ordered=False)
+
+        self.background.append(self.executor.submit(write))
+
+    def wait(self) -> None:
+        """Waits for every background write, raising the first error if any failed."""
+        background, self.background = self.background, []
+        for future in background:
+            future.result()
+
+
+class MongoStorage(Storage):
+    """Stores comics in a MongoDB collection.
+
+    Everything queued for the comics is stored in subcollections of it, so the
+    regular and testing comics each have their own outbox, pending dailies, and
+    errors.
+
+    Attributes:
+        comics: The collection of comics.
+    """
+
+    comics: Collection[Comic]
+
+    def __init__(self, comics: Collection[Comic]) -> None:
+        """Stores comics in `comics`."""
+        self.comics = comics
+
+    def load_summaries(
+        self, batch_size: int = READ_BATCH_SIZE
+    ) -> Generator[list[FeedSummary], None, None]:
+        """Streams the summaries from one cursor, first indexing the errors."""
+        feed_errors = _feed_errors(self.comics)
+        feed_errors.create_index([("comic_id", 1), ("occurred_at", 1)])
+        feed_errors.create_index("occurred_at", expireAfterSeconds=ERROR_RETENTION)
+        cursor = (
+            self.comics.find({}, SUMMARY_PROJECTION)  # type: ignore [arg-type]
+            .sort("title")
+            .batch_size(batch_size)
+        )
+        with cursor:
+            for batch in batched(cursor, batch_size):
+                yield list(batch)  # type: ignore [arg-type]
+
+    def load_details(self, ids: Sequence[ObjectId]) -> list[Comic]:
+        """Loads the comics' details in one query."""
+        return list(self.comics.find({"_id": {"$in": list(ids)}}, DETAIL_PROJECTION))
+
+    def record_error(self, comic: FeedSummary, error: str) -> None:
+        """Stores the error in the `errors` subcollection."""
+        _record_error(self.comics, comic, error)
+
+    def record_run(self, run: RunRecord) -> None:
+        """Stores the run in the `runs` subcollection, which expires old runs."""
+        runs = _runs(self.comics)
+        runs.create_index([("check_type", 1), ("started_at", -1)])
+        runs.create_index("started_at", expireAfterSeconds=RUN_RETENTION)
+        runs.insert_one(run)
+
+    def record_costs(self, costs: Sequence[ComicCosts]) -> None:
+        """Adds the costs in one bulk write of upserts."""
+        if not costs:
+            return
+        now = datetime.now(tz=UTC)
+        scale = weight(now)
+        ledger = _costs(self.comics)
+        ledger.create_index("updated_at", expireAfterSeconds=COST_RETENTION)
+        ledger.bulk_write(
+            [
+                UpdateOne(
+                    {"_id": comic["_id"]},
+                    {
+                        "$inc": {
+                            cost: comic[cost] * scale  # type: ignore [literal-required]
+                            for cost in COST_FIELDS
+                        },
+                        "$set": {"title": comic["title"], "updated_at": now},
+                    },
+                    upsert=True,
+                )
+                for comic in costs
+            ],
+            ordered=False,
+        )
+
+    def error_counts(self, since: datetime, limit: int) -> list[ErrorCount]:
+        """Counts the errors with an aggregation, then looks up their titles."""
+        pipeline: list[dict[str, Any]] = [
+            {"$match": {"occurred_at": {"$gte": since}}},
+            {"$sort": {"occurred_at": 1}},
+            {
+                "$group": {
+                    "_id": "$comic_id",
+                    "errors": {"$sum": 1},
+                    "last_error": {"$last": "$error"},
+                    "last_error_at": {"$last": "$occurred_at"},
+                }
+            },
+            {"$sort": {"errors": -1, "_id": 1}},
+            {"$limit": limit},
+        ]
+        counts: list[ErrorCount] = list(
+            _feed_errors(self.comics).aggregate(pipeline)  # type: ignore [arg-type]
+        )
+        titles = {
+            comic["_id"]: comic["title"]
+            for comic in self.comics.find(
+                {"_id": {"$in": [count["_id"] for count in counts]}}, {"title": True}
+            )
+        }
+        for count in counts:
+            if count["_id"] in titles:
+                count["title"] = titles[count["_id"]]
+        return counts
+
+    def latest_runs(self, check_type: str, limit: int) -> list[RunRecord]:
+        """Reads the runs in the order of their index."""
+        return list(
+            _runs(self.comics)
+            .find({"check_type": check_type})
+            .sort("started_at", -1)
+            .limit(limit)
+        )
+
+    def costliest(self, by: str, limit: int) -> list[ComicCosts]:
+        """Sorts the costs collection by `by`."""
+        return list(
+            _costs(self.comics).find().sort([(by, -1), ("_id", 1)]).limit(limit)
+        )
+
+    def writer(
+        self, batch_size: int = WRITE_BATCH_SIZE, executor: Executor | None = None
+    ) -> StateWriter:
+        """Makes a writer that saves comics with `BulkWriter`s."""
+        return _MongoStateWriter(self.comics, batch_size, executor)
+
+    def pending_posts(self) -> Iterator[OutboxMessage]:
+        """Finds the pending posts. MongoDB expires the posted ones."""
+        outbox = _outbox(self.comics)
+        outbox.create_index([("status", 1), ("queued_at", 1), ("seq", 1)])
+        outbox.create_index("posted_at", expireAfterSeconds=OUTBOX_RETENTION)
+        return outbox.find({"status": "pending"}).sort([("queued_at", 1), ("seq", 1)])
+
+    def mark_posted(self, ids: Sequence[str]) -> None:
+        """Marks the posts as made in one update."""
+        _outbox(self.comics).update_many(
+            {"_id": {"$in": list(ids)}, "status": "pending"},
+            {"$set": {"status": "posted", "posted_at": datetime.now(tz=UTC)}},
+        )
+
+    def mark_failed(self, post_id: str, attempts: int, status: str, error: str) -> None:
+        """Records the failure on the post."""
+        _outbox(self.comics).update_one(
+            {"_id": post_id},
+            {"$set": {"attempts": attempts, "status": status, "last_error": error}},
+        )
+
+    def pending_dailies(
+        self, batch_size: int = READ_BATCH_SIZE
+    ) -> Iterator[PendingDaily]:
+        """Reads the entries in the order of their index."""
+        pending = _pending_dailies(self.comics)
+        pending.create_index([("comic_id", 1), ("queued_at", 1), ("seq", 1)])
+        return (
+            pending.find()
+            .sort([("comic_id", 1), ("queued_at", 1), ("seq", 1)])
+            .batch_size(batch_size)
+        )
+
+    def load_daily_comics(self, ids: Sequence[ObjectId]) -> list[Comic]:
+        """Loads the comics in one query."""
+        return list(
+            self.comics.find(
+                {"_id": {"$in": list(ids)}},
+                DAILY_PROJECTION,  # type: ignore [arg-type]
+            ).sort("title")
+        )
+
+    def update_comic(self, comic_data: DiscordComic) -> bool | None:
+        """Updates the comic, and reports what MongoDB did."""
+        result = self.comics.update_one(
+            {"title": comic_data["title"]}, {"$set": comic_data}
+        )
+        if result.matched_count == 0:
+            return None
+        return result.modified_count == 1
+
+    def insert_comic(self, comic: Comic) -> ObjectId:
+        """Inserts the comic, which gives it an `_id` if it doesn't have one."""
+        self.comics.insert_one(comic)
+        return comic["_id"]
+
+
+class _MongoStateWriter(StateWriter):
+    """Saves comics with `BulkWriter`s for their posts, dailies and states.
+
+    The states wait for the dailies, which wait for the posts (see
+    `BulkWriter.flush_first`), so a comic's new state is never saved before
+    the updates it found.
+    """
+
+    def __init__(
+        self, comics: Collection[Comic], batch_size: int, executor: Executor | None
+    ) -> None:
+        self.outbox = BulkWriter(_outbox(comics), batch_size, None, executor)
+        self.dailies = BulkWriter(
+            _pending_dailies(comics), batch_size, self.outbox, executor
+        )
+        self.states = BulkWriter(comics, batch_size, self.dailies, executor)
+
+    @property
+    def writes(self) -> int:  # type: ignore [override]
+        return self.states.writes
+
+    @property
+    def batches(self) -> int:  # type: ignore [override]
+        return self.states.batches
+
+    def save(
+        self,
+        comic_id: ObjectId,
+        caching_info: CachingInfo,
+        entries: list[EntrySubset],
+        posts: list[OutboxMessage],
+        dailies: list[PendingDaily],
+    ) -> None:
+        for post in posts:
+            self.outbox.add(
+                UpdateOne({"_id": post["_id"]}, {"$setOnInsert": post}, upsert=True)
+            )
+        for daily in dailies:
+            self.dailies.add(
+                UpdateOne({"_id": daily["_id"]}, {"$setOnInsert": daily}, upsert=True)
+            )
+        self.states.add(
+            UpdateOne(
+                {"_id": comic_id},
+                {
+                    "$set": caching_info,
+                    "$push": {
+                        "last_entries": {
+                            "$each": entries,
+                            "$slice": -MAX_CACHED_ENTRIES,
+                        }
+                    },
+                },
+            )
+        )
+
+    def clear_dailies(self, ids: list[str]) -> None:
+        self.dailies.add(DeleteMany({"_id": {"$in": ids}}))
+
+    def close(self) -> None:
+        try:
+            self.states.flush()
+            self.states.wait()
+        finally:
+            try:
+                self.dailies.flush()
+                self.dailies.wait()
+            finally:
+                self.outbox.flush()
+                self.outbox.wait()
+
+
+def _record_error(comics: Collection[Comic], comic: FeedSummary, error: str) -> None:
+    """Stores an error in the errors collection, and counts it on the comic.
+
+    Only the latest error is kept on the comic itself, so comics don't grow
+    with every error their feed has ever had.
+    """
+    occurred_at = datetime.now(tz=UTC)
+    feed_error: FeedError = {
+        "comic_id": comic["_id"],
+        "error": error,
+        "occurred_at": occurred_at,
+    }
+    _feed_errors(comics).insert_one(feed_error)
+    comics.update_one(
+        {"_id": comic["_id"]},
+        {
+            "$inc": {"error_count": 1},
+            "$set": {"last_error": error, "last_error_at": occurred_at},
+        },
+    )
+
+
+def migrate_dailies(
+    comics: Collection[Comic], batch_size: int = WRITE_BATCH_SIZE
+) -> int:
+    """Moves entries from comics' legacy `dailies` arrays into `pending_dailies`.
+
+    This scans the whole collection, so it's run once by
+    `rss-to-webhook migrate-dailies` rather than by every daily check. Each
+    entry is upserted under a key derived from its position, and each array is
+    only removed after its entries are written, so a migration that dies
+    halfway can just be run again.
+
+    Returns:
+        How many comics had their dailies moved.
+    """
+    now = datetime.now(tz=UTC)
+    migrated = 0
+    with (
+        BulkWriter(_pending_dailies(comics), batch_size) as entries,
+        BulkWriter(comics, batch_size, entries) as arrays,
+    ):
+        for comic in comics.find(
+            {"dailies": {"$exists": True}}, {"dailies": True, "title": True}
+        ):
+            for seq, entry in enumerate(comic.get("dailies", [])):
+                daily: PendingDaily = {
+                    "_id": f"{comic['_id']}-legacy-{seq}",
+                    "comic_id": comic["_id"],
+                    "entry": entry,
+                    "queued_at": now,
+                    "seq": seq,
+                }
+                entries.add(
+                    UpdateOne(
+                        {"_id": daily["_id"]}, {"$setOnInsert": daily}, upsert=True
+                    )
+                )
+            arrays.add(UpdateOne({"_id": comic["_id"]}, {"$unset": {"dailies": ""}}))
+            logger.info("Daily %s: Moved dailies to pending_dailies", comic["title"])
+            migrated += 1
+    return migrated
+
+
+def _outbox(comics: Collection[Comic]) -> Collection[OutboxMessage]:
+    """Gets the outbox for a collection of comics.
+
+    This is the `outbox` subcollection of `comics`, so the regular and testing
+    comics each have their own.
+    """
+    return comics["outbox"]  # type: ignore [return-value]
+
+
+def _pending_dailies(comics: Collection[Comic]) -> Collection[PendingDaily]:
+    """Gets the entries waiting for the daily check for a collection of comics.
+
+    Like the outbox, this is a subcollection of `comics`.
+    """
+    return comics["pending_dailies"]  # type: ignore [return-value]
+
+
+def _feed_errors(comics: Collection[Comic]) -> Collection[FeedError]:
+    """Gets the errors from checking feeds for a collection of comics.
+
+    Like the outbox, this is a subcollection of `comics`.
+    """
+    return comics["errors"]  # type: ignore [return-value]
+
+
+def _runs(comics: Collection[Comic]) -> Collection[RunRecord]:
+    """Gets the record of each run of the checks for a collection of comics.
+
+    Like the outbox, this is a subcollection of `comics`.
+    """
+    return comics["runs"]  # type: ignore [return-value]
+
+
+def _costs(comics: Collection[Comic]) -> Collection[ComicCosts]:
+    """Gets each comic's decaying costs for a collection of comics.
+
+    Like the outbox, this is a subcollection of `comics`.
+    """
+    return comics["costs"]  # type: ignore [return-value]
+
+
+#: Fields of a comic with their own column in SQLite. The rest are kept as BSON
+_COMIC_COLUMNS = (
+    "title",
+    "feed_url",
+    "feed_hash",
+    "etag",
+    "last_modified",
+    "error_count",
+    "last_error",
+    "last_error_at",
+)
+
+
+class SQLiteStorage(Storage):
+    """Stores comics in a local SQLite database.
+
+    The tables are named like MongoDB's collections, so the comics named
+    `comics` are in the `comics` table, and their outbox is in `comics.outbox`.
+    Fields that are searched or updated on their own get their own columns, and
+    the rest of a comic (its cached entries and its Discord settings) are kept
+    as BSON, so they keep their types exactly as MongoDB would.
+
+    The database is in WAL mode, so reads from the thread pool never wait for
+    the writer thread. Each thread gets its own connection, so this can't use
+    an in-memory database.
+
+    Attributes:
+        path: Where the database is.
+        name: The name of the comics table.
+    """
+
+    path: str | os.PathLike[str]
+    name: str
+
+    def __init__(self, path: str | os.PathLike[str], name: str = "comics") -> None:
+        """Opens the database at `path`, creating its tables if they don't exist."""
+        if '"' in name:
+            msg = f"Table names can't contain quotes: {name}"
+            raise ValueError(msg)
+        self.path = path
+        self.name = name
+        self._local = threading.local()
+        self._connections: list[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        self._connection().executescript(f"""
+            CREATE TABLE IF NOT EXISTS "{name}" (
+                id TEXT PRIMARY KEY,
+                title TEXT NOT NULL,
+                feed_url TEXT NOT NULL,
+                feed_hash BLOB NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                error_count INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT,
+                last_error_at TEXT,
+                last_entries BLOB NOT NULL,
+                extra BLOB NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS "{name}.title" ON "{name}" (title);
+            CREATE TABLE IF NOT EXISTS "{name}.outbox" (
+                id TEXT PRIMARY KEY,
+                comic_id TEXT NOT NULL,
+                title TEXT NOT NULL,
+                thread_id INTEGER,
+                payload BLOB NOT NULL,
+                queued_at TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL,
+                last_error TEXT,
+                posted_at TEXT
+            );
+            CREATE INDEX IF NOT EXISTS "{name}.outbox.pending"
+                ON "{name}.outbox" (status, queued_at, seq);
+            CREATE INDEX IF NOT EXISTS "{name}.outbox.posted_at"
+                ON "{name}.outbox" (posted_at);
+            CREATE TABLE IF NOT EXISTS "{name}.pending_dailies" (
+                id TEXT PRIMARY KEY,
+                comic_id TEXT NOT NULL,
+                entry BLOB NOT NULL,
+                queued_at TEXT NOT NULL,
+                seq INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS "{name}.pending_dailies.order"
+                ON "{name}.pending_dailies" (comic_id, queued_at, seq);
+            CREATE TABLE IF NOT EXISTS "{name}.errors" (
+                id INTEGER PRIMARY KEY,
+                comic_id TEXT NOT NULL,
+                error TEXT NOT NULL,
+                occurred_at TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS "{name}.errors.comic"
+                ON "{name}.errors" (comic_id, occurred_at);
+            CREATE INDEX IF NOT EXISTS "{name}.errors.occurred_at"
+                ON "{name}.errors" (occurred_at);
+            CREATE TABLE IF NOT EXISTS "{name}.runs" (
+                id TEXT PRIMARY KEY,
+                check_type TEXT NOT NULL,
+                started_at TEXT NOT NULL,
+                run BLOB NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS "{name}.runs.started_at"
+                ON "{name}.runs" (check_type, started_at);
+            CREATE TABLE IF NOT EXISTS "{name}.costs" (
+                id TEXT PRIMARY KEY,
+                title TEXT NOT NULL,
+                updated_at TEXT NOT NULL,
+                bytes REAL NOT NULL,
+                seconds REAL NOT NULL,
+                parse_seconds REAL NOT NULL,
+                not_modified REAL NOT NULL,
+                hash_match REAL NOT NULL,
+                changed REAL NOT NULL,
+                error REAL NOT NULL,
+                posts REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS "{name}.costs.updated_at"
+                ON "{name}.costs" (updated_at);
+        """)
+
+    def _connection(self) -> sqlite3.Connection:
+        """Gets this thread's connection, opening it if needed."""
+        connection: sqlite3.Connection | None = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._connect()
+            self._local.connection = connection
+            with self._lock:
+                self._connections.append(connection)
+        return connection
+
+    def _connect(self) -> sqlite3.Connection:
+        """Opens a new connection to the database."""
+        # Connections are used from other threads by `close` and `load_summaries`
+        connection = sqlite3.connect(
+            self.path, isolation_level=None, check_same_thread=False
+        )
+        connection.row_factory = sqlite3.Row
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """Runs a block in a write transaction, rolling it back if it raises."""
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    def close(self) -> None:
+        """Closes every thread's connection."""
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for connection in connections:
+            connection.close()
+        self._local = threading.local()
+
+    def load_summaries(
+        self, batch_size: int = READ_BATCH_SIZE
+    ) -> Generator[list[FeedSummary], None, None]:
+        """Reads the summaries on a connection of their own."""
+        # Batches can be read from any thread, so they get their own connection
+        # rather than sharing one that another thread might be using
+        connection = self._connect()
+        try:
+            rows = connection.execute(
+                f"""SELECT id, title, feed_url, feed_hash, etag, last_modified
+                FROM "{self.name}" ORDER BY title"""  # noqa: S608 # Not user input
+            )
+            while batch := rows.fetchmany(batch_size):
+                yield [_from_row(row, "_id") for row in batch]  # type: ignore [misc]
+        finally:
+            connection.close()
+
+    def load_details(self, ids: Sequence[ObjectId]) -> list[Comic]:
+        """Loads the comics' details, decoding the BSON columns."""
+        rows = self._connection().execute(
+            f"""SELECT id, last_entries, extra FROM "{self.name}"
+            WHERE id IN (SELECT value FROM json_each(?))""",  # noqa: S608 # Not user input
+            (_json_ids(ids),),
+        )
+        details: list[Comic] = []
+        for row in rows:
+            extra = bson.decode(row["extra"])
+            detail = {
+                "_id": ObjectId(row["id"]),
+                "last_entries": bson.decode(row["last_entries"])["entries"],
+                **{field: extra[field] for field in DETAIL_FIELDS if field in extra},
+            }
+            details.append(detail)  # type: ignore [arg-type]
+        return details
+
+    def record_error(self, comic: FeedSummary, error: str) -> None:
+        """Stores and counts the error, and drops expired errors."""
+        occurred_at = datetime.now(tz=UTC)
+        expired = occurred_at - timedelta(seconds=ERROR_RETENTION)
+        with self._transaction() as db:
+            db.execute(
+                f"""INSERT INTO "{self.name}.errors" (comic_id, error, occurred_at)
+                VALUES (?, ?, ?)""",  # noqa: S608 # Not user input
+                (str(comic["_id"]), error, occurred_at.isoformat()),
+            )
+            db.execute(
+                f"""UPDATE "{self.name}"
+                SET error_count = error_count + 1, last_error = ?, last_error_at = ?
+                WHERE id = ?""",  # noqa: S608 # Not user input
+                (error, occurred_at.isoformat(), str(comic["_id"])),
+            )
+            db.execute(
+                f'DELETE FROM "{self.name}.errors" WHERE occurred_at < ?',  # noqa: S608 # Not user input
+                (expired.isoformat(),),
+            )
+
+    def record_run(self, run: RunRecord) -> None:
+        """Stores the run as BSON, and drops expired runs."""
+        run_id = run.get("_id", ObjectId())
+        expired = datetime.now(tz=UTC) - timedelta(seconds=RUN_RETENTION)
+        with self._transaction() as db:
+            db.execute(
+                f"""INSERT INTO "{self.name}.runs" (id, check_type, started_at, run)
+                VALUES (?, ?, ?, ?)""",  # noqa: S608 # Not user input
+                (
+                    str(run_id),
+                    run["check_type"],
+                    run["started_at"].isoformat(),
+                    bson.encode({k: v for k, v in run.items() if k != "_id"}),
+                ),
+            )
+            db.execute(
+                f'DELETE FROM "{self.name}.runs" WHERE started_at < ?',  # noqa: S608 # Not user input
+                (expired.isoformat(),),
+            )
+
+    def record_costs(self, costs: Sequence[ComicCosts]) -> None:
+        """Adds the costs with one upsert per comic, and drops stale comics."""
+        now = datetime.now(tz=UTC)
+        scale = weight(now)
+        expired = now - timedelta(seconds=COST_RETENTION)
+        columns = ", ".join(COST_FIELDS)
+        placeholders = ", ".join("?" for _ in COST_FIELDS)
+        totals = ", ".join(f"{cost} = {cost} + excluded.{cost}" for cost in COST_FIELDS)
+        with self._transaction() as db:
+            db.executemany(
+                f"""INSERT INTO "{self.name}.costs"
+                (id, title, updated_at, {columns})
+                VALUES (?, ?, ?, {placeholders})
+                ON CONFLICT (id) DO UPDATE SET
+                title = excluded.title, updated_at = excluded.updated_at, {totals}""",  # noqa: S608 # Not user input
+                [
+                    (
+                        str(comic["_id"]),
+                        comic["title"],
+                        now.isoformat(),
+                        *(
+                            comic[cost] * scale  # type: ignore [literal-required]
+                            for cost in COST_FIELDS
+                        ),
+                    )
+                    for comic in costs
+                ],
+            )
+            db.execute(
+                f'DELETE FROM "{self.name}.costs" WHERE updated_at < ?',  # noqa: S608 # Not user input
+                (expired.isoformat(),),
+            )
+
+    def error_counts(self, since: datetime, limit: int) -> list[ErrorCount]:
+        """Counts the errors with one grouped query, joined to the comics."""
+        # With a single `MAX`, SQLite takes the other columns from the row with
+        # the latest error
+        rows = self._connection().execute(
+            f"""SELECT errors.comic_id AS id, comics.title, COUNT(*) AS errors,
+            errors.error AS last_error, MAX(errors.occurred_at) AS last_error_at
+            FROM "{self.name}.errors" AS errors
+            LEFT JOIN "{self.name}" AS comics ON comics.id = errors.comic_id
+            WHERE errors.occurred_at >= ? GROUP BY errors.comic_id
+            ORDER BY errors DESC, errors.comic_id LIMIT ?""",  # noqa: S608 # Not user input
+            (since.isoformat(), limit),
+        )
+        return [_from_row(row, "_id") for row in rows]  # type: ignore [misc]
+
+    def latest_runs(self, check_type: str, limit: int) -> list[RunRecord]:
+        """Reads the runs in the order of their index, decoding them."""
+        rows = self._connection().execute(
+            f"""SELECT id, run FROM "{self.name}.runs" WHERE check_type = ?
+            ORDER BY started_at DESC LIMIT ?""",  # noqa: S608 # Not user input
+            (check_type, limit),
+        )
+        return [
+            {"_id": ObjectId(row["id"]), **bson.decode(row["run"])}  # type: ignore [typeddict-item]
+            for row in rows
+        ]
+
+    def costliest(self, by: str, limit: int) -> list[ComicCosts]:
+        """Sorts the costs table by `by`, which has to be one of `COST_FIELDS`."""
+        if by not in COST_FIELDS:
+            msg = f"Not a cost: {by}"
+            raise ValueError(msg)
+        rows = self._connection().execute(
+            f"""SELECT * FROM "{self.name}.costs" ORDER BY {by} DESC, id
+            LIMIT ?""",  # noqa: S608 # Not user input
+            (limit,),
+        )
+        return [_from_row(row, "_id") for row in rows]  # type: ignore [misc]
+
+    def writer(
+        self, batch_size: int = WRITE_BATCH_SIZE, executor: Executor | None = None
+    ) -> StateWriter:
+        """Makes a writer that saves each batch of comics in one transaction."""
+        return _SQLiteStateWriter(self, batch_size, executor)
+
+    def pending_posts(self) -> Iterator[OutboxMessage]:
+        """Drops expired posts, then reads every pending post at once."""
+        expired = datetime.now(tz=UTC) - timedelta(seconds=OUTBOX_RETENTION)
+        with self._transaction() as db:
+            db.execute(
+                f'DELETE FROM "{self.name}.outbox" WHERE posted_at < ?',  # noqa: S608 # Not user input
+                (expired.isoformat(),),
+            )
+        # Everything is read up front, so marking posts can't change the results
+        rows = (
+            self._connection()
+            .execute(f"""SELECT * FROM "{self.name}.outbox" WHERE status = 'pending'
+                ORDER BY queued_at, seq""")  # noqa: S608 # Not user input
+            .fetchall()
+        )
+        # Posts to the main channel have a `thread_id` of `None`, not a missing one
+        return (
+            {"thread_id": None, **_from_row(row, "comic_id")}  # type: ignore [typeddict-item]
+            for row in rows
+        )
+
+    def mark_posted(self, ids: Sequence[str]) -> None:
+        """Marks the posts as made in one transaction."""
+        with self._transaction() as db:
+            db.execute(
+                f"""UPDATE "{self.name}.outbox" SET status = 'posted', posted_at = ?
+                WHERE id IN (SELECT value FROM json_each(?)) AND status = 'pending'""",  # noqa: S608 # Not user input
+                (datetime.now(tz=UTC).isoformat(), _json_ids(ids)),
+            )
+
+    def mark_failed(self, post_id: str, attempts: int, status: str, error: str) -> None:
+        """Records the failure on the post."""
+        with self._transaction() as db:
+            db.execute(
+                f"""UPDATE "{self.name}.outbox"
+                SET attempts = ?, status = ?, last_error = ? WHERE id = ?""",  # noqa: S608 # Not user input
+                (attempts, status, error, post_id),
+            )
+
+    def pending_dailies(
+        self, batch_size: int = READ_BATCH_SIZE
+    ) -> Iterator[PendingDaily]:
+        """Reads the entries `batch_size` rows at a time."""
+        rows = self._connection().execute(
+            f"""SELECT * FROM "{self.name}.pending_dailies"
+            ORDER BY comic_id, queued_at, seq"""  # noqa: S608 # Not user input
+        )
+        while batch := rows.fetchmany(batch_size):
+            for row in batch:
+                daily = _from_row(row, "comic_id")
+                daily["entry"] = bson.decode(row["entry"])
+                yield daily  # type: ignore [misc]
+
+    def load_daily_comics(self, ids: Sequence[ObjectId]) -> list[Comic]:
+        """Loads the comics, decoding their Discord settings."""
+        rows = self._connection().execute(
+            f"""SELECT id, title, extra FROM "{self.name}"
+            WHERE id IN (SELECT value FROM json_each(?)) ORDER BY title""",  # noqa: S608 # Not user input
+            (_json_ids(ids),),
+        )
+        comics: list[Comic] = []
+        for row in rows:
+            extra = bson.decode(row["extra"])
+            comic = {
+                "_id": ObjectId(row["id"]),
+                "title": row["title"],
+                **{field: extra[field] for field in DAILY_FIELDS if field in extra},
+            }
+            comics.append(comic)  # type: ignore [arg-type]
+        return comics
+
+    def update_comic(self, comic_data: DiscordComic) -> bool | None:
+        """Rewrites the comic if anything about it has changed."""
+        with self._transaction() as db:
+            row = db.execute(
+                f'SELECT * FROM "{self.name}" WHERE title = ?',  # noqa: S608 # Not user input
+                (comic_data["title"],),
+            ).fetchone()
+            if row is None:
+                return None
+            comic = _comic_from_row(row)
+            if all(comic.get(key) == value for key, value in comic_data.items()):
+                return False
+            self._write_comic(db, {**comic, **comic_data})  # type: ignore [typeddict-item]
+        return True
+
+    def insert_comic(self, comic: Comic) -> ObjectId:
+        """Writes the comic as a new row."""
+        comic.setdefault("_id", ObjectId())
+        with self._transaction() as db:
+            self._write_comic(db, comic)
+        return comic["_id"]
+
+    def _write_comic(self, db: sqlite3.Connection, comic: Comic) -> None:
+        """Inserts or replaces a whole comic."""
+        columns: dict[str, Any] = {
+            column: comic.get(column) for column in _COMIC_COLUMNS
+        }
+        columns["error_count"] = columns["error_count"] or 0
+        if columns["last_error_at"] is not None:
+            columns["last_error_at"] = columns["last_error_at"].isoformat()
+        extra = {
+            key: value
+            for key, value in comic.items()
+            if key not in {"_id", "last_entries", *_COMIC_COLUMNS}
+        }
+        db.execute(
+            f"""INSERT OR REPLACE INTO "{self.name}"
+            (id, {", ".join(columns)}, last_entries, extra)
+            VALUES (?, {", ".join("?" * len(columns))}, ?, ?)""",  # noqa: S608 # Not user input
+            (
+                str(comic["_id"]),
+                *columns.values(),
+                bson.encode({"entries": comic.get("last_entries", [])}),
+                bson.encode(extra),
+            ),
+        )
+
+
+class _SQLiteStateWriter(StateWriter):
+    """Saves each batch of comics in one transaction.
+
+    A comic's posts, dailies and state are all in the same transaction, so they
+    are saved together or not at all.
+    """
+
+    def __init__(
+        self, storage: SQLiteStorage, batch_size: int, executor: Executor | None
+    ) -> None:
+        self.storage = storage
+        self.batch_size = batch_size
+        self.executor = executor
+        self.waiting: list[Callable[[sqlite3.Connection], None]] = []
+        self.waiting_comics = 0
+        self.background: list[Future[None]] = []
+        self.writes = 0
+        self.batches = 0
+
+    def save(
+        self,
+        comic_id: ObjectId,
+        caching_info: CachingInfo,
+        entries: list[EntrySubset],
+        posts: list[OutboxMessage],
+        dailies: list[PendingDaily],
+    ) -> None:
+        name = self.storage.name
+        post_rows = [
+            (
+                post["_id"],
+                str(post["comic_id"]),
+                post["title"],
+                post["thread_id"],
+                post["payload"],
+                post["queued_at"].isoformat(),
+                post["seq"],
+                post["status"],
+                post["attempts"],
+            )
+            for post in posts
+        ]
+        daily_rows = [
+            (
+                daily["_id"],
+                str(daily["comic_id"]),
+                bson.encode(daily["entry"]),
+                daily["queued_at"].isoformat(),
+                daily["seq"],
+            )
+            for daily in dailies
+        ]
+
+        def write(db: sqlite3.Connection) -> None:
+            db.executemany(
+                f"""INSERT OR IGNORE INTO "{name}.outbox" (id, comic_id, title,
+                thread_id, payload, queued_at, seq, status, attempts)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",  # noqa: S608 # Not user input
+                post_rows,
+            )
+            db.executemany(
+                f"""INSERT OR IGNORE INTO "{name}.pending_dailies"
+                (id, comic_id, entry, queued_at, seq) VALUES (?, ?, ?, ?, ?)""",  # noqa: S608 # Not user input
+                daily_rows,
+            )
+            # New entries are added to whatever is cached when they're written
+            row = db.execute(
+                f'SELECT last_entries FROM "{name}" WHERE id = ?',  # noqa: S608 # Not user input
+                (str(comic_id),),
+            ).fetchone()
+            if row is None:
+                return
+            cached = bson.decode(row["last_entries"])["entries"]
+            last_entries = [*cached, *entries][-MAX_CACHED_ENTRIES:]
+            db.execute(
+                f"""UPDATE "{name}" SET feed_hash = ?, etag = coalesce(?, etag),
+                last_modified = coalesce(?, last_modified), last_entries = ?
+                WHERE id = ?""",  # noqa: S608 # Not user input
+                (
+                    caching_info["feed_hash"],
+                    caching_info.get("etag"),
+                    caching_info.get("last_modified"),
+                    bson.encode({"entries": last_entries}),
+                    str(comic_id),
+                ),
+            )
+
+        self.waiting.append(write)
+        self.waiting_comics += 1
+        if len(self.waiting) >= self.batch_size:
+            self.flush()
+
+    def clear_dailies(self, ids: list[str]) -> None:
+        name = self.storage.name
+
+        def write(db: sqlite3.Connection) -> None:
+            db.execute(
+                f"""DELETE FROM "{name}.pending_dailies"
+                WHERE id IN (SELECT value FROM json_each(?))""",  # noqa: S608 # Not user input
+                (_json_ids(ids),),
+            )
+
+        self.waiting.append(write)
+        if len(self.waiting) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """Writes everything waiting in one transaction."""
+        if not self.waiting:
+            return
+        writes, self.waiting = self.waiting, []
+        self.writes += self.waiting_comics
+        self.waiting_comics = 0
+        self.batches += 1
+        if self.executor is None:
+            self._write(writes)
+        else:
+            self.background.append(self.executor.submit(self._write, writes))
+
+    def _write(self, writes: list[Callable[[sqlite3.Connection], None]]) -> None:
+        with self.storage._transaction() as db:  # noqa: SLF001 # A friend class
+            for write in writes:
+                write(db)
+
+    def close(self) -> None:
+        self.flush()
+        background, self.background = self.background, []
+        for future in background:
+            future.result()
+
+
+def _json_ids(ids: Sequence[ObjectId | str]) -> str:
+    """Encodes ids as a JSON array, for `json_each`.
+
+    This avoids SQLite's limit on how many parameters a query can have.
+    """
+    return json.dumps([str(id_) for id_ in ids])
+
+
+def _from_row(row: sqlite3.Row, *object_ids: str) -> dict[str, Any]:
+    """Turns a row into a document like MongoDB's.
+
+    The `id` column becomes `_id`, `object_ids` are turned back into `ObjectId`s,
+    timestamps are turned back into datetimes, and `NULL`s are left out.
+    """
+    document: dict[str, Any] = {}
+    for key in row.keys():  # noqa: SIM118 # Not a real dictionary
+        value = row[key]
+        if value is None:
+            continue
+        field = "_id" if key == "id" else key
+        if field in object_ids:
+            value = ObjectId(value)
+        elif field.endswith("_at"):
+            value = datetime.fromisoformat(value)
+        document[field] = value
+    return document
+
+
+def _comic_from_row(row: sqlite3.Row) -> Comic:
+    """Loads a whole comic from a row."""
+    comic = _from_row(row, "_id")
+    comic["last_entries"] = bson.decode(comic["last_entries"])["entries"]
+    comic.update(bson.decode(comic.pop("extra")))
+    if not comic.get("error_count"):
+        comic.pop("error_count", None)
+    return comic  # type: ignore [return-value]
@@ -0,0 +1,452 @@
+"""Makes up collections of comics, to see how the checks cope with far more.
+
+A `SyntheticCollection` makes up any number of comics, and feeds to match, in
+the shapes the real collection comes in:
+
+- About a third of feeds are on two big hosts, and the rest each have their
+  own (see `HOSTS`).
+- Most entries have a `<pubDate>`, `<guid>` and `<link>`, but some feeds only
+  give an ID or a link, and some are Atom (see `STYLES`).
+- Feeds have from 10 to 500 entries, some with their full text, and each comic
+  has as many entries cached as it would after however many pages it's posted,
+  up to `constants.MAX_CACHED_ENTRIES`.
+- Some comics have entries waiting for the daily checks, and some have had
+  errors, a few of which are still failing.
+- Some feeds send caching headers, and they take from a few milliseconds to a
+  few seconds to arrive.
+
+Everything about comic `n` comes from the collection's seed and `n`, so its
+feed can be served (see `replay.FeedServer`) by a different process from the
+one that stored it, as long as both use the same seed. `rss-to-webhook
+generate-comics` stores a collection in the database from the environment,
+`rss-to-webhook serve-feeds` serves its feeds, and `rss-to-webhook replay
+--synthetic` benchmarks the checks on one.
+"""
+
+from __future__ import annotations
+
+import math
+import random
+from dataclasses import dataclass
+from datetime import UTC, datetime, timedelta
+from email.utils import format_datetime
+from http import HTTPStatus
+from typing import TYPE_CHECKING, TypeVar
+from xml.sax.saxutils import escape
+
+from bson import ObjectId
+from dotenv import load_dotenv
+
+from rss_to_webhook.constants import (
+    HASH_SEED,
+    LOOKBACK_LIMIT,
+    MAX_CACHED_ENTRIES,
+    REPLAY_NEW_FRACTION,
+    WRITE_BATCH_SIZE,
+)
+from rss_to_webhook.replay import FeedServer, FeedSource, RecordedFeed
+from rss_to_webhook.storage import Storage, from_environment
+
+if TYPE_CHECKING:  # pragma: no cover
+    from rss_to_webhook.db_types import CachingInfo, Comic, EntrySubset, PendingDaily
+
+_T = TypeVar("_T")
+
+#: When the newest page of every comic was posted
+SYNTHETIC_EPOCH = datetime(2024, 10, 5, 12, tzinfo=UTC)
+
+#: Where feeds are hosted, how their paths look, and how many comics use each.
+#: `{slug}` is replaced by the comic's slug, so only the first two are shared.
+HOSTS = (
+    ("www.webtoons.example", "/en/fantasy/{slug}/rss?title_no={number}", 0.2),
+    ("tapas.example", "/rss/series/{number}", 0.15),
+    ("{slug}.comicfury.example", "/rss.php", 0.1),
+    ("{slug}.tumblr.example", "/rss", 0.1),
+    ("www.{slug}.example", "/feed/", 0.3),
+    ("{slug}.example", "/comic/rss", 0.15),
+)
+
+#: How feeds identify their entries, and how many use each way:
+#:
+#: - `full`: RSS with a `<pubDate>`, `<guid>` and `<link>`
+#: - `atom`: Atom with a `<published>`, `<id>` and `<link>`
+#: - `id`: RSS with a `<guid>` and `<link>`, but no dates
+#: - `link`: RSS with only a `<link>`
+STYLES = (("full", 0.7), ("atom", 0.1), ("id", 0.1), ("link", 0.1))
+
+#: How many entries feeds have, and how many feeds have each
+FEED_SIZES = ((10, 0.2), (20, 0.25), (25, 0.2), (50, 0.2), (100, 0.1), (500, 0.05))
+
+#: The fraction of feeds with each of the caching headers
+ETAG_FRACTION = 0.3
+LAST_MODIFIED_FRACTION = 0.25
+
+#: The fraction of feeds with each entry's full text
+FULL_TEXT_FRACTION = 0.3
+
+#: The fraction of comics that have had errors, and the fraction of those that
+#: are still failing
+ERROR_FRACTION = 0.15
+FAILING_FRACTION = 0.25
+
+#: The fraction of comics with entries waiting for the daily checks
+DAILIES_FRACTION = 0.1
+
+#: The fraction of comics with a thread
+THREAD_FRACTION = 0.1
+
+#: The thread posted to by comics that have one
+THREAD_ID = 3000
+
+#: Errors comics have had, as they're recorded
+ERRORS = (
+    "ClientResponseError: 404, message='Not Found'",
+    "ClientResponseError: 503, message='Service Unavailable'",
+    "TimeoutError: ",
+    "ClientConnectorError: Cannot connect to host",
+    "ServerDisconnectedError: Server disconnected",
+)
+
+_WORDS = (
+    "Sleepless",
+    "Domain",
+    "Moon",
+    "Witch",
+    "Hollow",
+    "Star",
+    "Garden",
+    "Iron",
+    "Paper",
+    "Lantern",
+    "River",
+    "Ghost",
+)
+
+
+def _weighted(chooser: random.Random, options: tuple[tuple[_T, float], ...]) -> _T:
+    values, weights = zip(*options, strict=True)
+    choice: _T = chooser.choices(values, weights)[0]
+    return choice
+
+
+@dataclass(frozen=True, slots=True)
+class SyntheticComic:
+    """Everything about one made-up comic.
+
+    Attributes:
+        number: Which comic in the collection it is.
+        title: Its title.
+        host: The host its feed would be on.
+        path: The path of its feed on that host.
+        style: How its feed identifies entries (see `STYLES`).
+        pages: How many pages it has, which is the number of its newest page.
+        feed_size: How many of the newest pages are in its feed.
+        cached: How many pages are in its `last_entries`.
+        full_text: Whether its feed has each page's full text.
+        days_between: Days between pages.
+        etag: The feed's ETag, if it has one.
+        last_modified: The feed's Last-Modified header, if it has one.
+        latency: Seconds the feed takes to arrive.
+        status: The status the feed is served with, which is an error if it's
+            still failing.
+        errors: How many errors it has had.
+        dailies: How many of its newest pages are waiting for the daily checks.
+        thread: Whether it has a thread.
+    """
+
+    number: int
+    title: str
+    host: str
+    path: str
+    style: str
+    pages: int
+    feed_size: int
+    cached: int
+    full_text: bool
+    days_between: int
+    etag: str | None
+    last_modified: str | None
+    latency: float
+    status: int
+    errors: int
+    dailies: int
+    thread: bool
+
+    @property
+    def slug(self) -> str:
+        """The title, as it would be in URLs."""
+        return self.title.lower().replace(" ", "-")
+
+    def entry(self, page: int) -> EntrySubset:
+        """Gets page `page` as an entry, like the checks would store it."""
+        link = f"https://{self.host}/comic/{self.slug}/{page}"
+        entry: EntrySubset = {"title": f"Page {page}", "link": link}
+        if self.style in {"full", "id"}:
+            entry["id"] = f"{self.slug}-{page}"
+        elif self.style == "atom":
+            entry["id"] = link
+        published = SYNTHETIC_EPOCH - timedelta(
+            days=(self.pages - page) * self.days_between
+        )
+        if self.style == "full":
+            entry["published"] = format_datetime(published, usegmt=True)
+        elif self.style == "atom":
+            entry["published"] = published.isoformat()
+        return entry
+
+    def body(self) -> str:
+        """Makes the comic's feed, with its newest page first."""
+        description = "Words " * (500 if self.full_text else 30)
+        oldest = max(self.pages - self.feed_size, 0)
+        entries = [self.entry(page) for page in range(self.pages, oldest, -1)]
+        if self.style == "atom":
+            items = "".join(
+                f"<entry><title>{escape(entry['title'])}</title>"
+                f'<link href="{escape(entry["link"])}" rel="alternate"/>'
+                f"<id>{escape(entry['id'])}</id>"
+                f"<published>{entry['published']}</published>"
+                f"<updated>{entry['published']}</updated>"
+                f"<summary>{description}</summary></entry>"
+                for entry in entries
+            )
+            return (
+                '<?xml version="1.0" encoding="UTF-8"?>'
+                '<feed xmlns="http://www.w3.org/2005/Atom">'
+                f"<title>{escape(self.title)}</title><id>https://{self.host}/</id>"
+                f"<updated>{SYNTHETIC_EPOCH.isoformat()}</updated>{items}</feed>"
+            )
+        items = "".join(
+            f"<item><title>{escape(entry['title'])}</title>"
+            f"<link>{escape(entry['link'])}</link>"
+            + (
+                f'<guid isPermaLink="false">{escape(entry["id"])}</guid>'
+                if "id" in entry
+                else ""
+            )
+            + (
+                f"<pubDate>{entry['published']}</pubDate>"
+                if "published" in entry
+                else ""
+            )
+            + f"<description>{description}</description></item>"
+            for entry in entries
+        )
+        return (
+            '<?xml version="1.0" encoding="UTF-8"?><rss version="2.0"><channel>'
+            f"<title>{escape(self.title)}</title><link>https://{self.host}/</link>"
+            f"<description>A comic</description>{items}</channel></rss>"
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class SyntheticCollection(FeedSource):
+    """Any number of made-up comics, and their feeds.
+
+    Attributes:
+        seed: What everything about every comic comes from.
+    """
+
+    seed: int = 0
+
+    def comic(self, number: int) -> SyntheticComic:
+        """Makes up comic `number`."""
+        key = f"{self.seed}:{number}"
+        chooser = random.Random(key)  # noqa: S311 # Not for security
+        title = f"{chooser.choice(_WORDS)} {chooser.choice(_WORDS)} {number}"
+        slug = title.lower().replace(" ", "-")
+        host, path = _weighted(
+            chooser, tuple(((host, path), share) for host, path, share in HOSTS)
+        )
+        feed_size = _weighted(chooser, FEED_SIZES)
+        pages = feed_size + chooser.randint(0, 600)
+        # What was in the feed when the comic was added, and every page since
+        cached = min(
+            min(feed_size, LOOKBACK_LIMIT) + chooser.randint(0, 400),
+            pages,
+            MAX_CACHED_ENTRIES,
+        )
+        errors = 0
+        status = HTTPStatus.OK
+        if chooser.random() < ERROR_FRACTION:
+            errors = min(int(chooser.paretovariate(1)), 200)
+            if chooser.random() < FAILING_FRACTION:
+                status = chooser.choice((
+                    HTTPStatus.NOT_FOUND,
+                    HTTPStatus.FORBIDDEN,
+                    HTTPStatus.INTERNAL_SERVER_ERROR,
+                    HTTPStatus.SERVICE_UNAVAILABLE,
+                ))
+        return SyntheticComic(
+            number=number,
+            title=title,
+            host=host.format(slug=slug),
+            path=path.format(slug=slug, number=number),
+            style=_weighted(chooser, STYLES),
+            pages=pages,
+            feed_size=feed_size,
+            cached=cached,
+            full_text=chooser.random() < FULL_TEXT_FRACTION,
+            days_between=chooser.randint(1, 7),
+            etag=(
+                f'"{chooser.getrandbits(48):x}"'
+                if chooser.random() < ETAG_FRACTION
+                else None
+            ),
+            last_modified=(
+                format_datetime(SYNTHETIC_EPOCH, usegmt=True)
+                if chooser.random() < LAST_MODIFIED_FRACTION
+                else None
+            ),
+            # Most hosts take a fraction of a second, and a few take seconds
+            latency=min(chooser.lognormvariate(math.log(0.15), 0.8), 5),
+            status=status,
+            errors=errors,
+            dailies=(
+                min(chooser.randint(1, 5), cached)
+                if chooser.random() < DAILIES_FRACTION
+                else 0
+            ),
+            thread=chooser.random() < THREAD_FRACTION,
+        )
+
+    def feed(self, number: int) -> RecordedFeed:
+        """Makes up the feed a comic serves, or an error page if it's failing."""
+        comic = self.comic(number)
+        headers = {"Content-Type": "application/rss+xml; charset=utf-8"}
+        if comic.style == "atom":
+            headers["Content-Type"] = "application/atom+xml; charset=utf-8"
+        if comic.etag is not None:
+            headers["ETag"] = comic.etag
+        if comic.last_modified is not None:
+            headers["Last-Modified"] = comic.last_modified
+        if comic.status != HTTPStatus.OK:
+            return RecordedFeed(
+                file=f"{number}.xml",
+                url=f"https://{comic.host}{comic.path}",
+                status=comic.status,
+                headers={"Content-Type": "text/html"},
+                latency=comic.latency,
+                body=f"<h1>{HTTPStatus(comic.status).phrase}</h1>".encode(),
+            )
+        return RecordedFeed(
+            file=f"{number}.xml",
+            url=f"https://{comic.host}{comic.path}",
+            status=comic.status,
+            headers=headers,
+            latency=comic.latency,
+            body=comic.body().encode(),
+        )
+
+    def fill(
+        self,
+        storage: Storage,
+        base_url: str,
+        comics: int,
+        *,
+        new_fraction: float = REPLAY_NEW_FRACTION,
+    ) -> None:
+        """Stores the made-up comics, with their errors and pending dailies."""
+        import mmh3  # noqa: PLC0415 # Only needed to fill storage
+
+        chooser = random.Random(self.seed)  # noqa: S311 # Not for security
+        now = datetime.now(tz=UTC)
+        with storage.writer(WRITE_BATCH_SIZE) as writer:
+            for number in range(comics):
+                synthetic = self.comic(number)
+                newest = synthetic.pages
+                caching_info: CachingInfo = {
+                    "feed_hash": mmh3.hash_bytes(synthetic.body(), HASH_SEED)
+                }
+                if synthetic.status == HTTPStatus.OK and (
+                    chooser.random() < new_fraction
+                ):
+                    newest -= min(chooser.randint(1, 3), synthetic.pages - 1)
+                    caching_info = {"feed_hash": b""}
+                else:
+                    if synthetic.etag is not None:
+                        caching_info["etag"] = synthetic.etag
+                    if synthetic.last_modified is not None:
+                        caching_info["last_modified"] = synthetic.last_modified
+                oldest = max(newest - synthetic.cached, 0)
+                comic: Comic = {
+                    "_id": ObjectId(),
+                    "title": synthetic.title,
+                    "feed_url": FeedServer.feed_url(
+                        base_url, number, f"/{synthetic.host}{synthetic.path}"
+                    ),
+                    "role_id": 1000 + number,
+                    "last_entries": [
+                        synthetic.entry(page) for page in range(oldest + 1, newest + 1)
+                    ],
+                    **caching_info,
+                }
+                if synthetic.thread:
+                    comic["thread_id"] = THREAD_ID
+                # Comics that are still failing have failed recently too
+                recent_errors = (
+                    min(synthetic.errors, 3) if synthetic.status != HTTPStatus.OK else 0
+                )
+                if synthetic.errors > recent_errors:
+                    comic["error_count"] = synthetic.errors - recent_errors
+                    comic["last_error"] = chooser.choice(ERRORS)
+                    comic["last_error_at"] = now - timedelta(
+                        days=chooser.uniform(1, 60)
+                    )
+                storage.insert_comic(comic)
+                for _ in range(recent_errors):
+                    storage.record_error(comic, chooser.choice(ERRORS))
+                if synthetic.dailies:
+                    writer.save(
+                        comic["_id"],
+                        caching_info,
+                        [],
+                        [],
+                        _dailies(comic, synthetic.dailies, now),
+                    )
+
+
+def _dailies(comic: Comic, count: int, now: datetime) -> list[PendingDaily]:
+    """Queues a comic's newest `count` cached entries for the daily checks."""
+    queued_at = now - timedelta(hours=12)
+    return [
+        {
+            "_id": f"{comic['_id']}-synthetic-{seq}",
+            "comic_id": comic["_id"],
+            "entry": entry,
+            "queued_at": queued_at,
+            "seq": seq,
+        }
+        for seq, entry in enumerate(comic["last_entries"][-count:])
+    ]
+
+
+def generate(
+    comics: int,
+    *,
+    collection: str = "test-comics",
+    feeds_url: str,
+    seed: int = 0,
+    new_fraction: float = REPLAY_NEW_FRACTION,
+) -> None:
+    """Adds `comics` made-up comics to the database from the environment.
+
+    This is run by `rss-to-webhook generate-comics` (see `main.generate_comics`).
+    """
+    load_dotenv()
+    with from_environment(collection) as storage:
+        SyntheticCollection(seed).fill(
+            storage, feeds_url, comics, new_fraction=new_fraction
+        )
+    print(f"Added {comics} comics to {collection}, with feeds at {feeds_url}")
+
+
+def serve(port: int, seed: int = 0, latency: float | None = None) -> None:
+    """Serves the feeds of a collection until interrupted.
+
+    This is run by `rss-to-webhook serve-feeds` (see `main.serve_feeds`).
+    """
+    from aiohttp import web  # noqa: PLC0415 # Only needed to serve feeds
+
+    server = FeedServer(SyntheticCollection(seed), latency)
+    print(f"Serving feeds at http://127.0.0.1:{port}")
+    web.run_app(server.app(), host="127.0.0.1", port=port, print=None)
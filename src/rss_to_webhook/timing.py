@@ -0,0 +1,362 @@
+"""Times how long each part of a run takes, for each comic.
+
+A `Timings` is handed to the checks, which wrap each phase of their work in a
+`Timings.span`, labelled with the comic it's for. At the end of the run,
+`Timings.summary` adds the spans up into a `RunTimings`, which names the
+slowest phases and comics and can be written out as JSON.
+
+The checks are given `NO_TIMINGS` by default, whose spans do nothing, so they
+cost one method call each. Runs started from the command line are always timed,
+since their records (see `db_types.RunRecord`) include each phase's total.
+
+The phases are:
+
+- `load_summaries`, `load_details`, `load_dailies`: Reading comics, or waiting
+  for them to be read.
+- `dns`, `connect`: Resolving a feed's host, and connecting to it.
+- `ttfb`: From requesting a feed until its headers arrive, which includes
+  `dns` and `connect`.
+- `download`: Reading the body of a feed.
+- `hash`, `parse`: Hashing and parsing a feed.
+- `diff`: Finding a changed feed's new entries.
+- `messages`: Building and encoding a comic's messages.
+- `save`: Queueing a comic's new state, posts and daily entries to be written.
+- `write`: Everything from the first comic being saved until every write has
+  finished.
+- `post`: Making a post, including any time spent sleeping for rate limits.
+- `rate_limit`: Sleeping for rate limits, within `post`.
+
+Timings can also watch the event loop while feeds are checked (see
+`Timings.watch_loop`). Any synchronous work on the loop, like parsing a feed,
+holds up every other feed, and can make their reads time out, so each time the
+loop is held up for longer than `Timings.lag_threshold` it's recorded as a
+stall, along with the comic and phase that were running.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from contextlib import nullcontext
+from dataclasses import dataclass
+from operator import itemgetter
+from typing import TYPE_CHECKING, Any, NotRequired, TypedDict
+
+from rss_to_webhook.logs import logger
+
+if TYPE_CHECKING:  # pragma: no cover
+    from contextlib import AbstractContextManager
+    from types import SimpleNamespace
+
+    import aiohttp
+
+#: How many comics are named in a summary
+SLOWEST_COMICS = 10
+
+#: How often the event loop is checked for stalls, in seconds
+LAG_INTERVAL = 0.05
+
+
+class PhaseTiming(TypedDict):
+    """How long one phase took over a whole run."""
+
+    phase: str
+    count: int
+    total: float
+    max: float
+
+
+class ComicTiming(TypedDict):
+    """How long each phase took for one comic."""
+
+    title: str
+    total: float
+    phases: dict[str, float]
+
+
+class Stall(TypedDict):
+    """A time the event loop was held up for longer than the threshold.
+
+    `phase` and `title` are what was running on the loop at the time, and are
+    `None` if it was something that isn't timed.
+    """
+
+    seconds: float
+    phase: str | None
+    title: str | None
+
+
+class LoopLag(TypedDict):
+    """How late the event loop was to run things, from every sample."""
+
+    samples: int
+    mean: float
+    max: float
+    stalls: list[Stall]
+
+
+class RunTimings(TypedDict):
+    """A summary of a run's timings, with everything in seconds.
+
+    `phases` is sorted by total time, and `slowest_comics` has the comics that
+    took longest over every phase, slowest first. Phases of different comics
+    run at the same time, so the totals can add up to more than `duration`.
+    `loop_lag` is only there if the event loop was watched, and has the longest
+    stalls first.
+    """
+
+    duration: float
+    phases: list[PhaseTiming]
+    slowest_comics: list[ComicTiming]
+    loop_lag: NotRequired[LoopLag]
+
+
+@dataclass(frozen=True, slots=True)
+class Span:
+    """How long one phase took.
+
+    Attributes:
+        phase: What was being done.
+        title: The title of the comic it was done for, if it was for one comic.
+        seconds: How long it took.
+    """
+
+    phase: str
+    title: str | None
+    seconds: float
+
+
+class _Timer:
+    """Times a `with` block, recording it as a span when the block exits."""
+
+    __slots__ = ("phase", "start", "timings", "title")
+
+    def __init__(self, timings: Timings, phase: str, title: str | None) -> None:
+        self.timings = timings
+        self.phase = phase
+        self.title = title
+        self.start = 0.0
+
+    def __enter__(self) -> None:
+        self.start = time.perf_counter()
+
+    def __exit__(self, *_exc_info: object) -> None:
+        self.timings.record(self.phase, time.perf_counter() - self.start, self.title)
+
+
+class _BlockingTimer(_Timer):
+    """Times a `with` block that holds up the event loop until it exits."""
+
+    __slots__ = ()
+
+    def __exit__(self, *_exc_info: object) -> None:
+        span = Span(self.phase, self.title, time.perf_counter() - self.start)
+        self.timings.spans.append(span)
+        if self.timings.lag_threshold is not None:
+            self.timings.blockers.append(span)
+
+
+class Timings:
+    """Records how long each phase of a run takes.
+
+    Spans can be recorded from any thread.
+
+    Attributes:
+        spans: Every span recorded so far.
+        start: When the timings started, from `time.perf_counter`.
+        lag_threshold: How many seconds the event loop has to be held up for
+            to count as a stall, or `None` to not watch the loop.
+        lags: How late the event loop was each time it was sampled.
+        stalls: Every stall so far.
+        blockers: The blocking spans since the event loop was last sampled,
+            one of which held it up if it was late.
+    """
+
+    spans: list[Span]
+    start: float
+    lag_threshold: float | None
+    lags: list[float]
+    stalls: list[Stall]
+    blockers: list[Span]
+
+    def __init__(self, lag_threshold: float | None = None) -> None:
+        """Starts timing a run."""
+        self.spans = []
+        self.start = time.perf_counter()
+        self.lag_threshold = lag_threshold
+        self.lags = []
+        self.stalls = []
+        self.blockers = []
+
+    @property
+    def enabled(self) -> bool:
+        """Whether spans are being recorded."""
+        return True
+
+    def span(
+        self, phase: str, title: str | None = None
+    ) -> AbstractContextManager[None]:
+        """Times a `with` block as a span of `phase`, for the comic called `title`."""
+        return _Timer(self, phase, title)
+
+    def blocking(
+        self, phase: str, title: str | None = None
+    ) -> AbstractContextManager[None]:
+        """Times synchronous work on the event loop, like `span`.
+
+        If the loop is being watched and the work holds it up for too long, the
+        stall is blamed on it.
+        """
+        return _BlockingTimer(self, phase, title)
+
+    def record(self, phase: str, seconds: float, title: str | None = None) -> None:
+        """Records a span that was timed some other way."""
+        # Appending is atomic, so this doesn't need a lock
+        self.spans.append(Span(phase, title, seconds))
+
+    async def watch_loop(self, interval: float = LAG_INTERVAL) -> None:
+        """Samples how late the event loop is to run things, until cancelled.
+
+        Every `interval` seconds this sleeps, and measures how much later than
+        asked it woke up. Nothing else can run on the loop while something is
+        holding it up, so whatever held it up has already finished by then.
+        A stall is blamed on the longest `blocking` span since the last sample,
+        as long as that span covers at least half of the stall.
+        """
+        threshold = self.lag_threshold
+        if threshold is None:
+            return
+        while True:
+            self.blockers.clear()
+            expected = time.perf_counter() + interval
+            await asyncio.sleep(interval)
+            lag = max(time.perf_counter() - expected, 0)
+            self.lags.append(lag)
+            if lag <= threshold:
+                continue
+            blocker = max(self.blockers, key=lambda span: span.seconds, default=None)
+            if blocker is not None and blocker.seconds >= lag / 2:
+                stall: Stall = {
+                    "seconds": lag,
+                    "phase": blocker.phase,
+                    "title": blocker.title,
+                }
+            else:
+                stall = {"seconds": lag, "phase": None, "title": None}
+            self.stalls.append(stall)
+            logger.warning(
+                "Event loop stalled for %.3fs during %s",
+                lag,
+                stall["phase"] or "something untimed",
+                extra={"comic": stall["title"] or "Unknown"},
+            )
+
+    def trace_config(self) -> aiohttp.TraceConfig:
+        """Times DNS lookups and connections made by an aiohttp session.
+
+        Requests are matched to comics by their `trace_request_ctx`, which
+        should be a dictionary with the comic's `title`.
+        """
+        import aiohttp  # noqa: PLC0415 # Only the regular checks need it
+
+        config = aiohttp.TraceConfig()
+
+        def timer(phase: str) -> tuple[Any, Any]:
+            async def on_start(  # noqa: RUF029 # aiohttp awaits it
+                _session: aiohttp.ClientSession,
+                context: SimpleNamespace,
+                _params: Any,  # noqa: ANN401
+            ) -> None:
+                setattr(context, phase, time.perf_counter())
+
+            async def on_end(  # noqa: RUF029 # aiohttp awaits it
+                _session: aiohttp.ClientSession,
+                context: SimpleNamespace,
+                _params: Any,  # noqa: ANN401
+            ) -> None:
+                title = (context.trace_request_ctx or {}).get("title")
+                self.record(phase, time.perf_counter() - getattr(context, phase), title)
+
+            return on_start, on_end
+
+        dns_start, dns_end = timer("dns")
+        config.on_dns_resolvehost_start.append(dns_start)
+        config.on_dns_resolvehost_end.append(dns_end)
+        connect_start, connect_end = timer("connect")
+        config.on_connection_create_start.append(connect_start)
+        config.on_connection_create_end.append(connect_end)
+        return config
+
+    def summary(self, slowest: int = SLOWEST_COMICS) -> RunTimings:
+        """Adds up the spans recorded so far.
+
+        Args:
+            slowest: How many comics to name.
+
+        Returns:
+            The total and longest time for each phase, and the `slowest` comics.
+        """
+        phases: dict[str, PhaseTiming] = {}
+        comics: dict[str, ComicTiming] = {}
+        for span in list(self.spans):
+            phase = phases.setdefault(
+                span.phase, {"phase": span.phase, "count": 0, "total": 0, "max": 0}
+            )
+            phase["count"] += 1
+            phase["total"] += span.seconds
+            phase["max"] = max(phase["max"], span.seconds)
+            if span.title is not None:
+                comic = comics.setdefault(
+                    span.title, {"title": span.title, "total": 0, "phases": {}}
+                )
+                comic["total"] += span.seconds
+                comic["phases"][span.phase] = (
+                    comic["phases"].get(span.phase, 0) + span.seconds
+                )
+        summary: RunTimings = {
+            "duration": time.perf_counter() - self.start,
+            "phases": sorted(phases.values(), key=itemgetter("total"), reverse=True),
+            "slowest_comics": sorted(
+                comics.values(), key=itemgetter("total"), reverse=True
+            )[:slowest],
+        }
+        if self.lags:
+            summary["loop_lag"] = {
+                "samples": len(self.lags),
+                "mean": sum(self.lags) / len(self.lags),
+                "max": max(self.lags),
+                "stalls": sorted(self.stalls, key=itemgetter("seconds"), reverse=True),
+            }
+        return summary
+
+
+_NOTHING = nullcontext()
+
+
+class _NoTimings(Timings):
+    """Timings that don't record anything."""
+
+    @property
+    def enabled(self) -> bool:
+        return False
+
+    def span(  # noqa: PLR6301
+        self,
+        phase: str,  # noqa: ARG002
+        title: str | None = None,  # noqa: ARG002
+    ) -> AbstractContextManager[None]:
+        return _NOTHING
+
+    def blocking(  # noqa: PLR6301
+        self,
+        phase: str,  # noqa: ARG002
+        title: str | None = None,  # noqa: ARG002
+    ) -> AbstractContextManager[None]:
+        return _NOTHING
+
+    def record(self, phase: str, seconds: float, title: str | None = None) -> None:
+        pass
+
+
+#: Timings for when nobody asked for them, which record nothing
+NO_TIMINGS: Timings = _NoTimings()
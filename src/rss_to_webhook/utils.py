@@ -6,7 +6,7 @@ are in the standard library in future versions.
 More specific functionality should go in more specific files.
 """
 
-from collections.abc import Generator, Sequence
+from collections.abc import Generator, Iterable
 from itertools import islice
 from typing import TypeVar
 
@@ -14,7 +14,7 @@ _T_co = TypeVar("_T_co", covariant=True)
 
 
 def batched(
-    iterable: Sequence[_T_co], n: int
+    iterable: Iterable[_T_co], n: int
 ) -> Generator[tuple[_T_co, ...], None, None]:
     """Batch data from the iterable into tuples of length at most n.
 
@@ -1,4 +1,7 @@
+from typing import Any
+
 import pytest
+from mongomock.collection import BulkOperationBuilder
 
 
 def pytest_addoption(parser: pytest.Parser) -> None:
@@ -36,3 +39,24 @@ def pytest_collection_modifyitems(
         for item in items:
             if "slow" in item.keywords:
                 item.add_marker(skip_slow)
+
+
+@pytest.fixture(autouse=True)
+def _mongomock_bulk_sort(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Lets mongomock run bulk writes from newer versions of pymongo.
+
+    Since pymongo 4.11, `UpdateOne` passes a `sort` argument when it's added to
+    a bulk write, which mongomock doesn't accept yet. Nothing here sorts updates,
+    so it's dropped.
+    """
+    add_update = BulkOperationBuilder.add_update
+
+    def add_update_without_sort(
+        self: BulkOperationBuilder,
+        *args: Any,  # noqa: ANN401
+        sort: object = None,  # noqa: ARG001
+        **kwargs: Any,  # noqa: ANN401
+    ) -> None:
+        add_update(self, *args, **kwargs)
+
+    monkeypatch.setattr(BulkOperationBuilder, "add_update", add_update_without_sort)
@@ -8,7 +8,6 @@ import pytest
 from bson import Int64, ObjectId
 from dotenv import load_dotenv
 from mongomock import Collection, MongoClient
-from pymongo.results import UpdateResult
 from requests import HTTPError
 from responses import RequestsMock
 
@@ -113,7 +112,6 @@ def test_add_valid_comic() -> None:
         "username": "KiwiFlea",
         "avatar_url": "https://i.imgur.com/XYbqy7f.png",
         "feed_hash": mmh3.hash_bytes(example_feed, HASH_SEED),
-        "dailies": [],
         "last_entries": [
             {
                 "title": "Sleepless Domain - Chapter 21 - Interstitial",
@@ -173,7 +171,6 @@ def test_sets_caching_headers(rss: RequestsMock) -> None:
         "feed_hash": mmh3.hash_bytes(example_feed, HASH_SEED),
         "etag": '"f56-6062f676a7367-gzip"',
         "last_modified": "Wed, 27 Sep 2023 20:10:14 GMT",
-        "dailies": [],
         "last_entries": [
             {
                 "title": "Sleepless Domain - Chapter 21 - Interstitial",
@@ -207,10 +204,7 @@ def test_no_changes(collection_with_sd: Collection[Comic], rss: RequestsMock) ->
         "username": "KiwiFlea",
         "avatar_url": "https://i.imgur.com/XYbqy7f.png",
     }
-    update_result = add_to_collection(comic_data, collection_with_sd, HASH_SEED)
-    assert isinstance(update_result, UpdateResult)
-    assert update_result.matched_count == 1
-    assert update_result.modified_count == 0
+    assert add_to_collection(comic_data, collection_with_sd, HASH_SEED) is False
     assert len(rss.calls) == 0
 
 
@@ -224,10 +218,7 @@ def test_update(collection_with_sd: Collection[Comic], rss: RequestsMock) -> Non
         "username": "KiwiFlea",
         "avatar_url": "https://i.imgur.com/XYbqy7f.png",
     }
-    update_result = add_to_collection(comic_data, collection_with_sd, HASH_SEED)
-    assert isinstance(update_result, UpdateResult)
-    assert update_result.matched_count == 1
-    assert update_result.modified_count == 1
+    assert add_to_collection(comic_data, collection_with_sd, HASH_SEED) is True
     assert len(rss.calls) == 0
     results = list(collection_with_sd.find({"title": comic_data["title"]}))
     assert len(results) == 1
@@ -0,0 +1,215 @@
+import asyncio
+import threading
+from collections.abc import Generator
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+import bson
+import pytest
+from mongomock import Collection, MongoClient
+from pymongo import UpdateOne
+
+from rss_to_webhook.async_db import ThreadPoolStorage
+from rss_to_webhook.storage import BulkWriter, MongoStorage
+
+
+@pytest.fixture
+def collection() -> "Collection[Any]":
+    client: MongoClient[Any] = MongoClient()
+    collection: Collection[Any] = client.db.collection
+    collection.insert_many([{"_id": i, "title": f"Comic {i}"} for i in (2, 0, 1)])
+    return collection
+
+
+@pytest.fixture
+def executor() -> Generator[ThreadPoolExecutor, None, None]:
+    with ThreadPoolExecutor(2, thread_name_prefix="test-db") as executor:
+        yield executor
+
+
+def test_load_details(
+    collection: "Collection[Any]",
+    executor: ThreadPoolExecutor,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Queries are run and read in the thread pool."""
+    threads: list[str] = []
+    find = collection.find
+
+    def logged_find(*args: Any, **kwargs: Any) -> Any:  # noqa: ANN401
+        threads.append(threading.current_thread().name)
+        return find(*args, **kwargs)
+
+    monkeypatch.setattr(collection, "find", logged_find)
+    comics = ThreadPoolStorage(MongoStorage(collection), executor)
+    found = asyncio.run(comics.load_details([2, 1]))  # type: ignore [list-item]
+    assert {comic["_id"] for comic in found} == {1, 2}
+    assert threads[0].startswith("test-db")
+
+
+def test_counts_bytes_read(
+    collection: "Collection[Any]", executor: ThreadPoolExecutor
+) -> None:
+    """The size of everything read is counted, as BSON."""
+    comics = ThreadPoolStorage(MongoStorage(collection), executor)
+
+    async def read() -> list[Any]:
+        return [batch async for batch in comics.load_summaries(2)]
+
+    summaries = [summary for batch in asyncio.run(read()) for summary in batch]
+    assert comics.summary_bytes == sum(map(len, map(bson.encode, summaries)))
+    [detail] = asyncio.run(comics.load_details([0]))  # type: ignore [list-item]
+    assert comics.detail_bytes == len(bson.encode(detail))
+
+
+def test_run_overlaps(
+    collection: "Collection[Any]", executor: ThreadPoolExecutor
+) -> None:
+    """The event loop keeps running while a call is in the thread pool."""
+    comics = ThreadPoolStorage(MongoStorage(collection), executor)
+    started = threading.Event()
+    finish = threading.Event()
+
+    def slow_count() -> int:
+        started.set()
+        finish.wait(5)
+        return collection.count_documents({})
+
+    async def main() -> int:
+        count = asyncio.ensure_future(comics.run(slow_count))
+        while not started.is_set():  # noqa: ASYNC110 # Polling is the point
+            await asyncio.sleep(0.01)
+        # The loop can still run other coroutines while the call is blocked
+        await asyncio.sleep(0)
+        finish.set()
+        return await count
+
+    assert asyncio.run(main()) == 3  # noqa: PLR2004
+
+
+def test_background_writes_wait_for_flush_first(
+    collection: "Collection[Any]",
+    executor: ThreadPoolExecutor,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """A batch is only written after the batches it depends on."""
+    order: list[str] = []
+    first_started = threading.Event()
+    bulk_write = collection.bulk_write
+
+    def slow_bulk_write(requests: list[Any], **kwargs: Any) -> Any:  # noqa: ANN401
+        first_started.set()
+        threading.Event().wait(0.1)
+        order.append("first")
+        return bulk_write(requests, **kwargs)
+
+    def logged_bulk_write(requests: list[Any], **kwargs: Any) -> Any:  # noqa: ANN401
+        order.append("then")
+        return bulk_write(requests, **kwargs)
+
+    other = collection.database.other
+    monkeypatch.setattr(collection, "bulk_write", slow_bulk_write)
+    monkeypatch.setattr(other, "bulk_write", logged_bulk_write)
+    with (
+        BulkWriter(collection, 1, executor=executor) as first,
+        BulkWriter(other, 1, flush_first=first, executor=executor) as then,
+    ):
+        first.add(UpdateOne({"_id": 0}, {"$set": {"seen": True}}))
+        then.add(UpdateOne({"_id": 0}, {"$set": {"seen": True}}, upsert=True))
+        first_started.wait(5)
+    assert order == ["first", "then"]
+    assert (first.batches, then.batches) == (1, 1)
+    assert first.background == then.background == []
+
+
+def test_background_writes_wait_through_empty_writers(
+    collection: "Collection[Any]",
+    executor: ThreadPoolExecutor,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """A batch waits for every writer before it, even ones with nothing to write."""
+    order: list[str] = []
+    first_started = threading.Event()
+    bulk_write = collection.bulk_write
+
+    def slow_bulk_write(requests: list[Any], **kwargs: Any) -> Any:  # noqa: ANN401
+        first_started.set()
+        threading.Event().wait(0.1)
+        order.append("first")
+        return bulk_write(requests, **kwargs)
+
+    def logged_bulk_write(requests: list[Any], **kwargs: Any) -> Any:  # noqa: ANN401
+        order.append("last")
+        return bulk_write(requests, **kwargs)
+
+    last = collection.database.last
+    monkeypatch.setattr(collection, "bulk_write", slow_bulk_write)
+    monkeypatch.setattr(last, "bulk_write", logged_bulk_write)
+    with (
+        BulkWriter(collection, 1, executor=executor) as first,
+        BulkWriter(
+            collection.database.middle, 1, flush_first=first, executor=executor
+        ) as middle,
+        BulkWriter(last, 1, flush_first=middle, executor=executor) as then,
+    ):
+        first.add(UpdateOne({"_id": 0}, {"$set": {"seen": True}}))
+        then.add(UpdateOne({"_id": 0}, {"$set": {"seen": True}}, upsert=True))
+        first_started.wait(5)
+    assert order == ["first", "last"]
+    assert middle.batches == 0
+
+
+def test_background_write_errors(
+    collection: "Collection[Any]",
+    executor: ThreadPoolExecutor,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Errors in background writes are raised, and later batches aren't written."""
+
+    def failing_bulk_write(*_args: Any, **_kwargs: Any) -> Any:  # noqa: ANN401
+        msg = "Database unavailable"
+        raise ConnectionError(msg)
+
+    monkeypatch.setattr(collection, "bulk_write", failing_bulk_write)
+    other = collection.database.other
+
+    def write_both() -> None:
+        with (
+            BulkWriter(collection, 1, executor=executor) as first,
+            BulkWriter(other, 1, flush_first=first, executor=executor) as then,
+        ):
+            first.add(UpdateOne({"_id": 0}, {"$set": {"seen": True}}))
+            then.add(UpdateOne({"_id": 0}, {"$set": {"seen": True}}, upsert=True))
+
+    with pytest.raises(ConnectionError):
+        write_both()
+    assert other.count_documents({}) == 0
+
+
+def test_load_summaries_reads_ahead(
+    collection: "Collection[Any]",
+    executor: ThreadPoolExecutor,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """The next batch of summaries is read while the current one is being used."""
+    read_ahead = threading.Event()
+
+    def batches(_batch_size: int) -> Generator[list[Any], None, None]:
+        yield [{"title": "A"}]
+        read_ahead.set()
+        yield [{"title": "B"}]
+
+    storage = MongoStorage(collection)
+    monkeypatch.setattr(storage, "load_summaries", batches)
+    comics = ThreadPoolStorage(storage, executor)
+
+    async def main() -> list[str]:
+        titles: list[str] = []
+        async for batch in comics.load_summaries():
+            # The first batch is only used once the second has been read
+            while not read_ahead.is_set():  # noqa: ASYNC110 # Polling is the point
+                await asyncio.sleep(0.01)
+            titles.extend(summary["title"] for summary in batch)
+        return titles
+
+    assert asyncio.run(asyncio.wait_for(main(), 5)) == ["A", "B"]
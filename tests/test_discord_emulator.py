@@ -0,0 +1,391 @@
+import itertools
+import time
+from collections.abc import Generator
+from typing import TYPE_CHECKING, Any
+
+import pytest
+import requests
+from bson import ObjectId
+from mongomock import MongoClient
+from requests import HTTPError
+
+from rss_to_webhook.check_feeds_and_update import (
+    RateLimiter,
+    _make_posts,
+    drain_outbox,
+)
+from rss_to_webhook.discord_emulator import DiscordEmulator, EmulatedWebhook
+from rss_to_webhook.discord_types import Message
+from rss_to_webhook.storage import _outbox
+
+if TYPE_CHECKING:
+    from feedparser.util import Entry
+
+    from rss_to_webhook.db_types import Comic
+
+MAIN = EmulatedWebhook(id=1000, token="main-token", channel_id=2000)  # noqa: S106
+THREADS = EmulatedWebhook(id=1001, token="thread-token", channel_id=2001)  # noqa: S106
+THREAD_ID = 3000
+
+
+@pytest.fixture
+def emulator() -> DiscordEmulator:
+    return DiscordEmulator([MAIN, THREADS], threads={THREADS.channel_id: {THREAD_ID}})
+
+
+@pytest.fixture
+def base_url(emulator: DiscordEmulator) -> Generator[str, None, None]:
+    with emulator.serve_in_thread() as url:
+        yield url
+
+
+@pytest.fixture
+def message() -> Message:
+    return {
+        "embeds": [{
+            "color": 0,
+            "title": "**Test Page**",
+            "url": "https://example.com",
+            "description": "New Test Comic!",
+        }],
+        "username": "Tester",
+        "avatar_url": "https://i.imgur.com/XYbqy7f.png",
+        "content": "<@everyone>",
+    }
+
+
+def test_posts(base_url: str, emulator: DiscordEmulator, message: Message) -> None:
+    """A valid message is posted, and the response has rate-limit headers."""
+    response = requests.post(
+        DiscordEmulator.webhook_url(base_url, MAIN), json=message, timeout=5
+    )
+    assert response.status_code == 204  # noqa: PLR2004
+    assert response.headers["X-RateLimit-Limit"] == "5"
+    assert response.headers["X-RateLimit-Remaining"] == "4"
+    assert len(emulator.messages) == 1
+    assert emulator.messages[0].body == message
+    assert emulator.messages[0].channel_id == MAIN.channel_id
+
+
+def test_wait_returns_message(base_url: str, message: Message) -> None:
+    response = requests.post(
+        DiscordEmulator.webhook_url(base_url, MAIN) + "?wait=true",
+        json=message,
+        timeout=5,
+    )
+    assert response.status_code == 200  # noqa: PLR2004
+    assert response.json()["content"] == message["content"]
+    assert response.json()["webhook_id"] == str(MAIN.id)
+
+
+def test_posts_in_thread(
+    base_url: str, emulator: DiscordEmulator, message: Message
+) -> None:
+    url = DiscordEmulator.webhook_url(base_url, THREADS)
+    response = requests.post(f"{url}?thread_id={THREAD_ID}", json=message, timeout=5)
+    assert response.status_code == 204  # noqa: PLR2004
+    assert emulator.messages[0].thread_id == THREAD_ID
+    assert emulator.messages[0].channel_id == THREAD_ID
+
+
+@pytest.mark.parametrize(
+    ("path", "status", "body"),
+    [
+        (
+            "/api/webhooks/1000/wrong-token",
+            401,
+            {"message": "Invalid Webhook Token", "code": 50027},
+        ),
+        (
+            "/api/webhooks/9999/main-token",
+            404,
+            {"message": "Unknown Webhook", "code": 10015},
+        ),
+        (
+            "/api/webhooks/abc/main-token",
+            400,
+            {"webhook_id": ['Value "abc" is not snowflake.']},
+        ),
+        (
+            "/api/webhooks/1000",
+            405,
+            {"message": "405: Method Not Allowed", "code": 0},
+        ),
+        ("/api/webhooks/1000/", 404, {"message": "404: Not Found", "code": 0}),
+        (
+            "/api/webhooks/1001/thread-token?thread_id=4000",
+            400,
+            {"message": "Unknown Channel", "code": 10003},
+        ),
+    ],
+)
+def test_request_errors(
+    base_url: str, message: Message, path: str, status: int, body: dict[str, Any]
+) -> None:
+    response = requests.post(base_url + path, json=message, timeout=5)
+    assert response.status_code == status
+    assert response.json() == body
+
+
+@pytest.mark.parametrize(
+    ("query", "changes", "errors"),
+    [
+        (
+            "?wait=maybe",
+            {},
+            {
+                "wait": {
+                    "_errors": [{
+                        "code": "BOOLEAN_TYPE_CONVERT",
+                        "message": "Must be either true or false.",
+                    }]
+                }
+            },
+        ),
+        (
+            "",
+            {"content": "a" * 2001},
+            {
+                "content": {
+                    "_errors": [{
+                        "code": "BASE_TYPE_MAX_LENGTH",
+                        "message": "Must be 2000 or fewer in length.",
+                    }]
+                }
+            },
+        ),
+        (
+            "",
+            {"embeds": [{"title": "a"}] * 11},
+            {
+                "embeds": {
+                    "_errors": [{
+                        "code": "BASE_TYPE_MAX_LENGTH",
+                        "message": "Must be 10 or fewer in length.",
+                    }]
+                }
+            },
+        ),
+        (
+            "",
+            {"embeds": [{"title": "a", "color": 0x1000000}]},
+            {
+                "embeds": {
+                    "0": {
+                        "color": {
+                            "_errors": [{
+                                "code": "NUMBER_TYPE_MAX",
+                                "message": (
+                                    "int value should be less than or equal to"
+                                    " 16777215."
+                                ),
+                            }]
+                        }
+                    }
+                }
+            },
+        ),
+        (
+            "",
+            {"embeds": [{"title": "a", "url": "ttps://example.com"}]},
+            {
+                "embeds": {
+                    "0": {
+                        "url": {
+                            "_errors": [{
+                                "code": "URL_TYPE_INVALID_SCHEME",
+                                "message": (
+                                    'Scheme "ttps" is not supported. Scheme must be'
+                                    " one of ('http', 'https')."
+                                ),
+                            }]
+                        }
+                    }
+                }
+            },
+        ),
+        (
+            "",
+            {"avatar_url": "https://example..com"},
+            {
+                "avatar_url": {
+                    "_errors": [{
+                        "code": "URL_TYPE_INVALID_URL",
+                        "message": "Not a well formed URL.",
+                    }]
+                }
+            },
+        ),
+        (
+            "",
+            {"embeds": [{"description": "a" * 4000}, {"description": "a" * 4000}]},
+            {
+                "embeds": {
+                    "_errors": [{
+                        "code": "MAX_EMBED_SIZE_EXCEEDED",
+                        "message": "Embed size exceeds maximum size of 6000",
+                    }]
+                }
+            },
+        ),
+    ],
+)
+def test_form_errors(
+    base_url: str,
+    message: Message,
+    query: str,
+    changes: dict[str, Any],
+    errors: dict[str, Any],
+) -> None:
+    url = DiscordEmulator.webhook_url(base_url, MAIN) + query
+    response = requests.post(url, json=message | changes, timeout=5)  # type: ignore [operator]
+    assert response.status_code == 400  # noqa: PLR2004
+    assert response.json() == {
+        "message": "Invalid Form Body",
+        "code": 50035,
+        "errors": errors,
+    }
+
+
+def test_empty_message(base_url: str) -> None:
+    response = requests.post(
+        DiscordEmulator.webhook_url(base_url, MAIN),
+        json={"content": None, "embeds": []},
+        timeout=5,
+    )
+    assert response.status_code == 400  # noqa: PLR2004
+    assert response.json() == {"message": "Cannot send an empty message", "code": 50006}
+
+
+def test_bucket_rate_limit(
+    base_url: str, emulator: DiscordEmulator, message: Message
+) -> None:
+    """Ignoring the `X-RateLimit-*` headers gets a 429."""
+    url = DiscordEmulator.webhook_url(base_url, MAIN)
+    statuses = [
+        requests.post(url, json=message, timeout=5).status_code for _ in range(6)
+    ]
+    assert statuses == [204] * 5 + [429]
+    assert emulator.rate_limited == 1
+    assert len(emulator.messages) == 5  # noqa: PLR2004
+
+
+def test_hidden_rate_limit(base_url: str, emulator: DiscordEmulator) -> None:
+    """Posting over 30 messages a minute to one channel gets a 429."""
+    emulator.bucket_limit = 100
+    emulator.hidden_limit = 3
+    url = DiscordEmulator.webhook_url(base_url, MAIN)
+    responses = [
+        requests.post(url, json={"content": str(i)}, timeout=5) for i in range(4)
+    ]
+    assert [response.status_code for response in responses] == [204] * 3 + [429]
+    assert responses[-1].headers["X-RateLimit-Scope"] == "shared"
+    # The headers say everything is fine, which is why the limit is so annoying
+    assert responses[-1].headers["X-RateLimit-Remaining"] != "0"
+
+
+def test_latency(base_url: str, emulator: DiscordEmulator) -> None:
+    emulator.latency = 0.2
+    start = time.perf_counter()
+    requests.post(
+        DiscordEmulator.webhook_url(base_url, MAIN), json={"content": "a"}, timeout=5
+    )
+    assert time.perf_counter() - start >= emulator.latency
+
+
+def test_rate_limiter_obeys_limits(base_url: str, emulator: DiscordEmulator) -> None:
+    """`RateLimiter` posts many messages without ever being rate-limited.
+
+    Both windows are shortened so this runs in about a second, which means the
+    rate limiter's hidden window has to be shortened to match.
+    """
+    emulator.bucket_window = 0.05
+    emulator.hidden_window = 0.3
+    url = DiscordEmulator.webhook_url(base_url, MAIN)
+    with RateLimiter() as rate_limiter:
+        rate_limiter.fuzzed_window = 0.35  # type: ignore [assignment]
+        for i in range(65):
+            rate_limiter.post(url, {"content": str(i), "embeds": []})
+    assert emulator.rate_limited == 0
+    assert [message.body["content"] for message in emulator.messages] == [
+        str(i) for i in range(65)
+    ]
+
+
+def test_rate_limiter_raises_on_invalid(base_url: str) -> None:
+    url = DiscordEmulator.webhook_url(base_url, MAIN)
+    with RateLimiter() as rate_limiter, pytest.raises(HTTPError):
+        rate_limiter.post(url, {"content": "a" * 2001, "embeds": []})
+
+
+def test_drain_outbox(base_url: str, emulator: DiscordEmulator) -> None:
+    """Queued updates are drained in order, to the right webhooks and threads."""
+    client: MongoClient[Comic] = MongoClient()
+    comics = client.db.collection
+    outbox = _outbox(comics)
+    seq = itertools.count()
+    for i in range(3):
+        comic: Comic = {
+            "_id": ObjectId(),
+            "title": f"Comic {i}",
+            "feed_url": f"https://example.com/{i}/rss",
+            "role_id": 1234,
+            "color": 0xFFFFFF,
+            "thread_id": THREAD_ID,
+            "feed_hash": b"",
+            "last_entries": [],
+            "dailies": [],
+        }
+        entries: list[Entry] = [
+            {"link": f"https://example.com/{i}/{page}"} for page in range(2)
+        ]
+        outbox.insert_many(_make_posts(comic, entries, {"feed_hash": bytes([i])}, seq))
+    posted = drain_outbox(
+        comics,
+        DiscordEmulator.webhook_url(base_url, MAIN),
+        DiscordEmulator.webhook_url(base_url, THREADS),
+    )
+    assert posted == 6  # noqa: PLR2004
+    assert emulator.rate_limited == 0
+    assert [message.thread_id for message in emulator.messages] == [
+        None,
+        THREAD_ID,
+    ] * 3
+    assert [message.body["embeds"][0]["title"] for message in emulator.messages] == [
+        f"**Comic {i}**" for i in range(3) for _ in range(2)
+    ]
+
+
+def test_drain_waits_after_rate_limit(base_url: str, emulator: DiscordEmulator) -> None:
+    """After a 429, later posts wait as long as Discord asked instead of failing."""
+    emulator.bucket_limit = 100
+    emulator.hidden_limit = 3
+    emulator.hidden_window = 0.3
+    client: MongoClient[Comic] = MongoClient()
+    comics = client.db.collection
+    outbox = _outbox(comics)
+    seq = itertools.count()
+    for i in range(6):
+        comic: Comic = {
+            "_id": ObjectId(),
+            "title": f"Comic {i}",
+            "feed_url": f"https://example.com/{i}/rss",
+            "role_id": 1234,
+            "color": 0xFFFFFF,
+            "feed_hash": b"",
+            "last_entries": [],
+            "dailies": [],
+        }
+        entries: list[Entry] = [{"link": f"https://example.com/{i}/0"}]
+        outbox.insert_many(_make_posts(comic, entries, {"feed_hash": bytes([i])}, seq))
+    with RateLimiter() as rate_limiter:
+        posted = drain_outbox(
+            comics,
+            DiscordEmulator.webhook_url(base_url, MAIN),
+            DiscordEmulator.webhook_url(base_url, THREADS),
+            rate_limiter,
+        )
+    assert posted == 5  # noqa: PLR2004
+    assert emulator.rate_limited == 1
+    assert rate_limiter.slept == pytest.approx(0.529)
+    assert [post["title"] for post in outbox.find({"status": "pending"})] == ["Comic 3"]
@@ -1,8 +1,13 @@
+import asyncio
+import itertools
 import json
 import os
 import time
-from collections.abc import Generator
+from collections.abc import Generator, Sequence
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
 
+import feedparser
 import mmh3
 import pytest
 import responses
@@ -14,14 +19,33 @@ from requests import HTTPError
 from responses import CallList, RequestsMock, matchers
 from yarl import URL
 
-from rss_to_webhook import constants
+from rss_to_webhook import check_feeds_and_update, constants, metrics
 from rss_to_webhook.check_feeds_and_update import (
+    FetchStats,
     RateLimiter,
+    _get_feed_changes,
+    _make_posts,
     daily_checks,
+    drain_outbox,
     regular_checks,
 )
 from rss_to_webhook.constants import HASH_SEED
+from rss_to_webhook.costs import Ledger
 from rss_to_webhook.db_types import Comic
+from rss_to_webhook.stats import top_costs
+from rss_to_webhook.storage import (
+    MongoStorage,
+    SQLiteStorage,
+    _feed_errors,
+    _outbox,
+    _pending_dailies,
+    _runs,
+    migrate_dailies,
+)
+from rss_to_webhook.timing import Timings
+
+if TYPE_CHECKING:
+    from feedparser.util import Entry
 
 load_dotenv(".env.example")
 WEBHOOK_URL = os.environ["WEBHOOK_URL"]
@@ -363,6 +387,21 @@ def get_embeds_by_message(calls: CallList) -> list[list[dict[str, str]]]:
     return embeds
 
 
+def log_bulk_writes(
+    collection: "Collection[Any]", monkeypatch: pytest.MonkeyPatch
+) -> list[int]:
+    """Records the number of operations in each bulk write to `collection`."""
+    batch_sizes: list[int] = []
+    bulk_write = collection.bulk_write
+
+    def logged_bulk_write(requests: list[Any], **kwargs: Any) -> Any:  # noqa: ANN401
+        batch_sizes.append(len(requests))
+        return bulk_write(requests, **kwargs)
+
+    monkeypatch.setattr(collection, "bulk_write", logged_bulk_write)
+    return batch_sizes
+
+
 @pytest.mark.usefixtures("_no_sleep", "rss")
 def test_post_all_new_updates(comic: Comic, webhook: RequestsMock) -> None:
     """The script works when all updates are new and there are many of them.
@@ -516,10 +555,12 @@ def test_updates_error_count(comic: Comic, rss: aioresponses) -> None:
     assert updated_bad_comic
     assert "error_count" in updated_bad_comic
     assert updated_bad_comic["error_count"] == 1
-    errors = updated_bad_comic.get("errors")
-    assert errors
-    assert len(errors) == 1
-    assert "ClientResponseError: 404" in errors[0]
+    assert "ClientResponseError: 404" in updated_bad_comic["last_error"]
+    # The full history is kept out of the comic
+    assert "errors" not in updated_bad_comic
+    [error] = _feed_errors(comics).find()
+    assert error["comic_id"] == bad_comic["_id"]
+    assert error["error"] == updated_bad_comic["last_error"]
 
 
 @responses.activate()
@@ -733,15 +774,405 @@ def test_daily_ordering(comic: Comic, rss: aioresponses, webhook: RequestsMock)
     )
     webhook.calls.reset()
     daily_checks(comics, WEBHOOK_URL)
+    # Both comics are packed into one post, still in order
+    assert len(webhook.calls) == 1
+    daily_embeds = json.loads(webhook.calls[0].request.body)["embeds"]
+    assert [embed["url"] for embed in daily_embeds] == [
+        "https://www.sleeplessdomain.com/comic/chapter-22-page-2",
+        "https://xkcd.com/2834/",
+    ]
+
+
+@pytest.mark.usefixtures("_no_sleep", "rss")
+def test_pack_comics(comic: Comic, webhook: RequestsMock) -> None:
+    """In packing mode, updates for many comics are merged into a few posts."""
+    client: MongoClient[Comic] = MongoClient()
+    comics = client.db.collection
+    comic["last_entries"].pop()  # One "new" entry
+    num_comics = 15
+    comics.insert_many([
+        Comic(comic, _id=ObjectId(f"{i:0>24}"), title=f"Comic {i:0>2}")  # type: ignore [misc]  # (mypy issue)[https://github.com/python/mypy/issues/8890]
+        for i in range(num_comics)
+    ])
+    regular_checks(comics, HASH_SEED, WEBHOOK_URL, THREAD_WEBHOOK_URL, pack=True)
+    embeds_by_message = get_embeds_by_message(webhook.calls)
+    assert [len(embeds) for embeds in embeds_by_message] == [10, 5]
+    assert [embed["description"] for embed in embeds_by_message[0]] == [
+        f"New Comic {i:0>2}!" for i in range(10)
+    ]
+    assert _outbox(comics).count_documents({"status": "posted"}) == num_comics
+
+
+@pytest.mark.usefixtures("_no_sleep", "rss", "webhook")
+def test_loads_details_only_when_changed(
+    comic: Comic, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Only comics with changed feeds have their cached entries loaded."""
+    client: MongoClient[Comic] = MongoClient()
+    comics = client.db.collection
+    comic["last_entries"].pop()  # One "new" entry
+    unchanged = Comic(
+        comic,
+        _id=ObjectId(),
+        title="Unchanged",
+        feed_hash=mmh3.hash_bytes(example_feed, HASH_SEED),
+    )  # type: ignore [misc]  # (mypy issue)[https://github.com/python/mypy/issues/8890]
+    comics.insert_many([comic, unchanged])
+    queries: list[tuple[dict[str, Any], dict[str, bool]]] = []
+    find = comics.find
+
+    def logged_find(
+        query: dict[str, Any], projection: dict[str, bool]
+    ) -> Any:  # noqa: ANN401
+        queries.append((query, projection))
+        return find(query, projection)
+
+    monkeypatch.setattr(comics, "find", logged_find)
+    regular_checks(comics, HASH_SEED, WEBHOOK_URL, THREAD_WEBHOOK_URL)
+    monkeypatch.setattr(comics, "find", find)
+    (summary_query, summary_projection), (detail_query, detail_projection) = queries
+    assert summary_query == {}
+    assert "last_entries" not in summary_projection
+    assert detail_query == {"_id": {"$in": [comic["_id"]]}}
+    assert "last_entries.link" in detail_projection
+    assert "last_entries.title" not in detail_projection
+    assert _pending_dailies(comics).count_documents({"comic_id": comic["_id"]}) == 1
+
+
+@pytest.mark.usefixtures("_no_sleep", "rss")
+def test_reads_comics_in_batches(comic: Comic, webhook: RequestsMock) -> None:
+    """Comics read a batch at a time are still posted in title order."""
+    client: MongoClient[Comic] = MongoClient()
+    comics = client.db.collection
+    comic["last_entries"].pop()  # One "new" entry
+    titles = ["Sleepless Domain", "Sleepless Domain 3", "Sleepless Domain 2"]
+    comics.insert_many([
+        Comic(comic, _id=ObjectId(), title=title)  # type: ignore [misc]
+        for title in titles
+    ])
+    regular_checks(
+        comics, HASH_SEED, WEBHOOK_URL, THREAD_WEBHOOK_URL, read_batch_size=1
+    )
+    assert [
+        json.loads(call.request.body)["embeds"][0]["description"]  # type: ignore [arg-type]
+        for call in webhook.calls
+    ] == [f"New {title}!" for title in sorted(titles)]
+
+
+@pytest.mark.usefixtures("_no_sleep", "rss")
+def test_limits_checks_in_flight(
+    comic: Comic, webhook: RequestsMock, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """No more than `max_checks` feeds are checked at once."""
+    client: MongoClient[Comic] = MongoClient()
+    comics = client.db.collection
+    comic["last_entries"].pop()  # One "new" entry
+    num_comics = 10
+    comics.insert_many([
+        Comic(comic, _id=ObjectId(), title=f"Comic {i}")  # type: ignore [misc]
+        for i in range(num_comics)
+    ])
+    in_flight = most_in_flight = 0
+
+    async def counted(*args: Any, **kwargs: Any) -> Any:  # noqa: ANN401
+        nonlocal in_flight, most_in_flight
+        in_flight += 1
+        most_in_flight = max(most_in_flight, in_flight)
+        try:
+            await asyncio.sleep(0.01)
+            return await _get_feed_changes(*args, **kwargs)
+        finally:
+            in_flight -= 1
+
+    monkeypatch.setattr(check_feeds_and_update, "_get_feed_changes", counted)
+    regular_checks(
+        comics,
+        HASH_SEED,
+        WEBHOOK_URL,
+        THREAD_WEBHOOK_URL,
+        read_batch_size=4,
+        max_checks=3,
+    )
+    assert most_in_flight == 3  # noqa: PLR2004
     assert len(webhook.calls) == num_comics
-    assert (
-        json.loads(webhook.calls[0].request.body)["embeds"][0]["url"]
-        == "https://www.sleeplessdomain.com/comic/chapter-22-page-2"
+
+
+@pytest.mark.usefixtures("_no_sleep", "rss", "webhook")
+def test_times_each_phase(comic: Comic) -> None:
+    """Each phase of the work on a comic is timed under the comic's title."""
+    client: MongoClient[Comic] = MongoClient()
+    comics = client.db.collection
+    comic["last_entries"].pop()  # One "new" entry
+    comics.insert_one(comic)
+    timings = Timings()
+    regular_checks(comics, HASH_SEED, WEBHOOK_URL, THREAD_WEBHOOK_URL, timings=timings)
+    summary = timings.summary()
+    (slowest,) = summary["slowest_comics"]
+    assert slowest["title"] == "Sleepless Domain"
+    assert set(slowest["phases"]) == {
+        "ttfb",
+        "download",
+        "hash",
+        "parse",
+        "diff",
+        "messages",
+        "save",
+        "post",
+    }
+    assert {phase["phase"] for phase in summary["phases"]} >= {
+        "load_summaries",
+        "load_details",
+        "write",
+    }
+
+
+@pytest.mark.usefixtures("rss", "webhook")
+def test_reports_loop_stalls(comic: Comic, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Slow parsing holds up the event loop, and is blamed for it."""
+    parse = feedparser.parse
+
+    def slow_parse(data: str) -> Any:  # noqa: ANN401
+        time.sleep(0.3)
+        return parse(data)
+
+    monkeypatch.setattr(feedparser, "parse", slow_parse)
+    client: MongoClient[Comic] = MongoClient()
+    comics = client.db.collection
+    comic["last_entries"].pop()  # One "new" entry
+    comics.insert_one(comic)
+    timings = Timings(lag_threshold=0.1)
+    regular_checks(comics, HASH_SEED, WEBHOOK_URL, THREAD_WEBHOOK_URL, timings=timings)
+    (stall,) = timings.summary()["loop_lag"]["stalls"]
+    assert (stall["phase"], stall["title"]) == ("parse", "Sleepless Domain")
+
+
+@pytest.mark.usefixtures("_no_sleep", "webhook")
+def test_records_runs(comic: Comic, rss: aioresponses) -> None:
+    """Each regular and daily run stores how it went."""
+    rss.get("http://www.sleeplessdomain.com/missing", status=404)
+    client: MongoClient[Comic] = MongoClient()
+    comics = client.db.collection
+    comic["last_entries"].pop()  # One "new" entry
+    missing = Comic(comic, _id=ObjectId(), title="Missing")  # type: ignore [misc]
+    missing["feed_url"] = "http://www.sleeplessdomain.com/missing"
+    comics.insert_many([comic, missing])
+    regular_checks(
+        comics, HASH_SEED, WEBHOOK_URL, THREAD_WEBHOOK_URL, timings=Timings()
     )
-    assert (
-        json.loads(webhook.calls[1].request.body)["embeds"][0]["url"]
-        == "https://xkcd.com/2834/"
+    daily_checks(comics, WEBHOOK_URL)
+    regular, daily = _runs(comics).find().sort("started_at")
+    assert regular["check_type"] == "regular"
+    assert {
+        key: regular[key]  # type: ignore [literal-required]
+        for key in (
+            "comics",
+            "changed",
+            "updated",
+            "statuses",
+            "downloaded_bytes",
+            "posts",
+            "errors",
+        )
+    } == {
+        "comics": 2,
+        "changed": 1,
+        "updated": 1,
+        "statuses": {"200": 1, "404": 1},
+        "downloaded_bytes": len(example_feed.encode()),
+        "posts": 1,
+        "errors": 1,
+    }
+    assert regular["phases"]["ttfb"] > 0
+    assert daily["check_type"] == "daily"
+    assert (daily["comics"], daily["updated"], daily["posts"]) == (1, 1, 1)
+    assert daily["phases"] == {}
+
+
+@pytest.mark.usefixtures("webhook")
+def test_records_costs(comic: Comic, rss: aioresponses) -> None:
+    """What each comic cost to check is added to its totals."""
+    rss.get("http://www.sleeplessdomain.com/missing", status=404)
+    client: MongoClient[Comic] = MongoClient()
+    comics = client.db.collection
+    comic["last_entries"].pop()  # One "new" entry
+    missing = Comic(comic, _id=ObjectId(), title="Missing")  # type: ignore [misc]
+    missing["feed_url"] = "http://www.sleeplessdomain.com/missing"
+    comics.insert_many([comic, missing])
+    regular_checks(comics, HASH_SEED, WEBHOOK_URL, THREAD_WEBHOOK_URL)
+    costs = {row["title"]: row for row in top_costs(comics)}
+    changed = costs["Sleepless Domain"]
+    assert changed["bytes"] == pytest.approx(len(example_feed.encode()))
+    assert changed["changed"] == pytest.approx(1)
+    assert changed["posts"] == pytest.approx(1)
+    assert changed["seconds"] > 0
+    assert changed["parse_seconds"] > 0
+    failed = costs["Missing"]
+    assert failed["error"] == pytest.approx(1)
+    assert failed["bytes"] == 0
+
+
+def test_costs_parsing_that_fails(comic: Comic) -> None:
+    """The time spent parsing a feed is counted even if parsing raises."""
+    fetches = FetchStats()
+
+    def parse() -> None:
+        with fetches.parsing(comic):
+            msg = "Malformed"
+            raise ValueError(msg)
+
+    with pytest.raises(ValueError, match="Malformed"):
+        parse()
+    assert fetches.costs.comics[comic["_id"]]["parse_seconds"] >= 0
+
+
+@pytest.mark.usefixtures("webhook")
+def test_counts_metrics(comic: Comic, rss: aioresponses) -> None:
+    """Fetches, diffs and posts are counted, with their labels kept bounded."""
+    metrics.reset()
+    rss.get("http://www.sleeplessdomain.com/missing", status=404)
+    client: MongoClient[Comic] = MongoClient()
+    comics = client.db.collection
+    comic["last_entries"].pop()  # One "new" entry
+    missing = Comic(comic, _id=ObjectId(), title="Missing")  # type: ignore [misc]
+    missing["feed_url"] = "http://www.sleeplessdomain.com/missing"
+    comics.insert_many([comic, missing])
+    regular_checks(comics, HASH_SEED, WEBHOOK_URL, THREAD_WEBHOOK_URL)
+    assert metrics.FEED_CHECKS.value(result="changed") == 1
+    assert metrics.FEED_CHECKS.value(result="error") == 1
+    assert metrics.FEED_RESPONSES.value(status="2xx") == 1
+    assert metrics.FEED_RESPONSES.value(status="4xx") == 1
+    assert metrics.FEED_FETCH_SECONDS.count() == 1
+    assert metrics.FEED_BYTES.value() == len(example_feed.encode())
+    assert metrics.DIFFS.value(result="new_entries") == 1
+    assert metrics.NEW_ENTRIES.value() == 1
+    assert metrics.POSTS.value(status="2xx") == 1
+    assert metrics.POST_SECONDS.count() == 1
+    assert "Missing" not in metrics.render()
+
+
+@pytest.mark.usefixtures("_no_sleep", "rss", "webhook")
+def test_writes_in_batches(comic: Comic, monkeypatch: pytest.MonkeyPatch) -> None:
+    """New states are saved with a few bulk writes rather than one write each."""
+    client: MongoClient[Comic] = MongoClient()
+    comics = client.db.collection
+    comic["last_entries"].pop()  # One "new" entry
+    num_comics = 15
+    comics.insert_many([
+        Comic(comic, _id=ObjectId(f"{i:0>24}"), title=f"Comic {i:0>2}")  # type: ignore [misc]  # (mypy issue)[https://github.com/python/mypy/issues/8890]
+        for i in range(num_comics)
+    ])
+    migrate_dailies(comics)
+    batch_sizes = log_bulk_writes(comics, monkeypatch)
+    regular_checks(
+        comics, HASH_SEED, WEBHOOK_URL, THREAD_WEBHOOK_URL, write_batch_size=4
     )
+    assert batch_sizes == [4, 4, 4, 3]
+    assert _pending_dailies(comics).count_documents({}) == num_comics
+
+
+@pytest.mark.usefixtures("rss", "webhook")
+def test_daily_clears_in_batches(comic: Comic, monkeypatch: pytest.MonkeyPatch) -> None:
+    client: MongoClient[Comic] = MongoClient()
+    comics = client.db.collection
+    num_comics = 25
+    comics.insert_many([
+        Comic(
+            comic,
+            _id=ObjectId(f"{i:0>24}"),
+            title=f"Comic {i:0>2}",
+            dailies=[{"link": f"https://example.com/{i}"}],
+        )  # type: ignore [misc]  # (mypy issue)[https://github.com/python/mypy/issues/8890]
+        for i in range(num_comics)
+    ])
+    migrate_dailies(comics)
+    batch_sizes = log_bulk_writes(_pending_dailies(comics), monkeypatch)
+    daily_checks(comics, WEBHOOK_URL, write_batch_size=10)
+    assert batch_sizes == [10, 10, 5]
+    assert _pending_dailies(comics).count_documents({}) == 0
+
+
+@pytest.mark.usefixtures("rss")
+def test_daily_packs_comics(comic: Comic, webhook: RequestsMock) -> None:
+    """Daily updates for many comics are packed into full posts, in title order."""
+    client: MongoClient[Comic] = MongoClient()
+    comics = client.db.collection
+    num_comics = 25
+    comics.insert_many([
+        Comic(
+            comic,
+            _id=ObjectId(f"{i:0>24}"),
+            title=f"Comic {i:0>2}",
+            dailies=[{"link": f"https://example.com/{i}"}],
+        )  # type: ignore [misc]  # (mypy issue)[https://github.com/python/mypy/issues/8890]
+        for i in reversed(range(num_comics))
+    ])
+    migrate_dailies(comics)
+    daily_checks(comics, WEBHOOK_URL)
+    embeds_by_message = get_embeds_by_message(webhook.calls)
+    assert [len(embeds) for embeds in embeds_by_message] == [10, 10, 5]
+    assert [embed["url"] for embeds in embeds_by_message for embed in embeds] == [
+        f"https://example.com/{i}" for i in range(num_comics)
+    ]
+    assert _pending_dailies(comics).count_documents({}) == 0
+
+
+@pytest.mark.usefixtures("rss")
+def test_daily_loads_comics_in_batches(
+    comic: Comic, webhook: RequestsMock, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Comics are loaded a batch at a time, and still packed into full posts."""
+    client: MongoClient[Comic] = MongoClient()
+    comics = client.db.collection
+    num_comics = 25
+    comics.insert_many([
+        Comic(
+            comic,
+            _id=ObjectId(f"{i:0>24}"),
+            title=f"Comic {i:0>2}",
+            dailies=[{"link": f"https://example.com/{i}"}],
+        )  # type: ignore [misc]  # (mypy issue)[https://github.com/python/mypy/issues/8890]
+        for i in range(num_comics)
+    ])
+    migrate_dailies(comics)
+    monkeypatch.setattr(check_feeds_and_update, "LOAD_BATCH_SIZE", 7)
+    storage = MongoStorage(comics)
+    loads: list[int] = []
+    load_daily_comics = storage.load_daily_comics
+
+    def logged_load(ids: Sequence[ObjectId]) -> list[Comic]:
+        loads.append(len(ids))
+        return load_daily_comics(ids)
+
+    monkeypatch.setattr(storage, "load_daily_comics", logged_load)
+    daily_checks(storage, WEBHOOK_URL)
+    assert loads == [7, 7, 7, 4]
+    embeds_by_message = get_embeds_by_message(webhook.calls)
+    assert [len(embeds) for embeds in embeds_by_message] == [10, 10, 5]
+    assert _pending_dailies(comics).count_documents({}) == 0
+
+
+@pytest.mark.usefixtures("_no_sleep", "rss")
+def test_daily_keeps_unposted(comic: Comic, webhook: RequestsMock) -> None:
+    """When a daily post fails, only comics that were fully posted are cleared."""
+    client: MongoClient[Comic] = MongoClient()
+    comics = client.db.collection
+    comics.insert_many([
+        Comic(
+            comic,
+            _id=ObjectId(f"{i:0>24}"),
+            title=f"Comic {i:0>2}",
+            dailies=[{"link": f"https://example.com/{i}/{j}"} for j in range(4)],
+        )  # type: ignore [misc]  # (mypy issue)[https://github.com/python/mypy/issues/8890]
+        for i in range(3)
+    ])
+    migrate_dailies(comics)
+    webhook.post(
+        WEBHOOK_URL, status=500, json={"message": "500: Internal Server Error"}
+    )
+    # The first post has comics 0 and 1, and the second has comic 2
+    with pytest.raises(HTTPError):
+        daily_checks(comics, WEBHOOK_URL)
+    assert _pending_dailies(comics).distinct("comic_id") == [ObjectId(f"{2:0>24}")]
 
 
 @pytest.mark.usefixtures("rss")
@@ -751,6 +1182,7 @@ def test_daily_idempotent(comic: Comic, webhook: RequestsMock) -> None:
     comics = client.db.collection
     comic["dailies"].append(comic["last_entries"][-1])  # One "new" entry
     comics.insert_one(comic)
+    migrate_dailies(comics)
     daily_checks(comics, WEBHOOK_URL)
     assert webhook.calls[0].request.body
     assert (
@@ -762,6 +1194,72 @@ def test_daily_idempotent(comic: Comic, webhook: RequestsMock) -> None:
     assert len(webhook.calls) == 1
 
 
+@pytest.mark.usefixtures("_no_sleep", "rss")
+def test_regular_queues_dailies(comic: Comic, webhook: RequestsMock) -> None:
+    """New entries found by the regular checks are posted by the next daily check."""
+    client: MongoClient[Comic] = MongoClient()
+    comics = client.db.collection
+    comic["last_entries"].pop()  # One "new" entry
+    comics.insert_one(comic)
+    regular_checks(comics, HASH_SEED, WEBHOOK_URL, THREAD_WEBHOOK_URL)
+    [daily] = _pending_dailies(comics).find()
+    assert (
+        daily["entry"]["link"]
+        == "https://www.sleeplessdomain.com/comic/chapter-22-page-2"
+    )
+    webhook.calls.reset()
+    daily_checks(comics, WEBHOOK_URL)
+    assert len(webhook.calls) == 1
+    assert _pending_dailies(comics).count_documents({}) == 0
+
+
+@pytest.mark.usefixtures("_no_sleep", "rss")
+def test_sqlite_storage(comic: Comic, webhook: RequestsMock, tmp_path: Path) -> None:
+    """The checks work the same with comics stored in SQLite."""
+    del comic["dailies"]
+    comic["last_entries"].pop()  # One "new" entry
+    with SQLiteStorage(tmp_path / "comics.db") as comics:
+        comics.insert_comic(comic)
+        regular_checks(comics, HASH_SEED, WEBHOOK_URL, THREAD_WEBHOOK_URL)
+        assert webhook.calls[0].request.body
+        [embed] = json.loads(webhook.calls[0].request.body)["embeds"]
+        assert embed["url"] == "https://www.sleeplessdomain.com/comic/chapter-22-page-2"
+        [updated] = comics.load_details([comic["_id"]])
+        assert updated["last_entries"][-1]["link"] == embed["url"]
+        assert list(comics.pending_posts()) == []
+        daily_checks(comics, WEBHOOK_URL)
+        assert len(webhook.calls) == 2  # noqa: PLR2004
+        assert list(comics.pending_dailies()) == []
+        regular_checks(comics, HASH_SEED, WEBHOOK_URL, THREAD_WEBHOOK_URL)
+        assert len(webhook.calls) == 2  # noqa: PLR2004
+
+
+def test_migrates_legacy_dailies(comic: Comic) -> None:
+    """Entries in a comic's old `dailies` array are moved and the array removed."""
+    client: MongoClient[Comic] = MongoClient()
+    comics = client.db.collection
+    comic["dailies"] = comic["last_entries"][-2:]
+    comics.insert_one(comic)
+    assert migrate_dailies(comics) == 1
+    assert migrate_dailies(comics) == 0
+    assert "dailies" not in comics.find_one({"_id": comic["_id"]})  # type: ignore [operator]
+    assert [
+        daily["entry"] for daily in _pending_dailies(comics).find().sort("seq")
+    ] == comic["last_entries"][-2:]
+
+
+@pytest.mark.usefixtures("webhook")
+def test_daily_checks_leave_legacy_dailies(comic: Comic) -> None:
+    """The daily checks only read `pending_dailies`, not the old arrays."""
+    client: MongoClient[Comic] = MongoClient()
+    comics = client.db.collection
+    comic["dailies"] = comic["last_entries"][-2:]
+    comics.insert_one(comic)
+    daily_checks(comics, DAILY_WEBHOOK_URL)
+    assert "dailies" in comics.find_one({"_id": comic["_id"]})  # type: ignore [operator]
+    assert _pending_dailies(comics).count_documents({}) == 0
+
+
 # This is already tested in test_ratelimiter.py
 @pytest.mark.slow
 @responses.activate()
@@ -903,14 +1401,17 @@ def test_fails_on_429(comic: Comic) -> None:
 
 @responses.activate()
 @pytest.mark.usefixtures("_no_sleep")
-def test_no_update_on_failure(comic: Comic, rss: aioresponses) -> None:
-    """The script does not update caching headers when the webhook gives errors.
+def test_queued_on_failure(comic: Comic, rss: aioresponses) -> None:
+    """When the webhook gives errors, the update stays queued in the outbox.
+
+    The feed's new state is still stored, so the feed isn't re-checked, and the
+    update is posted by the next run once the webhook works again.
 
     Regression test for [No Commit]
     """
     client: MongoClient[Comic] = MongoClient()
     comics = client.db.collection
-    entry_url = comic["last_entries"].pop()  # One "new" entry
+    comic["last_entries"].pop()  # One "new" entry
     comic["feed_url"] = "https://www.questionablecontent.net/QCRSS.xml"
     comics.insert_one(comic)
     rss.get(
@@ -922,6 +1423,7 @@ def test_no_update_on_failure(comic: Comic, rss: aioresponses) -> None:
             "Last-Modified": "Wed, 27 Sep 2023 20:10:14 GMT",
         },
     )
+    rss.get("https://www.questionablecontent.net/QCRSS.xml", status=304)
     responses.post(
         WEBHOOK_URL,
         status=429,
@@ -938,14 +1440,172 @@ def test_no_update_on_failure(comic: Comic, rss: aioresponses) -> None:
             "global": False,
         },
     )
-    with pytest.raises(HTTPError):
-        regular_checks(comics, HASH_SEED, WEBHOOK_URL, THREAD_WEBHOOK_URL)
+    regular_checks(comics, HASH_SEED, WEBHOOK_URL, THREAD_WEBHOOK_URL)
     new_comic = comics.find_one({"_id": comic["_id"]})
     assert new_comic
-    assert "last_modified" not in new_comic
-    assert "etag" not in new_comic
-    assert comic["feed_hash"] != mmh3.hash_bytes(example_feed, HASH_SEED)
-    assert entry_url not in comic["last_entries"]
+    assert new_comic["etag"] == '"f56-6062f676a7367-gzip"'
+    assert new_comic["feed_hash"] == mmh3.hash_bytes(example_feed, HASH_SEED)
+    [queued] = _outbox(comics).find()
+    assert queued["status"] == "pending"
+    # Being rate-limited isn't the message's fault
+    assert queued["attempts"] == 0
+    assert "429" in queued["last_error"]
+
+    responses.replace(
+        responses.POST,
+        WEBHOOK_URL,
+        status=200,
+        headers={
+            "x-ratelimit-limit": "5",
+            "x-ratelimit-remaining": "4",
+            "x-ratelimit-reset-after": "0.399",
+        },
+    )
+    responses.calls.reset()
+    regular_checks(comics, HASH_SEED, WEBHOOK_URL, THREAD_WEBHOOK_URL)
+    assert len(responses.calls) == 1
+    assert responses.calls[0].request.body
+    assert (
+        json.loads(responses.calls[0].request.body)["embeds"][0]["url"]
+        == "https://www.sleeplessdomain.com/comic/chapter-22-page-2"
+    )
+    [posted] = _outbox(comics).find()
+    assert posted["status"] == "posted"
+
+
+@pytest.mark.usefixtures("_no_sleep", "rss")
+def test_requeue_is_idempotent(comic: Comic, webhook: RequestsMock) -> None:
+    """If a run dies between queueing and storing, the update is posted once.
+
+    The next run finds the same new entries, but queues them under the same
+    keys, so they aren't queued a second time.
+    """
+    client: MongoClient[Comic] = MongoClient()
+    comics = client.db.collection
+    comic["last_entries"].pop()  # One "new" entry
+    comics.insert_one(comic)
+    outbox = _outbox(comics)
+    feed_hash = mmh3.hash_bytes(example_feed, HASH_SEED)
+    entries: list[Entry] = [
+        {"link": "https://www.sleeplessdomain.com/comic/chapter-22-page-2"}
+    ]
+    # Simulates a run that queued its post and then died
+    outbox.insert_many(
+        _make_posts(comic, entries, {"feed_hash": feed_hash}, itertools.count())
+    )
+    regular_checks(comics, HASH_SEED, WEBHOOK_URL, THREAD_WEBHOOK_URL)
+    assert len(webhook.calls) == 1
+    assert outbox.count_documents({}) == 1
+
+
+@pytest.mark.usefixtures("_no_sleep", "rss")
+def test_gives_up_after_max_attempts(comic: Comic, webhook: RequestsMock) -> None:
+    """A post that keeps failing is eventually skipped, and later posts still go out.
+
+    This stops one bad message, like one with a broken `thread_id`, from holding
+    up every update queued after it.
+    """
+    client: MongoClient[Comic] = MongoClient()
+    comics = client.db.collection
+    comic["last_entries"].pop()  # One "new" entry
+    comic["thread_id"] = 1234
+    comics.insert_one(comic)
+    webhook.post(
+        THREAD_WEBHOOK_URL,
+        status=400,
+        json={"message": "Unknown Channel", "code": 10003},
+    )
+    regular_checks(comics, HASH_SEED, WEBHOOK_URL, THREAD_WEBHOOK_URL)
+    outbox = _outbox(comics)
+    for _ in range(constants.MAX_POST_ATTEMPTS - 1):
+        assert drain_outbox(comics, WEBHOOK_URL, THREAD_WEBHOOK_URL) == 0
+    failed = outbox.find_one({"status": "failed"})
+    assert failed
+    assert failed["attempts"] == constants.MAX_POST_ATTEMPTS
+    assert drain_outbox(comics, WEBHOOK_URL, THREAD_WEBHOOK_URL) == 0
+
+
+def _queue_two_comics(comic: Comic) -> tuple["Collection[Comic]", Comic]:
+    """Queues a post and a thread post for `comic`, then a post for another comic."""
+    client: MongoClient[Comic] = MongoClient()
+    comics = client.db.collection
+    comic["thread_id"] = 1234
+    other: Comic = {
+        **comic,
+        "_id": ObjectId("612819b293b99b5809e18ab4"),
+        "title": "Another Comic",
+    }
+    del other["thread_id"]
+    comics.insert_many([comic, other])
+    seq = itertools.count()
+    entries: list[Entry] = [
+        {"link": "https://www.sleeplessdomain.com/comic/chapter-22-page-2"}
+    ]
+    for queued in (comic, other):
+        _outbox(comics).insert_many(
+            _make_posts(queued, entries, {"feed_hash": b"new"}, seq)
+        )
+    return comics, other
+
+
+@pytest.mark.usefixtures("_no_sleep")
+def test_failed_post_does_not_block_others(comic: Comic, webhook: RequestsMock) -> None:
+    """A post Discord rejects is skipped, and other comics' posts still go out.
+
+    Its attempt is counted, and it's left pending for the next drain.
+    """
+    comics, other = _queue_two_comics(comic)
+    webhook.post(
+        THREAD_WEBHOOK_URL,
+        status=404,
+        json={"message": "Unknown Channel", "code": 10003},
+    )
+    assert drain_outbox(comics, WEBHOOK_URL, THREAD_WEBHOOK_URL) == 2  # noqa: PLR2004
+    descriptions = [
+        json.loads(call.request.body or b"")["embeds"][0]["description"]
+        for call in webhook.calls
+    ]
+    # The thread post fails, and the other comic is posted after it
+    assert descriptions == [
+        "New Sleepless Domain!",
+        "New Sleepless Domain!",
+        f"New {other['title']}!",
+    ]
+    pending = _outbox(comics).find_one({"status": "pending"})
+    assert pending
+    assert pending["thread_id"] == 1234  # noqa: PLR2004
+    assert pending["attempts"] == 1
+
+
+@pytest.mark.usefixtures("_no_sleep")
+def test_costs_count_posted_messages(comic: Comic, webhook: RequestsMock) -> None:
+    """Only the messages that are posted count towards each comic's posts."""
+    comics, other = _queue_two_comics(comic)
+    webhook.post(
+        THREAD_WEBHOOK_URL,
+        status=404,
+        json={"message": "Unknown Channel", "code": 10003},
+    )
+    costs = Ledger()
+    drain_outbox(comics, WEBHOOK_URL, THREAD_WEBHOOK_URL, costs=costs)
+    assert costs.comics[comic["_id"]]["posts"] == 1
+    assert costs.comics[other["_id"]]["posts"] == 1
+
+
+@pytest.mark.usefixtures("_no_sleep")
+def test_rate_limits_are_not_attempts(comic: Comic, webhook: RequestsMock) -> None:
+    """A post that's rate-limited is tried again later without counting it."""
+    comics, _ = _queue_two_comics(comic)
+    webhook.post(
+        THREAD_WEBHOOK_URL,
+        status=429,
+        json={"message": "You are being rate limited.", "retry_after": 0.5},
+    )
+    assert drain_outbox(comics, WEBHOOK_URL, THREAD_WEBHOOK_URL) == 2  # noqa: PLR2004
+    pending = _outbox(comics).find_one({"status": "pending"})
+    assert pending
+    assert pending["attempts"] == 0
+    assert "429" in pending["last_error"]
 
 
 @responses.activate()
@@ -1049,12 +1709,13 @@ def test_performance(
     webhook.calls.reset()
     regular_checks(comics, HASH_SEED, WEBHOOK_URL, THREAD_WEBHOOK_URL)
     assert len(webhook.calls) == 0
+    regular_sleeps = len(measure_sleep)
     start = time.time()
     daily_checks(comics, DAILY_WEBHOOK_URL)
     end = time.time()
     daily_duration = end - start
     print(daily_duration)
-    assert len(measure_sleep) == 2 * ((len(webhook.calls) - 1) // 30)
+    assert len(measure_sleep) - regular_sleeps == (daily.call_count - 1) // 30
     daily.calls.reset()
     daily_checks(comics, DAILY_WEBHOOK_URL)
     assert daily.call_count == 0
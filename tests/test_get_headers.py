@@ -47,3 +47,24 @@ def test_both_caching_headers(comic: Comic) -> None:
         "If-None-Match": "f56-6062f676a7367-gzip",
         "If-Modified-Since": "Wed, 22 Mar 2023 00:15:35 GMT",
     }
+
+
+@pytest.mark.parametrize(
+    "headers",
+    [
+        {},
+        {"etag": "f56-6062f676a7367-gzip"},
+        {
+            "etag": "f56-6062f676a7367-gzip",
+            "last_modified": "Wed, 22 Mar 2023 00:15:35 GMT",
+        },
+    ],
+    ids=["none", "etag", "both"],
+)
+@pytest.mark.benchmark
+def test_performance(comic: Comic, headers: dict[str, str]) -> None:
+    """Getting the caching headers for every comic in a large run."""
+    comic.update(headers)  # type: ignore [typeddict-item]
+    for _ in range(10_000):
+        caching_headers = _get_headers(comic)
+    assert len(caching_headers) == len(headers)
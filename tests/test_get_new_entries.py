@@ -7,7 +7,7 @@ from typing import TYPE_CHECKING
 import pytest
 
 from rss_to_webhook import constants
-from rss_to_webhook.check_feeds_and_update import _get_new_entries
+from rss_to_webhook.check_feeds_and_update import _get_new_entries, _normalise
 
 if TYPE_CHECKING:
     from collections.abc import Sequence
@@ -401,3 +401,22 @@ def test_performance(
     assert new_entries == expected_new_entries
     print(f"{duration = }")
     assert duration < max_time
+
+
+@pytest.mark.parametrize(
+    "link_format",
+    [
+        "https://example.com/comic/page-{i}",
+        "https://www.example.com/comics/{i}/",
+        "https://www.webtoons.example/en/fantasy/comic/episode-{i}/viewer?title_no=1234&episode_no={i}",
+    ],
+    ids=["path", "trailing_slash", "query"],
+)
+@pytest.mark.benchmark
+def test_normalise_performance(link_format: str) -> None:
+    """Normalising every link in a full feed and a comic's cached entries."""
+    links = [link_format.format(i=i) for i in range(constants.MAX_CACHED_ENTRIES + 100)]
+    for _ in range(10):
+        normalised = [_normalise(link) for link in links]
+    assert normalised[0].startswith("/")
+    assert not normalised[0].split("?")[0].endswith("/")
@@ -0,0 +1,80 @@
+"""Checks that each command starts quickly.
+
+Scheduled runs start a new process every time, so everything imported before a
+command does any work is paid for on every run. These run `python -X importtime`
+on the modules each command imports, and fail if a slow dependency sneaks back
+in or if importing takes longer than its budget.
+
+The budgets are several times what the imports take on a laptop, so they only
+catch real regressions rather than a slow machine.
+"""
+
+import os
+import subprocess  # noqa: S404 # Only runs this interpreter
+import sys
+from pathlib import Path
+
+import pytest
+
+import rss_to_webhook
+
+SRC = Path(rss_to_webhook.__file__).parent.parent
+
+#: Modules that are slow to import, and only needed by some commands
+SLOW = frozenset({"aiohttp", "feedparser", "mmh3", "requests", "pymongo"})
+
+
+def import_times(module: str) -> dict[str, int]:
+    """Imports `module` in a new interpreter.
+
+    Returns:
+        How many microseconds each module took to import, including the modules
+        it imported.
+    """
+    env = os.environ | {"PYTHONPATH": os.pathsep.join([str(SRC), *sys.path])}
+    result = subprocess.run(  # noqa: S603 # Not user input
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        check=True,
+        env=env,
+        text=True,
+    )
+    times: dict[str, int] = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.removeprefix("import time:").split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+@pytest.mark.parametrize(
+    ("module", "needed", "budget"),
+    [
+        # `--help`, and every command before it starts
+        ("rss_to_webhook.main", set(), 400_000),
+        # `error-rates`, `run-trends` and `top`
+        ("rss_to_webhook.stats", {"pymongo"}, 500_000),
+        # `post-updates daily` and `post-updates drain`, and `regular` before
+        # it starts checking feeds
+        ("rss_to_webhook.check_feeds_and_update", {"requests", "pymongo"}, 800_000),
+        # `post-updates --profile`
+        ("rss_to_webhook.profiling", set(), 200_000),
+        # `migrate-dailies`, which gets adding comics' imports along with it
+        (
+            "rss_to_webhook.db_operations",
+            {"feedparser", "mmh3", "requests", "pymongo"},
+            1_000_000,
+        ),
+        # `record-feeds` and `replay`, which parse feeds in worker processes
+        ("rss_to_webhook.replay", {"aiohttp", "requests", "pymongo"}, 1_500_000),
+        # `generate-comics` and `serve-feeds`
+        ("rss_to_webhook.synthetic", {"aiohttp", "requests", "pymongo"}, 1_500_000),
+        # The emulated Discord that `replay` posts to
+        ("rss_to_webhook.discord_emulator", {"aiohttp"}, 1_200_000),
+    ],
+)
+def test_import_time(module: str, needed: set[str], budget: int) -> None:
+    times = import_times(module)
+    assert SLOW & times.keys() == needed
+    assert times[module] < budget
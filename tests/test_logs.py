@@ -0,0 +1,65 @@
+import asyncio
+import io
+import json
+
+from rss_to_webhook import metrics
+from rss_to_webhook.logs import COMIC, comic_context, logger, logging_to
+
+
+def test_text_logs() -> None:
+    """Lines about a comic start with its title, and debug lines are skipped."""
+    stream = io.StringIO()
+    with logging_to(stream) as output:
+        logger.info("Running checks")
+        with comic_context("Comic"):
+            logger.info("%d new entries", 2)
+            logger.debug("Parsed feed")
+    assert stream.getvalue() == "Running checks\nComic: 2 new entries\n"
+    assert output.bytes == len(stream.getvalue())
+
+
+def test_json_logs() -> None:
+    stream = io.StringIO()
+    with logging_to(stream, "DEBUG", json_format=True):
+        with comic_context("Comic"):
+            logger.debug("Got response %d", 304, extra={"status": 304})
+        logger.warning("Stalled", extra={"comic": "Other"})
+    first, second = map(json.loads, stream.getvalue().splitlines())
+    assert first.pop("time")
+    assert first == {
+        "level": "DEBUG",
+        "comic": "Comic",
+        "message": "Got response 304",
+        "status": 304,
+    }
+    assert (second["comic"], second["message"]) == ("Other", "Stalled")
+
+
+def test_comic_per_task() -> None:
+    """Each task logs under the comic it set, however they interleave."""
+    stream = io.StringIO()
+
+    async def check(title: str) -> None:
+        COMIC.set(title)
+        await asyncio.sleep(0)
+        logger.info("Checked")
+
+    async def main() -> None:
+        await asyncio.gather(check("One"), check("Two"))
+
+    with logging_to(stream):
+        asyncio.run(main())
+    assert sorted(stream.getvalue().splitlines()) == ["One: Checked", "Two: Checked"]
+    assert COMIC.get() is None
+
+
+def test_flush() -> None:
+    """Flushing waits for the writing thread, and the bytes are counted."""
+    stream = io.StringIO()
+    written = metrics.LOG_BYTES.value()
+    with logging_to(stream) as output:
+        for _ in range(100):
+            logger.info("Line")
+        output.flush()
+        assert stream.getvalue() == "Line\n" * 100
+        assert metrics.LOG_BYTES.value() == written + output.bytes
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import json
 import os
 from typing import TYPE_CHECKING
 
@@ -8,15 +9,18 @@ import pytest
 from dotenv import load_dotenv
 from typer.testing import CliRunner
 
-from rss_to_webhook import check_feeds_and_update
+from rss_to_webhook import check_feeds_and_update, db_operations
 from rss_to_webhook.constants import DEFAULT_AIOHTTP_TIMEOUT, HASH_SEED
 from rss_to_webhook.main import app
+from rss_to_webhook.timing import NO_TIMINGS, Timings
 
 if TYPE_CHECKING:
+    from pathlib import Path
+
     from aiohttp import ClientTimeout
-    from pymongo.collection import Collection
 
     from rss_to_webhook.db_types import Comic
+    from rss_to_webhook.storage import MongoStorage
 
 load_dotenv(".env.example")
 WEBHOOK_URL = os.environ["WEBHOOK_URL"]
@@ -46,7 +50,8 @@ def fake_db(monkeypatch: pytest.MonkeyPatch) -> mongomock.MongoClient[Comic]:
     def dummy_client(_url: str) -> mongomock.MongoClient[Comic]:
         return client
 
-    monkeypatch.setattr(check_feeds_and_update, "MongoClient", dummy_client)
+    monkeypatch.setattr("rss_to_webhook.storage.MongoClient", dummy_client)
+    monkeypatch.delenv("SQLITE_PATH", raising=False)
     return client
 
 
@@ -54,18 +59,22 @@ def fake_db(monkeypatch: pytest.MonkeyPatch) -> mongomock.MongoClient[Comic]:
 def report_regular_checks(monkeypatch: pytest.MonkeyPatch) -> dict[str, object]:
     args: dict[str, object] = {}
 
-    def report_args(
-        comics: Collection[Comic],
+    def report_args(  # noqa: PLR0913
+        comics: MongoStorage,
         hash_seed: int,
         webhook_url: str,
         thread_webhook_url: str,
         timeout: ClientTimeout = DEFAULT_AIOHTTP_TIMEOUT,
+        *,
+        pack: bool = False,
+        timings: Timings = NO_TIMINGS,  # noqa: ARG001
     ) -> None:
-        args["comics"] = comics
+        args["comics"] = comics.comics
         args["hash_seed"] = hash_seed
         args["webhook_url"] = webhook_url
         args["thread_webhook_url"] = thread_webhook_url
         args["timeout"] = timeout
+        args["pack"] = pack
 
     monkeypatch.setattr(
         "rss_to_webhook.check_feeds_and_update.regular_checks", report_args
@@ -78,11 +87,14 @@ def report_daily_checks(monkeypatch: pytest.MonkeyPatch) -> dict[str, object]:
     args: dict[str, object] = {}
 
     def report_args(
-        comics: Collection[Comic],
+        comics: MongoStorage,
         webhook_url: str,
+        *,
+        timings: Timings = NO_TIMINGS,
     ) -> None:
-        args["comics"] = comics
+        args["comics"] = comics.comics
         args["webhook_url"] = webhook_url
+        timings.record("post", 1, "Comic")
 
     monkeypatch.setattr(
         "rss_to_webhook.check_feeds_and_update.daily_checks", report_args
@@ -90,6 +102,30 @@ def report_daily_checks(monkeypatch: pytest.MonkeyPatch) -> dict[str, object]:
     return args
 
 
+@pytest.fixture
+def report_drain_outbox(monkeypatch: pytest.MonkeyPatch) -> dict[str, object]:
+    args: dict[str, object] = {}
+
+    def report_args(
+        comics: MongoStorage,
+        webhook_url: str,
+        thread_webhook_url: str,
+        *,
+        pack: bool = False,
+        timings: Timings = NO_TIMINGS,  # noqa: ARG001
+    ) -> int:
+        args["comics"] = comics.comics
+        args["webhook_url"] = webhook_url
+        args["thread_webhook_url"] = thread_webhook_url
+        args["pack"] = pack
+        return 0
+
+    monkeypatch.setattr(
+        "rss_to_webhook.check_feeds_and_update.drain_outbox", report_args
+    )
+    return args
+
+
 @pytest.mark.usefixtures("_fake_env")
 def test_runs_regular_checks(
     report_regular_checks: dict[str, object], fake_db: mongomock.MongoClient[Comic]
@@ -102,6 +138,7 @@ def test_runs_regular_checks(
         "thread_webhook_url": THREAD_WEBHOOK_URL,
         "webhook_url": WEBHOOK_URL,
         "timeout": DEFAULT_AIOHTTP_TIMEOUT,
+        "pack": False,
     }
 
     regular_result = runner.invoke(app, ["post-updates", "regular"])
@@ -112,6 +149,7 @@ def test_runs_regular_checks(
         "thread_webhook_url": THREAD_WEBHOOK_URL,
         "webhook_url": WEBHOOK_URL,
         "timeout": DEFAULT_AIOHTTP_TIMEOUT,
+        "pack": False,
     }
 
 
@@ -127,6 +165,7 @@ def test_runs_test_checks(
         "thread_webhook_url": TEST_WEBHOOK_URL,
         "webhook_url": TEST_WEBHOOK_URL,
         "timeout": DEFAULT_AIOHTTP_TIMEOUT,
+        "pack": False,
     }
 
 
@@ -140,3 +179,99 @@ def test_runs_daily_checks(
         "comics": fake_db[DB_NAME]["comics"],
         "webhook_url": DAILY_WEBHOOK_URL,
     }
+
+
+@pytest.mark.usefixtures("_fake_env", "fake_db", "report_daily_checks")
+def test_writes_profile(tmp_path: Path) -> None:
+    path = tmp_path / "run.prof"
+    result = runner.invoke(app, ["post-updates", "daily", "--profile", str(path)])
+    assert result.exit_code == 0
+    assert path.exists()
+    assert "Asyncio tasks by total time" in result.stdout
+
+
+@pytest.mark.usefixtures("_fake_env", "fake_db", "report_daily_checks")
+def test_writes_timings(tmp_path: Path) -> None:
+    path = tmp_path / "timings.json"
+    result = runner.invoke(app, ["post-updates", "daily", "--timings", str(path)])
+    assert result.exit_code == 0
+    summary = json.loads(path.read_text(encoding="utf-8"))
+    assert summary["phases"] == [{"phase": "post", "count": 1, "total": 1, "max": 1}]
+    assert summary["slowest_comics"] == [
+        {"title": "Comic", "total": 1, "phases": {"post": 1}}
+    ]
+
+
+@pytest.mark.usefixtures("_fake_env", "fake_db", "report_daily_checks")
+def test_writes_metrics(tmp_path: Path) -> None:
+    path = tmp_path / "rss_to_webhook.prom"
+    result = runner.invoke(app, ["post-updates", "daily", "--metrics", str(path)])
+    assert result.exit_code == 0
+    assert "# TYPE rss_to_webhook_posts_total counter" in path.read_text(
+        encoding="utf-8"
+    )
+
+
+@pytest.mark.usefixtures("_fake_env", "fake_db", "report_daily_checks")
+def test_json_logs() -> None:
+    result = runner.invoke(app, ["post-updates", "daily", "--json-logs"])
+    assert result.exit_code == 0
+    lines = [json.loads(line) for line in result.stdout.splitlines()]
+    assert [line["message"] for line in lines[:2]] == [
+        "Running checks",
+        "Running daily checks",
+    ]
+    assert lines[-1]["message"].startswith("Wrote ")
+
+
+@pytest.mark.usefixtures("_fake_env")
+def test_runs_drain(
+    report_drain_outbox: dict[str, object], fake_db: mongomock.MongoClient[Comic]
+) -> None:
+    result = runner.invoke(app, ["post-updates", "drain"])
+    assert result.exit_code == 0
+    assert report_drain_outbox == {
+        "comics": fake_db[DB_NAME]["comics"],
+        "webhook_url": WEBHOOK_URL,
+        "thread_webhook_url": THREAD_WEBHOOK_URL,
+        "pack": False,
+    }
+
+
+@pytest.mark.usefixtures("_fake_env")
+def test_pack_option(
+    report_regular_checks: dict[str, object], fake_db: mongomock.MongoClient[Comic]
+) -> None:
+    result = runner.invoke(app, ["post-updates", "--pack"])
+    assert result.exit_code == 0
+    assert report_regular_checks == {
+        "hash_seed": HASH_SEED,
+        "comics": fake_db[DB_NAME]["comics"],
+        "thread_webhook_url": THREAD_WEBHOOK_URL,
+        "webhook_url": WEBHOOK_URL,
+        "timeout": DEFAULT_AIOHTTP_TIMEOUT,
+        "pack": True,
+    }
+
+
+def test_migrates_dailies(monkeypatch: pytest.MonkeyPatch) -> None:
+    client: mongomock.MongoClient[Comic] = mongomock.MongoClient()
+    monkeypatch.setattr("rss_to_webhook.storage.MongoClient", lambda _url: client)
+    monkeypatch.setattr(db_operations, "load_dotenv", lambda: None)
+    monkeypatch.delenv("SQLITE_PATH", raising=False)
+    comics = client[DB_NAME]["comics"]
+    comics.insert_one({"title": "Old", "dailies": [{"link": "https://example.com"}]})  # type: ignore [arg-type]
+    result = runner.invoke(app, ["migrate-dailies"])
+    assert result.exit_code == 0
+    assert "Moved the dailies of 1 comics in comics" in result.stdout
+    assert comics["pending_dailies"].count_documents({}) == 1
+
+
+def test_migrate_dailies_sqlite(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+) -> None:
+    monkeypatch.setattr(db_operations, "load_dotenv", lambda: None)
+    monkeypatch.setenv("SQLITE_PATH", str(tmp_path / "comics.db"))
+    result = runner.invoke(app, ["migrate-dailies"])
+    assert result.exit_code == 0
+    assert "nothing to do" in result.stdout
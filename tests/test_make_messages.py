@@ -201,3 +201,31 @@ def test_filter_missing_links(comic: Comic) -> None:
         ],
         "content": "<@&1>",
     })
+
+
+@pytest.mark.parametrize("num_entries", [1, 10, 100])
+@pytest.mark.parametrize(
+    "link_format",
+    ["https://example.com/comic/page-{i}/", "hps://example.com/comic/page-{i}/"],
+    ids=["good_scheme", "bad_scheme"],
+)
+@pytest.mark.parametrize("title_length", [20, 300], ids=["short", "long"])
+@pytest.mark.benchmark
+def test_performance(
+    comic: Comic, num_entries: int, link_format: str, title_length: int
+) -> None:
+    """Making the messages for an update, from one page to a whole archive."""
+    comic["username"] = "Test Webcomic Updates"
+    comic["avatar_url"] = "https://i.imgur.com/XYbqy7f.png"
+    entries: list[Entry] = [
+        {
+            "link": link_format.format(i=i),
+            "id": f"page-{i}",
+            "title": f"Page {i}: {'a' * title_length}",
+            "published": "Thu, 05 Oct 2023 01:40:51 -0400",
+        }
+        for i in range(num_entries)
+    ]
+    for _ in range(100):
+        messages = _make_messages(comic, entries)
+    assert len(messages) == math.ceil(num_entries / 10)
@@ -0,0 +1,77 @@
+from pathlib import Path
+
+import pytest
+
+from rss_to_webhook import metrics
+from rss_to_webhook.metrics import Counter, Histogram, Metric
+
+
+@pytest.fixture(autouse=True)
+def _reset_metrics() -> None:
+    metrics.reset()
+
+
+@pytest.fixture
+def registry() -> dict[str, Metric]:
+    """A registry for the tests' metrics, so they aren't rendered with the bot's."""
+    return {}
+
+
+def test_counter(registry: dict[str, Metric]) -> None:
+    counter = Counter("test_counter", "Testing.", {"status": ("2xx", "4xx")}, registry)
+    counter.inc(status="2xx")
+    counter.inc(2, status="2xx")
+    counter.inc(status="4xx")
+    assert counter.value(status="2xx") == 3  # noqa: PLR2004
+    assert list(counter.samples()) == [
+        'rss_to_webhook_test_counter_total{status="2xx"} 3',
+        'rss_to_webhook_test_counter_total{status="4xx"} 1',
+    ]
+
+
+def test_labels_bounded(registry: dict[str, Metric]) -> None:
+    """Labels can only have the values they were made with."""
+    counter = Counter("test_bounded", "Testing.", {"status": ("2xx",)}, registry)
+    with pytest.raises(ValueError, match="isn't one of the values"):
+        counter.inc(status="200")
+    with pytest.raises(ValueError, match="needs the labels"):
+        counter.inc(title="Comic")
+
+
+def test_histogram(registry: dict[str, Metric]) -> None:
+    histogram = Histogram("test_histogram", "Testing.", (1, 0.5), registry=registry)
+    for value in (0.25, 0.5, 0.75, 2):
+        histogram.observe(value)
+    assert histogram.count() == 4  # noqa: PLR2004
+    assert list(histogram.samples()) == [
+        'rss_to_webhook_test_histogram_bucket{le="0.5"} 2',
+        'rss_to_webhook_test_histogram_bucket{le="1"} 3',
+        'rss_to_webhook_test_histogram_bucket{le="+Inf"} 4',
+        "rss_to_webhook_test_histogram_sum 3.5",
+        "rss_to_webhook_test_histogram_count 4",
+    ]
+
+
+@pytest.mark.parametrize(
+    ("status", "expected"), [(200, "2xx"), (304, "3xx"), (429, "4xx"), (999, "other")]
+)
+def test_status_class(status: int, expected: str) -> None:
+    assert metrics.status_class(status) == expected
+
+
+def test_write_textfile(tmp_path: Path) -> None:
+    metrics.POSTS.inc(status="2xx")
+    path = tmp_path / "rss_to_webhook.prom"
+    metrics.write_textfile(path)
+    text = path.read_text(encoding="utf-8")
+    assert "# TYPE rss_to_webhook_posts_total counter\n" in text
+    assert 'rss_to_webhook_posts_total{status="2xx"} 1\n' in text
+    assert [file.name for file in tmp_path.iterdir()] == [path.name]
+
+
+def test_separate_registry(registry: dict[str, Metric]) -> None:
+    """Metrics made in another registry aren't rendered with the bot's."""
+    counter = Counter("test_separate", "Testing.", registry=registry)
+    assert registry == {counter.name: counter}
+    assert counter.name not in metrics.REGISTRY
+    assert counter.name not in metrics.render()
@@ -0,0 +1,156 @@
+from __future__ import annotations
+
+from operator import itemgetter
+from typing import TYPE_CHECKING
+
+import pytest
+from bson import ObjectId
+
+from rss_to_webhook.check_feeds_and_update import (
+    _make_messages,
+    _merge_messages,
+    _pack,
+    _within_limits,
+)
+from rss_to_webhook.constants import (
+    MAX_CONTENT_LENGTH,
+    MAX_EMBED_CHARACTERS,
+    MAX_EMBEDS_PER_MESSAGE,
+)
+from rss_to_webhook.db_types import Comic
+
+if TYPE_CHECKING:
+    from feedparser.util import Entry
+
+    from rss_to_webhook.discord_types import Message
+
+
+def make_comic(i: int) -> Comic:
+    return Comic(
+        _id=ObjectId(f"{i:0>24}"),
+        role_id=i,
+        dailies=[],
+        title=f"Test Webcomic {i}",
+        feed_url=f"https://example.com/{i}/rss",
+        feed_hash=b"\xa9\x0c\x16\xe5\xe2\x8c6\xdd\x01}K\x85\x1fn\x8e\xd2",
+        last_entries=[],
+        username="Tester",
+        avatar_url="https://i.imgur.com/XYbqy7f.png",
+    )
+
+
+def make_message(i: int, num_entries: int = 1) -> Message:
+    entries: list[Entry] = [
+        {"link": f"https://example.com/{i}/page/{j}", "title": f"Page {j}"}
+        for j in range(num_entries)
+    ]
+    return _make_messages(make_comic(i), entries)[0]
+
+
+def pack_messages(messages: list[Message]) -> list[Message]:
+    return [_merge_messages(group) for group in _pack(messages, lambda m: m)]
+
+
+def test_packs_comics_together() -> None:
+    """Single-entry updates for several comics are merged into one post."""
+    messages = [make_message(i) for i in range(3)]
+    [packed] = pack_messages(messages)
+    assert [embed["url"] for embed in packed["embeds"]] == [
+        "https://example.com/0/page/0",
+        "https://example.com/1/page/0",
+        "https://example.com/2/page/0",
+    ]
+    assert packed.get("content") == "<@&0> <@&1> <@&2>"
+
+
+def test_packs_up_to_max_embeds() -> None:
+    """Posts are filled up to Discord's embed limit, and order is kept."""
+    num_comics = 25
+    messages = [make_message(i) for i in range(num_comics)]
+    packed = pack_messages(messages)
+    assert [len(message["embeds"]) for message in packed] == [10, 10, 5]
+    urls = [embed["url"] for message in packed for embed in message["embeds"]]
+    assert urls == [f"https://example.com/{i}/page/0" for i in range(num_comics)]
+
+
+def test_does_not_split_messages() -> None:
+    """A message that doesn't fit in the current post starts a new one."""
+    messages = [make_message(0, 6), make_message(1, 6), make_message(2, 4)]
+    packed = pack_messages(messages)
+    assert [len(message["embeds"]) for message in packed] == [6, 10]
+
+
+def test_respects_embed_characters() -> None:
+    """Posts never go over Discord's combined embed character limit."""
+    messages = [make_message(i) for i in range(10)]
+    for message in messages:
+        message["embeds"][0]["title"] = "a" * 1000
+    packed = pack_messages(messages)
+    assert len(packed) > 1
+    for message in packed:
+        assert (
+            sum(
+                len(embed["title"]) + len(embed["description"])
+                for embed in message["embeds"]
+            )
+            <= MAX_EMBED_CHARACTERS
+        )
+
+
+def test_respects_content_length() -> None:
+    """Posts never go over Discord's content length limit."""
+    messages = [make_message(i) for i in range(10)]
+    for i, message in enumerate(messages):
+        message["content"] = str(i) * 700
+    packed = pack_messages(messages)
+    assert len(packed) > 1
+    assert all(
+        len(message.get("content", "")) <= MAX_CONTENT_LENGTH for message in packed
+    )
+
+
+def test_keeps_shared_extras() -> None:
+    """When every comic shares a username and avatar, they are kept."""
+    [packed] = pack_messages([make_message(0), make_message(1)])
+    assert packed.get("username") == "Tester"
+    assert packed.get("avatar_url") == "https://i.imgur.com/XYbqy7f.png"
+
+
+def test_drops_conflicting_extras() -> None:
+    """When comics have different usernames, the webhook's own is used."""
+    first, second = make_message(0), make_message(1)
+    second["username"] = "Someone Else"
+    [packed] = pack_messages([first, second])
+    assert "username" not in packed
+    assert packed.get("avatar_url") == "https://i.imgur.com/XYbqy7f.png"
+
+
+def test_packs_by_key() -> None:
+    """Only items with the same key are packed together."""
+    items = [(0, make_message(0)), (1, make_message(1)), (0, make_message(2))]
+    groups = list(_pack(items, itemgetter(1), itemgetter(0)))
+    assert [[key for key, _ in group] for group in groups] == [[0, 0], [1]]
+
+
+def test_main_posts_before_threads() -> None:
+    """A full thread group still waits for the main posts queued before it."""
+    half = MAX_EMBEDS_PER_MESSAGE // 2
+    items: list[tuple[int | None, Message]] = []
+    for i in range(3):
+        items.extend(((None, make_message(i)), (1, make_message(i, half))))
+    groups = list(_pack(items, itemgetter(1), itemgetter(0)))
+    assert [(group[0][0], len(group)) for group in groups] == [
+        (None, 3),
+        (1, 2),
+        (1, 1),
+    ]
+
+
+@pytest.mark.parametrize(
+    ("num_embeds", "expected"),
+    [(MAX_EMBEDS_PER_MESSAGE, True), (MAX_EMBEDS_PER_MESSAGE + 1, False)],
+)
+def test_within_limits(num_embeds: int, *, expected: bool) -> None:
+    message = make_message(0)
+    message["embeds"] *= num_embeds
+    assert _within_limits(message) == expected
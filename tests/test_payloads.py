@@ -0,0 +1,81 @@
+import json
+
+import pytest
+
+from rss_to_webhook import payloads
+from rss_to_webhook.discord_types import Message
+from rss_to_webhook.payloads import EncodedMessage
+
+
+@pytest.fixture
+def message() -> Message:
+    return {
+        "embeds": [
+            {
+                "color": 11240119,
+                "title": f"**Sleepless Domain - Chapter 22 - Page {i}**",
+                "url": f"https://www.sleeplessdomain.com/comic/chapter-22-page-{i}",
+                "description": "New Sleepless Domain!",
+            }
+            for i in range(10)
+        ],
+        "username": "KiwiFlea",
+        "avatar_url": "https://i.imgur.com/XYbqy7f.png",
+        "content": "<@&581531863127031868>",
+    }
+
+
+@pytest.fixture(params=[True, False], ids=["orjson", "json"])
+def _encoder(request: pytest.FixtureRequest, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(payloads, "HAS_ORJSON", request.param)
+
+
+@pytest.mark.usefixtures("_encoder")
+def test_round_trip(message: Message) -> None:
+    """The encoded message is the same JSON as the original message."""
+    encoded = EncodedMessage.encode(message)
+    assert json.loads(encoded.data) == message
+    assert encoded.decode() == message
+    assert json.loads(str(encoded)) == message
+
+
+@pytest.mark.usefixtures("_encoder")
+def test_without_content(message: Message) -> None:
+    """The thread variant is the same message, just without `content`."""
+    thread = EncodedMessage.encode(message).without_content()
+    del message["content"]
+    assert json.loads(thread.data) == message
+
+
+@pytest.mark.usefixtures("_encoder")
+def test_no_content(message: Message) -> None:
+    """Messages without `content` are encoded as-is."""
+    del message["content"]
+    encoded = EncodedMessage.encode(message)
+    assert encoded.content is None
+    assert json.loads(encoded.data) == message
+    assert encoded.without_content() == encoded
+
+
+@pytest.mark.usefixtures("_encoder")
+def test_escapes_content(message: Message) -> None:
+    """Content is escaped properly when it's spliced into the message."""
+    message["content"] = 'Quotes " and \\ backslashes and émoji 🌙'
+    encoded = EncodedMessage.encode(message)
+    assert json.loads(encoded.data) == message
+
+
+@pytest.mark.usefixtures("_encoder")
+def test_only_content() -> None:
+    """A message that is nothing but `content` is still valid JSON."""
+    message: Message = {"content": "<@&581531863127031868>"}  # type: ignore [typeddict-item]
+    assert json.loads(EncodedMessage.encode(message).data) == message
+
+
+@pytest.mark.benchmark
+def test_encode_performance(message: Message) -> None:
+    """Encoding a full message for logging, the channel, and a thread."""
+    for _ in range(1000):
+        encoded = EncodedMessage.encode(message)
+        str(encoded)
+        encoded.without_content().data  # noqa: B018
@@ -0,0 +1,41 @@
+import asyncio
+import pstats
+from pathlib import Path
+
+import pytest
+
+from rss_to_webhook.profiling import profile
+
+
+async def check_feed(seconds: float) -> None:
+    await asyncio.sleep(seconds)
+
+
+async def check_feeds() -> None:
+    await asyncio.gather(
+        asyncio.create_task(check_feed(0), name="Fast"),
+        asyncio.create_task(check_feed(0.05), name="Slow"),
+    )
+
+
+def test_profile(tmp_path: Path, capsys: pytest.CaptureFixture[str]) -> None:
+    """The stats are written, and the slowest functions and tasks are shown."""
+    policy = asyncio.get_event_loop_policy()
+    path = tmp_path / "run.prof"
+    with profile(path, top=5):
+        asyncio.run(check_feeds())
+    assert asyncio.get_event_loop_policy() is policy
+    functions = {function for _, _, function in pstats.Stats(str(path)).stats}  # type: ignore [attr-defined]
+    assert "check_feeds" in functions
+    out = capsys.readouterr().out
+    assert f"Wrote profile to {path}" in out
+    assert "check_feed: 2 tasks" in out
+    assert "(Slow)" in out
+
+
+def test_profile_on_error(tmp_path: Path) -> None:
+    """Runs that fail are still profiled."""
+    path = tmp_path / "run.prof"
+    with pytest.raises(ZeroDivisionError), profile(path):
+        _ = 1 / 0
+    assert path.exists()
@@ -1,3 +1,4 @@
+import io
 import json
 import os
 import time
@@ -5,11 +6,16 @@ from collections.abc import Generator
 
 import pytest
 from dotenv import load_dotenv
-from requests import HTTPError
+from requests import HTTPError, PreparedRequest, Response, Session
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
 from responses import RequestsMock
 
+from rss_to_webhook import metrics
 from rss_to_webhook.check_feeds_and_update import RateLimiter
+from rss_to_webhook.discord_emulator import DiscordEmulator, EmulatedWebhook
 from rss_to_webhook.discord_types import Message
+from rss_to_webhook.payloads import EncodedMessage
 
 load_dotenv(".env.example")
 WEBHOOK_URL = os.environ["WEBHOOK_URL"]
@@ -99,6 +105,19 @@ def test_pauses_repeatedly_at_hidden_rate_limit(
     )
 
 
+@pytest.mark.usefixtures("webhook")
+def test_no_pause_after_slow_window(
+    message: Message, measure_sleep: list[float]
+) -> None:
+    """Posts that took longer than the hidden window don't sleep at all."""
+    rate_limiter = RateLimiter()
+    rate_limiter.fuzzed_window = 0
+    # Past the end of the second window, which starts without a sleep
+    for _i in range(61):
+        rate_limiter.post(WEBHOOK_URL, message)
+    assert measure_sleep == []
+
+
 def test_only_pauses_when_rate_limited(
     message: Message, webhook: RequestsMock, measure_sleep: list[float]
 ) -> None:
@@ -228,6 +247,69 @@ def test_raises_exception_on_429(message: Message, webhook: RequestsMock) -> Non
         },
     )
     message["embeds"][0]["url"] = "https://urls don't have spaces.com"
+    rate_limited = metrics.RATE_LIMITED.value()
     with pytest.raises(HTTPError) as e:
         rate_limiter.post(SD_WEBHOOK_URL, message)
     assert "429" in str(e.value)
+    assert metrics.RATE_LIMITED.value() == rate_limited + 1
+
+
+@pytest.fixture
+def local_webhook() -> Generator[str, None, None]:
+    webhook = EmulatedWebhook(id=1, token="token", channel_id=2)  # noqa: S106
+    with DiscordEmulator([webhook]).serve_in_thread() as base_url:
+        yield f"{DiscordEmulator.webhook_url(base_url, webhook)}?wait=true"
+
+
+@pytest.mark.usefixtures("_no_sleep")
+def test_reuses_connections(message: Message, local_webhook: str) -> None:
+    """Posts after the first reuse the first post's connection."""
+    num_posts = 3
+    with RateLimiter() as rate_limiter:
+        for _ in range(num_posts):
+            response = rate_limiter.post(local_webhook, message)
+            assert response.json()["embeds"] == message["embeds"]
+        stats = rate_limiter.connection_stats()
+    assert stats.requests == num_posts
+    assert stats.connections == 1
+    assert stats.reused == num_posts - 1
+
+
+class StubAdapter(BaseAdapter):
+    """Answers every post like Discord does, without any network."""
+
+    def send(  # noqa: PLR6301
+        self, request: PreparedRequest, *_args: object, **_kwargs: object
+    ) -> Response:
+        response = Response()
+        response.status_code = 200
+        response.headers = CaseInsensitiveDict({
+            "x-ratelimit-limit": "5",
+            "x-ratelimit-remaining": "4",
+            "x-ratelimit-reset-after": "0.399",
+        })
+        response.raw = io.BytesIO(b"")
+        response.request = request
+        response.url = request.url or ""
+        return response
+
+    def close(self) -> None:
+        pass
+
+
+@pytest.mark.parametrize("encoded", [False, True], ids=["message", "encoded"])
+@pytest.mark.parametrize("num_webhooks", [1, 3])
+@pytest.mark.usefixtures("_no_sleep")
+@pytest.mark.benchmark
+def test_post_performance(
+    message: Message, *, encoded: bool, num_webhooks: int
+) -> None:
+    """The bookkeeping around each post, with the transport stubbed out."""
+    session = Session()
+    session.mount("https://", StubAdapter())
+    urls = [f"https://discord.com/api/webhooks/{i}/token" for i in range(num_webhooks)]
+    body = EncodedMessage.encode(message) if encoded else message
+    with RateLimiter(session) as rate_limiter:
+        for i in range(300):
+            rate_limiter.post(urls[i % num_webhooks], body)
+    assert len(rate_limiter.buckets) == num_webhooks
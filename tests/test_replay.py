@@ -0,0 +1,122 @@
+from collections.abc import Generator
+from pathlib import Path
+
+import pytest
+import requests
+from typer.testing import CliRunner
+
+from rss_to_webhook import replay as replay_module
+from rss_to_webhook.main import app
+from rss_to_webhook.replay import (
+    Corpus,
+    FeedServer,
+    record,
+    replay,
+    sample_corpus,
+)
+from rss_to_webhook.storage import SQLiteStorage
+
+runner = CliRunner()
+
+
+@pytest.fixture
+def corpus(tmp_path: Path) -> Corpus:
+    return sample_corpus(tmp_path / "sample")
+
+
+@pytest.fixture
+def server(corpus: Corpus) -> FeedServer:
+    return FeedServer(corpus, latency=0)
+
+
+@pytest.fixture
+def base_url(server: FeedServer) -> Generator[str, None, None]:
+    with server.serve_in_thread() as url:
+        yield url
+
+
+def test_serves_feeds(server: FeedServer, base_url: str) -> None:
+    """Each comic's URL serves the corpus's feeds in turn, with their caching."""
+    typical, atom, error = (server.source.feed(number) for number in (0, 8, 5))
+    response = requests.get(FeedServer.feed_url(base_url, 0), timeout=5)
+    assert response.content == typical.body
+    assert response.headers["ETag"] == typical.headers["ETag"]
+    cached = requests.get(
+        FeedServer.feed_url(base_url, 7),
+        headers={"If-None-Match": typical.headers["ETag"]},
+        timeout=5,
+    )
+    assert cached.status_code == 304  # noqa: PLR2004
+    # Feeds without caching headers are always served in full
+    assert requests.get(FeedServer.feed_url(base_url, 8), timeout=5).content == (
+        atom.body
+    )
+    failed = requests.get(FeedServer.feed_url(base_url, 5), timeout=5)
+    assert failed.status_code == error.status
+    assert server.requests == 4  # noqa: PLR2004
+
+
+def test_record(corpus: Corpus, base_url: str, tmp_path: Path) -> None:
+    """Recorded feeds are saved as they were served, and can be loaded again."""
+    urls = [FeedServer.feed_url(base_url, number) for number in range(7)]
+    recorded = record([*urls, "http://127.0.0.1:1/unreachable"], tmp_path / "rec")
+    loaded = Corpus.load(tmp_path / "rec")
+    assert loaded == recorded
+    assert [feed.url for feed in loaded.feeds] == urls
+    for original, copy in zip(corpus.feeds, loaded.feeds, strict=True):
+        assert (copy.status, copy.headers, copy.body) == (
+            original.status,
+            original.headers,
+            original.body,
+        )
+
+
+def test_record_command(
+    corpus: Corpus, base_url: str, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Every stored comic's feed is recorded, from either database."""
+    path = tmp_path / "comics.db"
+    with SQLiteStorage(path) as storage:
+        corpus.fill(storage, base_url, 3)
+    monkeypatch.setattr(replay_module, "load_dotenv", lambda: None)
+    monkeypatch.setenv("SQLITE_PATH", str(path))
+    result = runner.invoke(app, ["record-feeds", str(tmp_path / "rec")])
+    assert result.exit_code == 0, result.output
+    assert f"Recorded 3 of 3 feeds to {tmp_path / 'rec'}" in result.stdout
+    assert len(Corpus.load(tmp_path / "rec").feeds) == 3  # noqa: PLR2004
+
+
+def test_replay(corpus: Corpus) -> None:
+    """Comics with new entries post them, and the daily checks post them again."""
+    regular, daily = replay(corpus, [30], latency=0, new_fraction=1)
+    assert (regular.check_type, regular.comics) == ("regular", 30)
+    # Comics 5, 6, 12, 13, 19, 20, 26 and 27 have the failing feeds
+    assert regular.errors == 8  # noqa: PLR2004
+    # The other 22 each post to the main channel, and 0 and 10 to their threads
+    assert regular.posts == 24  # noqa: PLR2004
+    assert daily.check_type == "daily"
+    # The 22 new entries are packed into posts of up to 10 embeds each
+    assert daily.posts == 3  # noqa: PLR2004
+    assert daily.errors == 0
+    assert regular.seconds > 0
+    assert regular.comics_per_second == regular.comics / regular.seconds
+
+
+def test_replay_command(corpus: Corpus) -> None:
+    result = runner.invoke(
+        app,
+        [
+            "replay",
+            "--corpus",
+            str(corpus.directory),
+            "--comics",
+            "10",
+            "--latency",
+            "0",
+        ],
+    )
+    assert result.exit_code == 0, result.output
+    regular, daily = result.stdout.splitlines()
+    assert regular.startswith("regular checks of 10 comics: ")
+    assert "comics/s), peak memory " in regular
+    assert daily.startswith("daily checks of 10 comics: ")
@@ -0,0 +1,254 @@
+from __future__ import annotations
+
+import os
+from datetime import UTC, datetime, timedelta
+from typing import TYPE_CHECKING
+
+import mongomock
+import pytest
+from bson import ObjectId
+from dotenv import load_dotenv
+from typer.testing import CliRunner
+
+from rss_to_webhook import stats
+from rss_to_webhook.constants import COST_HALF_LIFE, Cost
+from rss_to_webhook.costs import Ledger, weight
+from rss_to_webhook.main import app
+from rss_to_webhook.stats import error_rates, run_trends, top_costs
+from rss_to_webhook.storage import (
+    MongoStorage,
+    SQLiteStorage,
+    _costs,
+    _feed_errors,
+    _record_error,
+)
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from pymongo.collection import Collection
+
+    from rss_to_webhook.db_types import Comic, FeedSummary, RunRecord
+
+load_dotenv(".env.example")
+runner = CliRunner()
+
+
+def summary(title: str) -> FeedSummary:
+    return {
+        "_id": ObjectId(),
+        "title": title,
+        "feed_url": f"https://example.com/{title}/rss",
+        "feed_hash": b"",
+    }
+
+
+def run(hours_ago: float, duration: float, ttfb: float, posts: int) -> RunRecord:
+    return {
+        "check_type": "regular",
+        "started_at": datetime.now(tz=UTC) - timedelta(hours=hours_ago),
+        "duration": duration,
+        "comics": 100,
+        "changed": posts,
+        "updated": posts,
+        "statuses": {"200": 100},
+        "downloaded_bytes": 1000,
+        "posts": posts,
+        "rate_limit_sleep": 0,
+        "errors": 0,
+        "phases": {"ttfb": ttfb, "parse": 1},
+    }
+
+
+@pytest.fixture
+def client() -> mongomock.MongoClient[Comic]:
+    return mongomock.MongoClient()
+
+
+@pytest.fixture
+def comics(client: mongomock.MongoClient[Comic]) -> Collection[Comic]:
+    return client.db.comics
+
+
+def test_error_rates(comics: Collection[Comic]) -> None:
+    """Comics are ranked by how many errors their feeds have had."""
+    broken, flaky, fine = summary("Broken"), summary("Flaky"), summary("Fine")
+    comics.insert_many([broken, flaky, fine])  # type: ignore [list-item]
+    for _ in range(14):
+        _record_error(comics, broken, "ClientResponseError: 404, message='Not Found'")
+    _record_error(comics, flaky, "TimeoutError: ")
+    _record_error(comics, flaky, "ServerDisconnectedError: Server disconnected")
+    rates = error_rates(comics, days=7)
+    assert [(rate.title, rate.errors) for rate in rates] == [
+        ("Broken", 14),
+        ("Flaky", 2),
+    ]
+    assert rates[0].per_day == 2  # noqa: PLR2004
+    assert rates[1].last_error == "ServerDisconnectedError: Server disconnected"
+    assert comics.find_one({"_id": broken["_id"]}, {"error_count": True}) == {
+        "_id": broken["_id"],
+        "error_count": 14,
+    }
+
+
+def test_error_rates_window(comics: Collection[Comic]) -> None:
+    """Errors from before the window are ignored."""
+    comic = summary("Fixed")
+    comics.insert_one(comic)  # type: ignore [arg-type]
+    _feed_errors(comics).insert_one({
+        "comic_id": comic["_id"],
+        "error": "TimeoutError: ",
+        "occurred_at": datetime.now(tz=UTC) - timedelta(days=8),
+    })
+    assert error_rates(comics, days=7) == []
+
+
+def test_error_rates_command(
+    monkeypatch: pytest.MonkeyPatch,
+    client: mongomock.MongoClient[Comic],
+) -> None:
+    monkeypatch.setattr("rss_to_webhook.storage.MongoClient", lambda _url: client)
+    monkeypatch.setattr(stats, "load_dotenv", lambda: None)
+    comics = client[os.environ["DB_NAME"]]["comics"]
+    comic = summary("Broken")
+    comics.insert_one(comic)  # type: ignore [arg-type]
+    _record_error(comics, comic, "TimeoutError: ")
+    result = runner.invoke(app, ["error-rates", "--days", "2"])
+    assert result.exit_code == 0
+    assert "Broken: 1 errors (0.50/day)" in result.stdout
+
+
+def test_run_trends(comics: Collection[Comic]) -> None:
+    """The latest runs are compared with the ones before them."""
+    storage = MongoStorage(comics)
+    for hours_ago in (5, 4, 3):
+        storage.record_run(run(hours_ago, duration=10, ttfb=5, posts=1))
+    for hours_ago in (2, 1):
+        storage.record_run(run(hours_ago, duration=15, ttfb=11, posts=10))
+    storage.record_run({**run(0, 0, 0, 0), "check_type": "daily"})
+    trends = run_trends(comics, runs=4)
+    assert (trends.recent_runs, trends.earlier_runs) == (2, 2)
+    by_metric = {trend.metric: trend for trend in trends.trends}
+    assert list(by_metric)[-2:] == ["phase ttfb", "phase parse"]
+    assert (by_metric["duration"].earlier, by_metric["duration"].recent) == (10, 15)
+    assert by_metric["duration"].change == 0.5  # noqa: PLR2004
+    # More posts is more work, not a regression
+    assert [trend.metric for trend in trends.regressions] == [
+        "duration",
+        "phase ttfb",
+    ]
+    assert run_trends(comics, runs=4, threshold=1).regressions == [
+        by_metric["phase ttfb"]
+    ]
+
+
+def test_run_trends_not_enough_runs(comics: Collection[Comic]) -> None:
+    MongoStorage(comics).record_run(run(1, duration=10, ttfb=5, posts=1))
+    assert run_trends(comics, runs=20).trends == []
+    assert run_trends(comics, runs=1).trends == []
+
+
+def test_run_trends_command(
+    monkeypatch: pytest.MonkeyPatch,
+    client: mongomock.MongoClient[Comic],
+) -> None:
+    monkeypatch.setattr("rss_to_webhook.storage.MongoClient", lambda _url: client)
+    monkeypatch.setattr(stats, "load_dotenv", lambda: None)
+    storage = MongoStorage(client[os.environ["DB_NAME"]]["comics"])
+    storage.record_run(run(2, duration=10, ttfb=5, posts=1))
+    storage.record_run(run(1, duration=20, ttfb=5, posts=1))
+    result = runner.invoke(app, ["run-trends", "--runs", "2"])
+    assert result.exit_code == 0
+    assert "duration: 10 -> 20 (+100%) REGRESSED" in result.stdout
+    assert "1 regressions: duration" in result.stdout
+
+
+def test_top_costs(comics: Collection[Comic]) -> None:
+    """Comics are ranked by the chosen cost, which halves every half-life."""
+    ledger = Ledger()
+    slow, big = summary("Slow"), summary("Big")
+    ledger.add(slow, seconds=10, bytes=100, changed=1)
+    ledger.add(big, seconds=1, bytes=1000, changed=1)
+    MongoStorage(comics).record_costs(list(ledger.comics.values()))
+    assert [row["title"] for row in top_costs(comics)] == ["Slow", "Big"]
+    (top,) = top_costs(comics, by=Cost.bytes, limit=1)
+    assert top["title"] == "Big"
+    assert top["bytes"] == pytest.approx(1000)
+    old = summary("Old")
+    then = datetime.now(tz=UTC) - timedelta(seconds=COST_HALF_LIFE)
+    _costs(comics).insert_one({
+        "_id": old["_id"],
+        "title": "Old",
+        "updated_at": then,
+        "bytes": 0,
+        "seconds": 100 * weight(then),
+        "parse_seconds": 0,
+        "not_modified": 0,
+        "hash_match": 0,
+        "changed": weight(then),
+        "error": 0,
+        "posts": 0,
+    })
+    top, *_ = top_costs(comics)
+    assert top["title"] == "Old"
+    assert top["seconds"] == pytest.approx(50)
+
+
+def test_top_costs_command(
+    monkeypatch: pytest.MonkeyPatch,
+    client: mongomock.MongoClient[Comic],
+) -> None:
+    monkeypatch.setattr("rss_to_webhook.storage.MongoClient", lambda _url: client)
+    monkeypatch.setattr(stats, "load_dotenv", lambda: None)
+    result = runner.invoke(app, ["top"])
+    assert result.exit_code == 0
+    assert "No costs recorded yet" in result.stdout
+    ledger = Ledger()
+    ledger.add(summary("Comic"), seconds=2, bytes=3_000_000, hash_match=3, error=1)
+    MongoStorage(client[os.environ["DB_NAME"]]["comics"]).record_costs(
+        list(ledger.comics.values())
+    )
+    result = runner.invoke(app, ["top", "--by", "bytes"])
+    assert result.exit_code == 0
+    assert "Comic: 2.0s, 0.00s parsing, 3.0MB, 0 posts." in result.stdout
+    assert "75% hash matches" in result.stdout
+
+
+def test_reports_from_sqlite(tmp_path: Path) -> None:
+    """The reports read comics stored in SQLite the same way."""
+    with SQLiteStorage(tmp_path / "comics.db") as storage:
+        comic = summary("Broken")
+        storage.insert_comic({**comic, "last_entries": []})  # type: ignore [typeddict-item]
+        storage.record_error(comic, "TimeoutError: ")
+        storage.record_error(comic, "HTTPError: 404")
+        (rate,) = error_rates(storage, days=2)
+        assert (rate.title, rate.errors, rate.last_error) == (
+            "Broken",
+            2,
+            "HTTPError: 404",
+        )
+        for hours_ago, duration in ((2, 10), (1, 20)):
+            storage.record_run(run(hours_ago, duration=duration, ttfb=5, posts=1))
+        trends = run_trends(storage, runs=2)
+        assert [trend.metric for trend in trends.regressions] == ["duration"]
+        ledger = Ledger()
+        ledger.add(summary("Slow"), seconds=10, bytes=100, changed=1)
+        ledger.add(summary("Big"), seconds=1, bytes=1000, changed=1)
+        storage.record_costs(list(ledger.comics.values()))
+        (top,) = top_costs(storage, by=Cost.bytes, limit=1)
+        assert top["title"] == "Big"
+        assert top["bytes"] == pytest.approx(1000)
+
+
+def test_commands_use_sqlite(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+    monkeypatch.setattr(stats, "load_dotenv", lambda: None)
+    monkeypatch.setenv("SQLITE_PATH", str(tmp_path / "comics.db"))
+    result = runner.invoke(app, ["error-rates"])
+    assert result.exit_code == 0, result.output
+    assert "No errors in the last 7 days" in result.stdout
+    result = runner.invoke(app, ["run-trends"])
+    assert result.exit_code == 0, result.output
+    assert "Not enough regular runs to compare" in result.stdout
+    result = runner.invoke(app, ["top"])
+    assert result.exit_code == 0, result.output
+    assert "No costs recorded yet" in result.stdout
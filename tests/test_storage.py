@@ -0,0 +1,347 @@
+from __future__ import annotations
+
+from datetime import UTC, datetime
+from typing import TYPE_CHECKING, Any
+
+import bson
+import pytest
+from bson import Int64, ObjectId
+from mongomock import MongoClient
+
+from rss_to_webhook.constants import MAX_CACHED_ENTRIES
+from rss_to_webhook.costs import Ledger
+from rss_to_webhook.storage import (
+    MongoStorage,
+    SQLiteStorage,
+    Storage,
+    _costs,
+    _runs,
+)
+
+if TYPE_CHECKING:
+    from collections.abc import Generator, Mapping
+    from pathlib import Path
+
+    from rss_to_webhook.db_types import (
+        Comic,
+        EntrySubset,
+        FeedSummary,
+        OutboxMessage,
+        PendingDaily,
+        RunRecord,
+    )
+
+
+@pytest.fixture(params=["mongo", "sqlite"])
+def storage(request: pytest.FixtureRequest, tmp_path: Path) -> Generator[Storage]:
+    if request.param == "mongo":
+        client: MongoClient[Comic] = MongoClient()
+        yield MongoStorage(client.db.comics)
+    else:
+        with SQLiteStorage(tmp_path / "comics.db") as sqlite:
+            yield sqlite
+
+
+def load_summaries(storage: Storage) -> list[FeedSummary]:
+    return [summary for batch in storage.load_summaries() for summary in batch]
+
+
+def make_comic(title: str, **fields: Any) -> Comic:  # noqa: ANN401
+    comic: dict[str, Any] = {
+        "_id": ObjectId(),
+        "title": title,
+        "feed_url": f"https://example.com/{title}/rss",
+        "feed_hash": title.encode(),
+        "last_entries": [{"link": f"https://example.com/{title}/1"}],
+        "role_id": Int64("581531863127031868"),
+        "color": 0xFFFFFF,
+    }
+    comic.update(fields)
+    return comic  # type: ignore [return-value]
+
+
+def make_post(comic: Comic, seq: int) -> OutboxMessage:
+    return {
+        "_id": f"{comic['_id']}-{seq}",
+        "comic_id": comic["_id"],
+        "title": comic["title"],
+        "thread_id": None,
+        "payload": b'{"content":"a"}',
+        "queued_at": datetime(2024, 1, 1, tzinfo=UTC),
+        "seq": seq,
+        "status": "pending",
+        "attempts": 0,
+    }
+
+
+def make_daily(comic: Comic, seq: int) -> PendingDaily:
+    return {
+        "_id": f"{comic['_id']}-daily-{seq}",
+        "comic_id": comic["_id"],
+        "entry": {"link": f"https://example.com/{comic['title']}/{seq}"},
+        "queued_at": datetime(2024, 1, 1, tzinfo=UTC),
+        "seq": seq,
+    }
+
+
+def test_loads_comics_in_parts(storage: Storage) -> None:
+    """Summaries are in title order, and details only have the fields they need."""
+    second = make_comic("B", etag="abc", thread_id=1234)
+    first = make_comic("A", username="Tester")
+    for comic in (second, first):
+        storage.insert_comic(comic)
+    assert load_summaries(storage) == [
+        {
+            "_id": comic["_id"],
+            "title": comic["title"],
+            "feed_url": comic["feed_url"],
+            "feed_hash": comic["feed_hash"],
+            **({"etag": "abc"} if comic is second else {}),
+        }
+        for comic in (first, second)
+    ]
+    (detail,) = storage.load_details([second["_id"]])
+    assert detail == {
+        "_id": second["_id"],
+        "last_entries": second["last_entries"],
+        "role_id": second["role_id"],
+        "color": second["color"],
+        "thread_id": 1234,
+    }
+    assert isinstance(detail["role_id"], Int64)
+    assert [
+        comic["title"]
+        for comic in storage.load_daily_comics([
+            second["_id"],
+            first["_id"],
+        ])
+    ] == ["A", "B"]
+
+
+def test_loads_summaries_in_batches(storage: Storage) -> None:
+    for title in "CEADB":
+        storage.insert_comic(make_comic(title))
+    assert [
+        [summary["title"] for summary in batch]
+        for batch in storage.load_summaries(batch_size=2)
+    ] == [["A", "B"], ["C", "D"], ["E"]]
+
+
+def test_loads_entry_keys() -> None:
+    """Only the fields that new entries are compared against are loaded."""
+    client: MongoClient[Comic] = MongoClient()
+    storage = MongoStorage(client.db.comics)
+    entry: EntrySubset = {
+        "link": "https://example.com/A/1",
+        "id": "1",
+        "published": "Tue, 26 Sep 2023 01:39:48 -0400",
+        "title": "A - Page 1",
+    }
+    comic = make_comic("A", last_entries=[entry])
+    storage.insert_comic(comic)
+    (detail,) = storage.load_details([comic["_id"]])
+    assert detail["last_entries"] == [
+        {key: value for key, value in entry.items() if key != "title"}
+    ]
+
+
+def test_saves_state(storage: Storage) -> None:
+    """Saving caps the cached entries, and queues posts and dailies only once."""
+    comic = make_comic("A")
+    storage.insert_comic(comic)
+    entries: list[EntrySubset] = [
+        {"link": f"https://example.com/A/{i}"} for i in range(2, MAX_CACHED_ENTRIES + 2)
+    ]
+    for _ in range(2):
+        with storage.writer(batch_size=1) as writer:
+            writer.save(
+                comic["_id"],
+                {"feed_hash": b"new", "etag": "def"},
+                entries,
+                [make_post(comic, 0)],
+                [make_daily(comic, 0)],
+            )
+    (summary,) = load_summaries(storage)
+    assert summary["feed_hash"] == b"new"
+    assert summary.get("etag") == "def"
+    (detail,) = storage.load_details([comic["_id"]])
+    assert detail["last_entries"] == entries
+    assert len(list(storage.pending_posts())) == 1
+    assert [daily["_id"] for daily in storage.pending_dailies()] == [
+        make_daily(comic, 0)["_id"]
+    ]
+
+
+def test_outbox(storage: Storage) -> None:
+    """Posts come out oldest first, and drop out once posted or failed."""
+    comic = make_comic("A")
+    with storage.writer() as writer:
+        writer.save(
+            comic["_id"],
+            {"feed_hash": b""},
+            [],
+            [make_post(comic, seq) for seq in (2, 0, 1)],
+            [],
+        )
+    pending = list(storage.pending_posts())
+    assert [post["seq"] for post in pending] == [0, 1, 2]
+    # MongoDB gives back naive datetimes, so times are compared separately
+    first: dict[str, Any] = dict(pending[0])
+    assert first.pop("queued_at").replace(tzinfo=UTC) == datetime(
+        2024, 1, 1, tzinfo=UTC
+    )
+    assert first == {
+        key: value for key, value in make_post(comic, 0).items() if key != "queued_at"
+    }
+    storage.mark_posted([pending[0]["_id"]])
+    storage.mark_failed(pending[1]["_id"], 5, "failed", "HTTPError: 400")
+    storage.mark_failed(pending[2]["_id"], 1, "pending", "HTTPError: 500")
+    (left,) = storage.pending_posts()
+    assert left["_id"] == pending[2]["_id"]
+    assert left["attempts"] == 1
+    assert left.get("last_error") == "HTTPError: 500"
+
+
+def test_clears_dailies(storage: Storage) -> None:
+    comic = make_comic("A")
+    dailies = [make_daily(comic, seq) for seq in range(3)]
+    with storage.writer() as writer:
+        writer.save(comic["_id"], {"feed_hash": b""}, [], [], dailies)
+    assert [daily["seq"] for daily in storage.pending_dailies()] == [0, 1, 2]
+    with storage.writer() as writer:
+        writer.clear_dailies([daily["_id"] for daily in dailies[:2]])
+    assert [daily["seq"] for daily in storage.pending_dailies()] == [2]
+
+
+def test_records_errors(storage: Storage) -> None:
+    comic = make_comic("A")
+    storage.insert_comic(comic)
+    (summary,) = load_summaries(storage)
+    storage.record_error(summary, "TimeoutError: ")
+    storage.record_error(summary, "HTTPError: 404")
+    if isinstance(storage, MongoStorage):
+        saved = storage.comics.find_one({"_id": comic["_id"]})
+    else:
+        assert isinstance(storage, SQLiteStorage)
+        connection = storage._connection()  # noqa: SLF001
+        saved = connection.execute("SELECT * FROM comics").fetchone()
+    assert saved
+    assert saved["error_count"] == 2  # noqa: PLR2004
+    assert saved["last_error"] == "HTTPError: 404"
+
+
+def test_records_runs(storage: Storage) -> None:
+    """Runs are stored, and old runs expire."""
+    old: RunRecord = {
+        "check_type": "daily",
+        "started_at": datetime(2024, 1, 1, tzinfo=UTC),
+        "duration": 1,
+        "comics": 0,
+        "updated": 0,
+        "posts": 0,
+        "rate_limit_sleep": 0,
+        "errors": 0,
+        "phases": {},
+    }
+    storage.record_run(old)
+    run: RunRecord = {
+        "check_type": "regular",
+        # MongoDB only keeps milliseconds
+        "started_at": datetime.now(tz=UTC).replace(microsecond=0),
+        "duration": 12.5,
+        "comics": 3,
+        "changed": 1,
+        "updated": 1,
+        "statuses": {"200": 2, "304": 1},
+        "downloaded_bytes": 1024,
+        "posts": 1,
+        "rate_limit_sleep": 0,
+        "errors": 0,
+        "phases": {"ttfb": 1.5},
+    }
+    storage.record_run(run)
+    saved: Mapping[str, Any]
+    if isinstance(storage, MongoStorage):
+        (saved,) = _runs(storage.comics).find({}, {"_id": False})
+    else:
+        assert isinstance(storage, SQLiteStorage)
+        connection = storage._connection()  # noqa: SLF001
+        (row,) = connection.execute("SELECT * FROM 'comics.runs'").fetchall()
+        assert row["check_type"] == "regular"
+        saved = bson.decode(row["run"])
+    assert saved
+    assert saved["started_at"].replace(tzinfo=UTC) == run["started_at"]
+    assert {key: value for key, value in saved.items() if key != "started_at"} == {
+        key: value for key, value in run.items() if key not in {"_id", "started_at"}
+    }
+
+
+def test_updates_by_title(storage: Storage) -> None:
+    comic = make_comic("A")
+    assert storage.update_comic({"title": "A", "feed_url": "", "role_id": 1}) is None
+    assert storage.insert_comic(comic) == comic["_id"]
+    unchanged = storage.update_comic({
+        "title": "A",
+        "feed_url": comic["feed_url"],
+        "role_id": comic["role_id"],  # type: ignore [typeddict-item]
+    })
+    assert unchanged is False
+    changed = storage.update_comic({
+        "title": "A",
+        "feed_url": "https://example.com/new/rss",
+        "role_id": 1,
+    })
+    assert changed is True
+    (summary,) = load_summaries(storage)
+    assert summary["feed_url"] == "https://example.com/new/rss"
+    (detail,) = storage.load_details([comic["_id"]])
+    assert detail["role_id"] == 1
+    assert detail["last_entries"] == comic["last_entries"]
+
+
+def test_sqlite_uses_wal(tmp_path: Path) -> None:
+    with SQLiteStorage(tmp_path / "comics.db") as storage:
+        connection = storage._connection()  # noqa: SLF001
+        assert connection.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+
+def test_sqlite_names_tables(tmp_path: Path) -> None:
+    """Each name gets its own tables, like MongoDB collections."""
+    path = tmp_path / "comics.db"
+    with SQLiteStorage(path) as comics, SQLiteStorage(path, "test-comics") as test:
+        comics.insert_comic(make_comic("A"))
+        assert load_summaries(test) == []
+    with pytest.raises(ValueError, match="quotes"):
+        SQLiteStorage(path, 'bad"name')
+
+
+def test_records_costs(storage: Storage) -> None:
+    """Each run's costs are added to each comic's totals, scaled up by then."""
+    comic = make_comic("Comic")
+    ledger = Ledger()
+    ledger.add(comic, seconds=1.5, bytes=100, changed=1)
+    storage.record_costs(list(ledger.comics.values()))
+    ledger.add(comic, posts=2)
+    storage.record_costs(list(ledger.comics.values()))
+    saved: Mapping[str, Any]
+    if isinstance(storage, MongoStorage):
+        (saved,) = _costs(storage.comics).find()
+    else:
+        assert isinstance(storage, SQLiteStorage)
+        connection = storage._connection()  # noqa: SLF001
+        (saved,) = connection.execute("SELECT * FROM 'comics.costs'").fetchall()
+    assert saved["title"] == "Comic"
+    # Scaled by about 2 for every half-life since the epoch
+    scale = saved["posts"] / 2
+    assert scale > 1
+    assert saved["seconds"] == pytest.approx(3 * scale, rel=1e-6)
+    assert saved["bytes"] == pytest.approx(200 * scale, rel=1e-6)
+    assert saved["error"] == 0
+
+
+def test_sqlite_only_sorts_by_costs(tmp_path: Path) -> None:
+    with (
+        SQLiteStorage(tmp_path / "comics.db") as storage,
+        pytest.raises(ValueError, match="Not a cost"),
+    ):
+        storage.costliest("title; DROP TABLE comics", 1)
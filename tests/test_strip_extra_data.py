@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+import feedparser
+import pytest
+
+from rss_to_webhook.check_feeds_and_update import strip_extra_data
+
+if TYPE_CHECKING:
+    from feedparser.util import Entry
+
+
+ITEM = """<item>
+    <title>Page {i}</title>
+    <link>https://example.com/comic/page-{i}/</link>
+    <guid isPermaLink="false">https://example.com/?p={i}</guid>
+    <pubDate>Thu, 05 Oct 2023 01:40:51 -0400</pubDate>
+    <dc:creator>The Author</dc:creator>
+    <category>Comic</category>
+    <category>Chapter 3</category>
+    <comments>https://example.com/comic/page-{i}/#respond</comments>
+    <description>{description}</description>
+</item>"""
+
+
+def make_entries(num_entries: int) -> list[Entry]:
+    """Parses a feed with everything a typical comic's feed has in each item."""
+    description = "A long description of the page. " * 30
+    items = "".join(
+        ITEM.format(i=i, description=description) for i in range(num_entries, 0, -1)
+    )
+    feed = feedparser.parse(
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<rss version="2.0" xmlns:dc="http://purl.org/dc/elements/1.1/">'
+        "<channel><title>Test Webcomic</title><link>https://example.com/</link>"
+        f"<description>A comic</description>{items}</channel></rss>"
+    )
+    return feed["entries"]  # type: ignore [no-any-return]
+
+
+def test_keeps_only_stored_fields() -> None:
+    """Only the fields that are stored for each entry are kept."""
+    assert strip_extra_data(make_entries(1)) == [{
+        "title": "Page 1",
+        "link": "https://example.com/comic/page-1/",
+        "id": "https://example.com/?p=1",
+        "published": "Thu, 05 Oct 2023 01:40:51 -0400",
+    }]
+
+
+@pytest.fixture(params=[10, 100, 500])
+def entries(request: pytest.FixtureRequest) -> list[Entry]:
+    """Entries parsed outside the benchmark, since parsing would swamp it."""
+    return make_entries(request.param)
+
+
+@pytest.mark.benchmark
+def test_performance(entries: list[Entry]) -> None:
+    """Stripping a parsed feed, from a short feed to a whole archive."""
+    for _ in range(100):
+        stripped = strip_extra_data(entries)
+    assert len(stripped) == len(entries)
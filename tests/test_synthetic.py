@@ -0,0 +1,128 @@
+from collections.abc import Generator
+from http import HTTPStatus
+from pathlib import Path
+
+import feedparser
+import pytest
+from typer.testing import CliRunner
+
+from rss_to_webhook.check_feeds_and_update import (
+    RateLimiter,
+    regular_checks,
+    strip_extra_data,
+)
+from rss_to_webhook.constants import HASH_SEED
+from rss_to_webhook.discord_emulator import DiscordEmulator, EmulatedWebhook
+from rss_to_webhook.main import app
+from rss_to_webhook.replay import FeedServer, replay
+from rss_to_webhook.storage import SQLiteStorage
+from rss_to_webhook.synthetic import (
+    ETAG_FRACTION,
+    THREAD_ID,
+    SyntheticCollection,
+)
+
+runner = CliRunner()
+
+
+@pytest.fixture
+def collection() -> SyntheticCollection:
+    return SyntheticCollection(seed=1)
+
+
+def test_deterministic(collection: SyntheticCollection) -> None:
+    """The same seed always makes the same comics, and other seeds don't."""
+    assert collection.comic(5) == SyntheticCollection(seed=1).comic(5)
+    assert collection.feed(5) == SyntheticCollection(seed=1).feed(5)
+    assert collection.comic(5) != SyntheticCollection(seed=2).comic(5)
+
+
+def test_entries_match_feeds(collection: SyntheticCollection) -> None:
+    """Each style of feed is read as the entries the comic says it has."""
+    styles: set[str] = set()
+    for number in range(100):
+        comic = collection.comic(number)
+        entries = strip_extra_data(feedparser.parse(comic.body())["entries"])
+        oldest = max(comic.pages - comic.feed_size, 0)
+        assert entries == [comic.entry(page) for page in range(comic.pages, oldest, -1)]
+        styles.add(comic.style)
+    assert styles == {"full", "atom", "id", "link"}
+
+
+def test_distributions(collection: SyntheticCollection) -> None:
+    """The collection is roughly as varied as it's meant to be."""
+    comics = [collection.comic(number) for number in range(2000)]
+    with_etags = sum(comic.etag is not None for comic in comics) / len(comics)
+    assert abs(with_etags - ETAG_FRACTION) < 0.05  # noqa: PLR2004
+    failing = sum(comic.status != HTTPStatus.OK for comic in comics)
+    assert 0 < failing < 200  # noqa: PLR2004
+    assert len({comic.host for comic in comics}) > 100  # noqa: PLR2004
+    assert any(comic.host == "www.webtoons.example" for comic in comics)
+    assert all(comic.cached <= comic.pages for comic in comics)
+
+
+def test_replay_synthetic(collection: SyntheticCollection) -> None:
+    """Up-to-date comics post nothing, and only the failing feeds are errors."""
+    regular, daily = replay(collection, [40], latency=0, new_fraction=0)
+    failing = sum(
+        collection.comic(number).status != HTTPStatus.OK for number in range(40)
+    )
+    assert regular.posts == 0
+    assert regular.errors == failing
+    assert daily.errors == 0
+
+
+@pytest.fixture
+def emulator() -> DiscordEmulator:
+    webhooks = [
+        EmulatedWebhook(id=1000 + i, token=f"token-{i}", channel_id=2000 + i)
+        for i in range(2)
+    ]
+    emulator = DiscordEmulator(webhooks, threads={2001: {THREAD_ID}})
+    emulator.bucket_window = emulator.hidden_window = 0.01
+    return emulator
+
+
+@pytest.fixture
+def storage(
+    collection: SyntheticCollection, tmp_path: Path
+) -> Generator[SQLiteStorage, None, None]:
+    with (
+        FeedServer(collection, latency=0).serve_in_thread() as feeds_url,
+        SQLiteStorage(tmp_path / "comics.db") as storage,
+    ):
+        collection.fill(storage, feeds_url, 300, new_fraction=0.05)
+        yield storage
+
+
+@pytest.mark.benchmark
+def test_regular_checks_performance(
+    storage: SQLiteStorage, emulator: DiscordEmulator
+) -> None:
+    """The regular checks get through a few hundred realistic comics quickly."""
+    with emulator.serve_in_thread() as discord_url:
+        webhook_url, thread_webhook_url = (
+            DiscordEmulator.webhook_url(discord_url, webhook)
+            for webhook in emulator.webhooks
+        )
+        rate_limiter = RateLimiter()
+        rate_limiter.fuzzed_window = 0.01
+        with rate_limiter:
+            regular_checks(
+                storage,
+                HASH_SEED,
+                webhook_url,
+                thread_webhook_url,
+                rate_limiter=rate_limiter,
+            )
+    assert emulator.messages
+
+
+def test_generate_command(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    path = tmp_path / "comics.db"
+    monkeypatch.setenv("SQLITE_PATH", str(path))
+    result = runner.invoke(app, ["generate-comics", "20", "--seed", "1"])
+    assert result.exit_code == 0, result.output
+    assert "Added 20 comics to test-comics" in result.stdout
+    with SQLiteStorage(path, "test-comics") as storage:
+        assert sum(map(len, storage.load_summaries())) == 20  # noqa: PLR2004
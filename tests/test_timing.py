@@ -0,0 +1,105 @@
+import asyncio
+import time
+
+import aiohttp
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from rss_to_webhook.timing import NO_TIMINGS, Timings
+
+
+def test_summary() -> None:
+    """Phases and comics are ranked by the total time spent on them."""
+    timings = Timings()
+    timings.record("ttfb", 1, "Slow")
+    timings.record("parse", 0.5, "Slow")
+    timings.record("ttfb", 0.25, "Fast")
+    timings.record("parse", 0.25, "Fast")
+    timings.record("parse", 0.25, "Fast")
+    timings.record("write", 0.75)
+    summary = timings.summary(slowest=1)
+    assert summary["phases"] == [
+        {"phase": "ttfb", "count": 2, "total": 1.25, "max": 1},
+        {"phase": "parse", "count": 3, "total": 1, "max": 0.5},
+        {"phase": "write", "count": 1, "total": 0.75, "max": 0.75},
+    ]
+    assert summary["slowest_comics"] == [
+        {"title": "Slow", "total": 1.5, "phases": {"ttfb": 1, "parse": 0.5}}
+    ]
+    assert summary["duration"] >= 0
+
+
+def test_span() -> None:
+    timings = Timings()
+    with timings.span("parse", "Comic"):
+        pass
+    (span,) = timings.spans
+    assert (span.phase, span.title) == ("parse", "Comic")
+    assert span.seconds >= 0
+
+
+def test_no_timings() -> None:
+    """Nothing is recorded when timing is off."""
+    with NO_TIMINGS.span("parse", "Comic"):
+        pass
+    NO_TIMINGS.record("parse", 1, "Comic")
+    assert not NO_TIMINGS.enabled
+    assert NO_TIMINGS.spans == []
+    assert NO_TIMINGS.summary()["phases"] == []
+
+
+def test_trace_config() -> None:
+    """Connections made by a session are timed under the title they're for."""
+    timings = Timings()
+
+    async def feed(_request: web.Request) -> web.Response:  # noqa: RUF029
+        return web.Response(text="<rss></rss>")
+
+    async def main() -> None:
+        app = web.Application()
+        app.router.add_get("/rss", feed)
+        async with (
+            TestServer(app, host="localhost") as server,
+            aiohttp.ClientSession(trace_configs=[timings.trace_config()]) as session,
+            session.get(
+                server.make_url("/rss"), trace_request_ctx={"title": "Comic"}
+            ) as response,
+        ):
+            await response.text()
+
+    asyncio.run(main())
+    phases = {(span.phase, span.title) for span in timings.spans}
+    assert phases == {("dns", "Comic"), ("connect", "Comic")}
+
+
+def test_watch_loop() -> None:
+    """Stalls are blamed on the blocking span that caused them, if there is one."""
+    timings = Timings(lag_threshold=0.05)
+
+    async def main() -> None:
+        watchdog = asyncio.create_task(timings.watch_loop(interval=0.01))
+        await asyncio.sleep(0.02)
+        with timings.blocking("parse", "Comic"):
+            time.sleep(0.2)  # noqa: ASYNC251 # Holding up the loop is the point
+        await asyncio.sleep(0.02)
+        time.sleep(0.2)  # noqa: ASYNC251 # Holding up the loop is the point
+        await asyncio.sleep(0.02)
+        watchdog.cancel()
+
+    asyncio.run(main())
+    parse, untimed = timings.stalls
+    assert (parse["phase"], parse["title"]) == ("parse", "Comic")
+    assert parse["seconds"] > 0.1  # noqa: PLR2004
+    assert (untimed["phase"], untimed["title"]) == (None, None)
+    loop_lag = timings.summary()["loop_lag"]
+    assert loop_lag["samples"] == len(timings.lags)
+    assert loop_lag["max"] == max(stall["seconds"] for stall in timings.stalls)
+
+
+def test_loop_not_watched() -> None:
+    timings = Timings()
+    asyncio.run(timings.watch_loop())
+    with timings.blocking("parse", "Comic"):
+        pass
+    assert timings.blockers == []
+    assert "loop_lag" not in timings.summary()
@@ -1,8 +1,22 @@
 import doctest
 
+import pytest
+
 from rss_to_webhook import utils
+from rss_to_webhook.constants import MAX_EMBEDS_PER_MESSAGE, WRITE_BATCH_SIZE
 
 
 def test_docstring() -> None:
     doctest_results = doctest.testmod(utils)
     assert doctest_results.failed == 0
+
+
+@pytest.mark.parametrize("size", [100, 10_000])
+@pytest.mark.parametrize("n", [MAX_EMBEDS_PER_MESSAGE, WRITE_BATCH_SIZE])
+@pytest.mark.benchmark
+def test_batched_performance(size: int, n: int) -> None:
+    """Batching embeds into messages and writes into bulk writes."""
+    items = [{"link": f"https://example.com/page/{i}"} for i in range(size)]
+    for _ in range(100):
+        batches = list(utils.batched(items, n))
+    assert sum(map(len, batches)) == size